@@ -1,2 +1,11 @@
-import aws.vpc as vpc
-import aws.ec2 as ec2
\ No newline at end of file
+import importlib
+
+_SUBMODULES = ("vpc", "ec2")
+
+
+def __getattr__(name: str):
+    # submodules are imported on first access(ex. `aws.ec2`), so that importing a light module such as `aws.executor`
+    # does not import botocore along with `aws.ec2`
+    if name in _SUBMODULES:
+        return importlib.import_module(f"aws.{name}")
+    raise AttributeError(f"module 'aws' has no attribute '{name}'")
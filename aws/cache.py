@@ -0,0 +1,110 @@
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+ResourceId = Union[str, List[str]]  # ID of a resource, or IDs of resources looked up together(ex. nodes of a fleet)
+_caches = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+class ResourceNotFoundError(ValueError):
+    """
+    Raised when describe call finds no resource with given name, so that callers can tell it apart from ambiguous names
+    """
+
+
+class ResourceIdCache:
+    """
+    Resource IDs resolved by tag filtered describe calls, kept for the lifetime of an EC2 client. Keys are tuples that
+    start with name of the VPC where resource is defined(ex. ('elkvpc', 'subnet', 'pub-a')), so that every ID within
+    a VPC can be invalidated at once.
+    """
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, ...], ResourceId] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.api_calls = 0
+
+    def fetch(self, key: Tuple[str, ...], describe: Callable[[], ResourceId]) -> ResourceId:
+        """
+        Return cached ID, or resolve it by describe call and cache it if not cached yet
+        :param key: tuple of VPC name, resource type and optional resource name
+        :param describe: function that resolves the ID by calling EC2 API
+        :return: resource ID
+        """
+        with self._lock:
+            if key in self._ids:
+                self.hits += 1
+                return self._ids[key]
+            self.api_calls += 1
+        resource_id = describe()
+        with self._lock:
+            self._ids[key] = resource_id
+        return resource_id
+
+    def get(self, key: Tuple[str, ...]) -> Optional[ResourceId]:
+        """
+        Return cached ID without resolving it, so that caller can validate the ID by itself
+        :param key: tuple of VPC name, resource type and optional resource name
+        :return: cached ID, or None if not cached
+        """
+        with self._lock:
+            if key in self._ids:
+                self.hits += 1
+            return self._ids.get(key)
+
+    def store(self, key: Tuple[str, ...], resource_id: ResourceId):
+        """
+        Cache ID resolved in advance(ex. by `aws.inventory.load_inventory`)
+        :param key: tuple of VPC name, resource type and optional resource name
+        :param resource_id: resource ID
+        :return: None
+        """
+        with self._lock:
+            self._ids[key] = resource_id
+
+    def invalidate(self, *key_prefix: str):
+        """
+        Remove every cached ID whose key starts with key_prefix
+        :param key_prefix: leading elements of keys to remove(ex. ('elkvpc',) to remove every ID within VPC 'elkvpc')
+        :return: None
+        """
+        with self._lock:
+            for key in [key for key in self._ids if key[:len(key_prefix)] == key_prefix]:
+                del self._ids[key]
+
+    def entries(self) -> Dict[Tuple[str, ...], ResourceId]:
+        """
+        :return: copy of every cached ID keyed by cache key
+        """
+        with self._lock:
+            return dict(self._ids)
+
+    def reset_counters(self):
+        """
+        Reset numbers of cache hits and describe calls, keeping every cached ID
+        :return: None
+        """
+        with self._lock:
+            self.hits = 0
+            self.api_calls = 0
+
+    def summary(self) -> str:
+        """
+        Summarize how many lookups were served from cache and how many of them needed describe call
+        :return: summary message
+        """
+        return f"{self.hits} cache hits, {self.api_calls} describe calls"
+
+
+def get_cache(ec2_client) -> ResourceIdCache:
+    """
+    Get resource ID cache of the client. Cache is created on first use and discarded along with the client.
+    :param ec2_client: EC2 client created by boto3 session
+    :return: ResourceIdCache dedicated to the client
+    """
+    with _caches_lock:
+        if ec2_client not in _caches:
+            _caches[ec2_client] = ResourceIdCache()
+        return _caches[ec2_client]
@@ -1,6 +1,11 @@
 import pathlib
-import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from botocore.exceptions import ClientError
+from aws.cache import ResourceNotFoundError, get_cache
+from aws.inventory import ALIVE_INSTANCE_STATES
 from aws.vpc import fetch_vpc_security_group_id, fetch_subnet_id
+from aws.waiter import wait_for_instance_state
 
 
 def create_key_pair(
@@ -27,207 +32,267 @@ def create_key_pair(
     key_path.chmod(0o400)  # python equivalent to 'chmod 400 key_path'
 
 
-def describe_instance(
+def run_fleet(
         ec2_client,
+        image_id: str,
+        instance_type: str,
+        key_name: str,
         vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
+        subnet_names: List[str],
+        fleet_name: str,
+        node_count: int,
+        node_indexes: Optional[List[int]] = None,
 ):
     """
-    Print current status of the created instance
+    Launch node_count instances and wait until every node gets ready. Nodes are placed on subnets in round-robin
+    order(node i on subnet i % len(subnet_names)), and nodes of each subnet are launched by single request sent
+    concurrently with requests of the other subnets. Every node shares name tag value fleet_name, and is distinguished
+    by 'NodeIndex' tag(0, 1, ...). If node_indexes is given, only those nodes are launched(ex. missing nodes of fleet).
     :param ec2_client: EC2 client created by boto3 session
-    :param subnet_name: name of subnet where instance is created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to stop
+    :param image_id: AMI ID which can be found in AMI catalog menu in EC2 console
+    :param instance_type: identifier of instance type listed in Instance Types menu in EC2 console
+    :param key_name: name of key pair
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where instances will be created
+    :param fleet_name: name tag value of every node
+    :param node_count: number of nodes of the fleet
+    :param node_indexes: indexes of nodes to launch(every node of the fleet if not given)
     :return: None
     """
-    try:
-        response = ec2_client.describe_instances(
-            Filters=[
-                {
-                    "Name": "subnet-id",
-                    "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name)]
-                },
+    if node_count < 1:
+        raise ValueError(f"node_count must be positive; got: {node_count}")
+    if node_indexes is None:
+        node_indexes = list(range(node_count))
+    placements = {}
+    for node_index in sorted(node_indexes):
+        placements.setdefault(subnet_names[node_index % len(subnet_names)], []).append(node_index)
+    security_group_id = fetch_vpc_security_group_id(ec2_client, vpc_name)
+
+    def launch(subnet_name: str, subnet_node_indexes: List[int]) -> List[Tuple[int, str]]:
+        response = ec2_client.run_instances(
+            ImageId=image_id,
+            InstanceType=instance_type,
+            KeyName=key_name,
+            SecurityGroupIds=[security_group_id],
+            SubnetId=fetch_subnet_id(ec2_client, vpc_name, subnet_name),
+            MaxCount=len(subnet_node_indexes),
+            MinCount=len(subnet_node_indexes),
+            TagSpecifications=[
                 {
-                    "Name": "tag:Name",
-                    "Values": [instance_name]
+                    "ResourceType": "instance",
+                    "Tags": [{"Key": "Name", "Value": fleet_name}]
                 }
             ]
         )
-        instance_info = response["Reservations"][0]["Instances"][0]
-        state = instance_info["State"]["Name"]
-        print(f"CURRENT STATE  : {state}")
-        if state == "running":
-            print(f'LAUNCH COMMAND : ssh -i "awselk.pem" ubuntu@{instance_info["PublicDnsName"]}')
-    except Exception:
-        print("Instance has not been created yet")
+        instances = sorted(response["Instances"], key=lambda instance_info: instance_info["AmiLaunchIndex"])
+        subnet_nodes = [
+            (node_index, instance_info["InstanceId"])
+            for node_index, instance_info in zip(subnet_node_indexes, instances)
+        ]
+        tag_futures.extend(
+            tag_executor.submit(
+                ec2_client.create_tags,
+                Resources=[instance_id],
+                Tags=[{"Key": "NodeIndex", "Value": str(node_index)}],
+            )
+            for node_index, instance_id in subnet_nodes
+        )
+        return subnet_nodes
+
+    # nodes are tagged as soon as their subnet is launched, so that failure of another subnet does not leave them
+    # without node index
+    tag_futures = []
+    with ThreadPoolExecutor(max_workers=len(node_indexes)) as tag_executor:
+        with ThreadPoolExecutor(max_workers=len(placements)) as executor:
+            futures = [
+                executor.submit(launch, subnet_name, subnet_node_indexes)
+                for subnet_name, subnet_node_indexes in placements.items()
+            ]
+        nodes = [node for future in futures for node in future.result()]
+    for future in tag_futures:
+        future.result()
+    if len(nodes) == node_count:
+        get_cache(ec2_client).store((vpc_name, "fleet", fleet_name), [instance_id for _, instance_id in nodes])
+    else:
+        get_cache(ec2_client).invalidate(vpc_name, "fleet", fleet_name)
+    wait_for_instance_state(ec2_client, [instance_id for _, instance_id in nodes], "running")
 
 
-def run_instance(
+def converge_fleet(
         ec2_client,
         image_id: str,
         instance_type: str,
         key_name: str,
         vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
+        subnet_names: List[str],
+        fleet_name: str,
+        node_count: int,
 ):
     """
-    Launch instance and wait until it gets ready
+    Launch only the nodes missing from the fleet(judged by 'NodeIndex' tag), and wait until nodes which were still
+    pending get ready. Stopped nodes are left as they are.
     :param ec2_client: EC2 client created by boto3 session
     :param image_id: AMI ID which can be found in AMI catalog menu in EC2 console
     :param instance_type: identifier of instance type listed in Instance Types menu in EC2 console
     :param key_name: name of key pair
-    :param subnet_name: name of subnet where instance will be created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to be created
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where instances will be created
+    :param fleet_name: name tag value of every node
+    :param node_count: number of nodes of the fleet
     :return: None
     """
-    response = ec2_client.run_instances(
-        ImageId=image_id,
-        InstanceType=instance_type,
-        KeyName=key_name,
-        SecurityGroupIds=[
-            fetch_vpc_security_group_id(ec2_client, vpc_name),
-        ],
-        SubnetId=fetch_subnet_id(ec2_client, vpc_name, subnet_name),
-        MaxCount=1,
-        MinCount=1,
-        TagSpecifications=[
-            {
-                "ResourceType": "instance",
-                "Tags": [{"Key": "Name", "Value": instance_name}]
-            }
-        ]
+    try:
+        instances = fetch_fleet_instances(ec2_client, vpc_name, subnet_names, fleet_name)
+    except ResourceNotFoundError:
+        instances = []
+    missing_indexes = sorted(
+        set(range(node_count)) - {_node_index(instance_info) for instance_info in instances if _is_node(instance_info)}
     )
-    instance_id = response["Instances"][0]["InstanceId"]
-    is_running = False
-    while not is_running:
-        time.sleep(3)
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance_info = response["Reservations"][0]["Instances"][0]
-        is_running = instance_info["State"]["Name"] == "running"
+    # instances launched without node index(ex. interrupted right after launch) take missing indexes first
+    assigned = list(zip(missing_indexes, [instance_info for instance_info in instances if not _is_node(instance_info)]))
+    for node_index, instance_info in assigned:
+        ec2_client.create_tags(
+            Resources=[instance_info["InstanceId"]],
+            Tags=[{"Key": "NodeIndex", "Value": str(node_index)}],
+        )
+    missing_indexes = missing_indexes[len(assigned):]
+    if missing_indexes:
+        run_fleet(
+            ec2_client, image_id, instance_type, key_name, vpc_name, subnet_names, fleet_name, node_count,
+            node_indexes=missing_indexes,
+        )
+    pending_ids = [
+        instance_info["InstanceId"] for instance_info in instances if instance_info["State"]["Name"] == "pending"
+    ]
+    if pending_ids:
+        wait_for_instance_state(ec2_client, pending_ids, "running")
 
 
-def stop_instance(
+def fetch_fleet_instances(
         ec2_client,
         vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
-):
+        subnet_names: List[str],
+        fleet_name: str,
+) -> List[dict]:
     """
-    Stop EC2 instance
+    Fetch description of every node(which is not terminated) of the fleet by single describe call. If instance IDs of
+    the fleet are cached(ex. loaded from state file by `aws.state.load_state`), nodes are described by their IDs
+    directly; IDs are looked up again by tags only if any of them turns out to be stale.
     :param ec2_client: EC2 client created by boto3 session
-    :param subnet_name: name of subnet where instance is created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to stop
-    :return: None
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where nodes are created
+    :param fleet_name: name tag value of every node
+    :return: list of instance descriptions ordered by node index
     """
-    instance_info = ec2_client.describe_instances(
+    cache = get_cache(ec2_client)
+    instance_ids = cache.get((vpc_name, "fleet", fleet_name))
+    if instance_ids:
+        instances = _describe_alive_instances(ec2_client, instance_ids)
+        if instances is not None:
+            return sorted(instances, key=_node_index)
+        cache.invalidate(vpc_name, "fleet", fleet_name)
+    reservations = ec2_client.describe_instances(
         Filters=[
-            {"Name": "tag:Name", "Values": [instance_name]},
-            {"Name": "subnet-id", "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name)]}
+            {"Name": "tag:Name", "Values": [fleet_name]},
+            {
+                "Name": "subnet-id",
+                "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name) for subnet_name in subnet_names]
+            },
+            {"Name": "instance-state-name", "Values": ALIVE_INSTANCE_STATES},
         ]
-    )["Reservations"][0]["Instances"][0]
-    instance_id = instance_info["InstanceId"]
-    ec2_client.stop_instances(InstanceIds=[instance_id])
-    is_stopped = False
-    while not is_stopped:
-        time.sleep(3)
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance_info = response["Reservations"][0]["Instances"][0]
-        is_stopped = instance_info["State"]["Name"] == "stopped"
-
-
-def start_instance(
-        ec2_client,
-        vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
-):
+    )["Reservations"]
+    instances = [instance_info for reservation in reservations for instance_info in reservation["Instances"]]
+    if len(instances) == 0:
+        raise ResourceNotFoundError(f"Fleet with name '{fleet_name}' does not exists")
+    cache.store((vpc_name, "fleet", fleet_name), [instance_info["InstanceId"] for instance_info in instances])
+    return sorted(instances, key=_node_index)
+
+
+def _describe_alive_instances(ec2_client, instance_ids: List[str]) -> Optional[List[dict]]:
     """
-    Start stopped EC2 instance
+    Describe instances by their IDs
     :param ec2_client: EC2 client created by boto3 session
-    :param subnet_name: name of subnet where instance is created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to stop
-    :return: None
+    :param instance_ids: list of instance IDs
+    :return: list of instance descriptions, or None if any of instances does not exist or is terminated
     """
-    instance_info = ec2_client.describe_instances(
-        Filters=[
-            {"Name": "tag:Name", "Values": [instance_name]},
-            {"Name": "subnet-id", "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name)]}
-        ]
-    )["Reservations"][0]["Instances"][0]
-    instance_id = instance_info["InstanceId"]
-    ec2_client.start_instances(InstanceIds=[instance_id])
-    is_running = False
-    while not is_running:
-        time.sleep(3)
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance_info = response["Reservations"][0]["Instances"][0]
-        is_running = instance_info["State"]["Name"] == "running"
-        
-
-
-def reboot_instance(
+    try:
+        reservations = ec2_client.describe_instances(InstanceIds=instance_ids)["Reservations"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("InvalidInstanceID.NotFound", "InvalidInstanceID.Malformed"):
+            return None
+        raise
+    instances = [instance_info for reservation in reservations for instance_info in reservation["Instances"]]
+    if len(instances) != len(instance_ids):
+        return None
+    if any(instance_info["State"]["Name"] not in ALIVE_INSTANCE_STATES for instance_info in instances):
+        return None
+    return instances
+
+
+def describe_fleet(
         ec2_client,
         vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
+        subnet_names: List[str],
+        fleet_name: str,
 ):
     """
-    Reboot EC2 instance
+    Print current status of every node of the fleet. ResourceNotFoundError is raised if the fleet, or the VPC or subnets
+    it belongs to, does not exist, so that caller can look up stale IDs again before concluding so.
     :param ec2_client: EC2 client created by boto3 session
-    :param subnet_name: name of subnet where instance is created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to stop
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where nodes are created
+    :param fleet_name: name tag value of every node
     :return: None
     """
-    instance_info = ec2_client.describe_instances(
-        Filters=[
-            {"Name": "tag:Name", "Values": [instance_name]},
-            {"Name": "subnet-id", "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name)]}
-        ]
-    )["Reservations"][0]["Instances"][0]
-    instance_id = instance_info["InstanceId"]
-    ec2_client.reboot_instances(InstanceIds=[instance_info["InstanceId"]])
-    is_running = False
-    while not is_running:
-        time.sleep(3)
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance_info = response["Reservations"][0]["Instances"][0]
-        is_running = instance_info["State"]["Name"] == "running"
-
-
-def terminate_instance(
+    for instance_info in fetch_fleet_instances(ec2_client, vpc_name, subnet_names, fleet_name):
+        node = f"[node {_node_index(instance_info)}]"
+        state = instance_info["State"]["Name"]
+        print(f"{node} CURRENT STATE  : {state}")
+        if state == "running":
+            print(f'{node} LAUNCH COMMAND : ssh -i "awselk.pem" ubuntu@{instance_info["PublicDnsName"]}')
+
+
+def change_fleet_state(
         ec2_client,
         vpc_name: str,
-        subnet_name: str,
-        instance_name: str,
+        subnet_names: List[str],
+        fleet_name: str,
+        action_type: str,
 ):
     """
-    Associate elastic IP with EC2 instance
+    Start, stop, reboot or terminate every node of the fleet by single request, and wait for every node by batched probes
     :param ec2_client: EC2 client created by boto3 session
-    :param subnet_name: name of subnet where instance is created
-    :param vpc_name: name of VPC where the subnet belongs to
-    :param instance_name: name of instance to terminate
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where nodes are created
+    :param fleet_name: name tag value of every node
+    :param action_type: one of ('start', 'stop', 'reboot', 'terminate')
     :return: None
     """
-    instance_info = ec2_client.describe_instances(
-        Filters=[
-            {"Name": "tag:Name", "Values": [instance_name]},
-            {"Name": "subnet-id", "Values": [fetch_subnet_id(ec2_client, vpc_name, subnet_name)]}
-        ]
-    )["Reservations"][0]["Instances"][0]
-    instance_id = instance_info["InstanceId"]
-    ec2_client.terminate_instances(InstanceIds=[instance_id])
-    is_terminated = False
-    while not is_terminated:
-        time.sleep(3)
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance_info = response["Reservations"][0]["Instances"][0]
-        is_terminated = instance_info["State"]["Name"] == "terminated"
+    actions = {
+        "start": (ec2_client.start_instances, "running"),
+        "stop": (ec2_client.stop_instances, "stopped"),
+        "reboot": (ec2_client.reboot_instances, "running"),
+        "terminate": (ec2_client.terminate_instances, "terminated"),
+    }
+    if action_type not in actions:
+        raise ValueError(f"action_type must be one of {tuple(actions)}; got: '{action_type}'")
+    request, target_state = actions[action_type]
+    instance_ids = [
+        instance_info["InstanceId"]
+        for instance_info in fetch_fleet_instances(ec2_client, vpc_name, subnet_names, fleet_name)
+    ]
+    request(InstanceIds=instance_ids)
+    wait_for_instance_state(ec2_client, instance_ids, target_state)
+    if action_type == "terminate":
+        get_cache(ec2_client).invalidate(vpc_name, "fleet", fleet_name)
+
+
+def _node_index(instance_info: dict) -> int:
+    """
+    :param instance_info: instance description
+    :return: value of 'NodeIndex' tag(0 if instance is not a node of fleet)
+    """
+    return next((int(tag["Value"]) for tag in instance_info.get("Tags", []) if tag["Key"] == "NodeIndex"), 0)
 
 
 def delete_key_pair(
@@ -236,11 +301,22 @@ def delete_key_pair(
         local_dir: pathlib.Path,
 ):
     """
-    Delete created key pair
+    Delete created key pair. Key pair file which has already been removed is ignored, so that failed deletion can be
+    run again.
     :param ec2_client: EC2 client created by boto3 session
     :param key_name: name of key pair
     :param local_dir: path to directory where key pair file was saved
     :return: None
     """
-    pathlib.os.remove(local_dir.joinpath(f"{key_name}.pem"))
+    key_path = local_dir.joinpath(f"{key_name}.pem")
+    if key_path.exists():
+        pathlib.os.remove(key_path)
     ec2_client.delete_key_pair(KeyName=key_name)
+
+
+def _is_node(instance_info: dict) -> bool:
+    """
+    :param instance_info: instance description
+    :return: whether instance has 'NodeIndex' tag
+    """
+    return any(tag["Key"] == "NodeIndex" for tag in instance_info.get("Tags", []))
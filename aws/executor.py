@@ -0,0 +1,137 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class Step(NamedTuple):
+    """
+    Provisioning step that can be started once every step named in depends_on has finished
+    """
+    name: str
+    func: Callable[[], None]
+    depends_on: Tuple[str, ...] = ()
+
+
+class StepTiming(NamedTuple):
+    """
+    Seconds elapsed from the start of `run_steps` until the step started and finished, and error raised by the step
+    """
+    start: float
+    end: float
+    error: Optional[Exception] = None
+
+
+def run_steps(steps: List[Step], max_workers: int = 8, fail_fast: bool = True) -> Dict[str, StepTiming]:
+    """
+    Run steps on a thread pool, starting each step as soon as every step it depends on has finished. If any step
+    fails, no more steps are started and the error is raised once running steps are finished. If fail_fast is False,
+    error is recorded in timing of the failed step instead, and only steps that depend on it(directly or not) are
+    skipped while the others keep running.
+    :param steps: list of steps whose dependencies form a directed acyclic graph
+    :param max_workers: maximum number of steps to run at the same time
+    :param fail_fast: whether to stop starting steps on the first failure and raise it
+    :return: timing of each step keyed by step name(steps skipped due to failed dependency are recorded as failed)
+    """
+    _validate_steps(steps)
+    pending = {step.name: step for step in steps}
+    timings: Dict[str, StepTiming] = {}
+    started_at = time.perf_counter()
+
+    def run_step(step: Step) -> StepTiming:
+        start = time.perf_counter() - started_at
+        try:
+            step.func()
+        except Exception as e:
+            if fail_fast:
+                raise
+            return StepTiming(start, time.perf_counter() - started_at, e)
+        return StepTiming(start, time.perf_counter() - started_at)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        error = None
+        while pending or running:
+            ready = [step for step in pending.values() if all(name in timings for name in step.depends_on)]
+            while error is None and ready:
+                for step in ready:
+                    del pending[step.name]
+                    failed = [name for name in step.depends_on if timings[name].error is not None]
+                    if failed:
+                        skipped_at = time.perf_counter() - started_at
+                        timings[step.name] = StepTiming(
+                            skipped_at, skipped_at, ValueError(f"skipped because {failed} failed")
+                        )
+                    else:
+                        running[executor.submit(run_step, step)] = step.name
+                ready = [step for step in pending.values() if all(name in timings for name in step.depends_on)]
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    error = error or e
+    if error is not None:
+        raise error
+    return timings
+
+
+def critical_path(steps: List[Step], timings: Dict[str, StepTiming]) -> List[str]:
+    """
+    Trace back the chain of steps that determined total elapsed time, starting from the step that finished last and
+    following the dependency that finished last at each step
+    :param steps: list of steps given to `run_steps`
+    :param timings: result of `run_steps`
+    :return: names of steps on the critical path in execution order
+    """
+    depends_on = {step.name: step.depends_on for step in steps}
+    name = max(timings, key=lambda step_name: timings[step_name].end)
+    path = [name]
+    while depends_on[name]:
+        name = max(depends_on[name], key=lambda step_name: timings[step_name].end)
+        path.append(name)
+    return path[::-1]
+
+
+def format_timing_report(steps: List[Step], timings: Dict[str, StepTiming]) -> str:
+    """
+    Format timeline of each step, marking steps on the critical path with '*'
+    :param steps: list of steps given to `run_steps`
+    :param timings: result of `run_steps`
+    :return: multi-line report
+    """
+    path = critical_path(steps, timings)
+    width = max(len(name) for name in timings)
+    lines = [
+        f"{'*' if name in path else ' '} {name:<{width}} {timing.start:7.2f}s -> {timing.end:7.2f}s "
+        f"({timing.end - timing.start:.2f}s)" + ("" if timing.error is None else f" FAILED: {timing.error}")
+        for name, timing in sorted(timings.items(), key=lambda item: item[1].start)
+    ]
+    total = max(timing.end for timing in timings.values())
+    lines.append(f"critical path : {' -> '.join(path)} ({total:.2f}s)")
+    return "\n".join(lines)
+
+
+def _validate_steps(steps: List[Step]):
+    """
+    Check that step names are unique, every dependency is defined and dependencies do not form a cycle
+    :param steps: list of steps
+    :return: None
+    """
+    names = [step.name for step in steps]
+    if len(names) != len(set(names)):
+        raise ValueError(f"Step names must be unique; got: {names}")
+    for step in steps:
+        unknown = set(step.depends_on) - set(names)
+        if unknown:
+            raise ValueError(f"Step '{step.name}' depends on undefined steps: {sorted(unknown)}")
+    resolved = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if set(step.depends_on) <= resolved]
+        if not ready:
+            raise ValueError(f"Dependencies of steps form a cycle: {sorted(step.name for step in remaining)}")
+        resolved.update(step.name for step in ready)
+        remaining = [step for step in remaining if step.name not in resolved]
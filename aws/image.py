@@ -0,0 +1,135 @@
+import hashlib
+import json
+import time
+from typing import List, Optional
+from aws.cache import ResourceNotFoundError, get_cache
+from aws.ec2 import fetch_fleet_instances
+from aws.waiter import wait_for_instance_state, wait_for_image_available
+
+
+def image_fingerprint(base_image_id: str, elk_version: str) -> str:
+    """
+    Fingerprint of configuration that baked image is built from. Image baked with other fingerprint(ex. before ELK
+    version was upgraded) is stale and is not used to launch instances.
+    :param base_image_id: AMI ID that baked instance was launched from
+    :param elk_version: version of Elasticsearch, Logstash, Kibana and Filebeat installed on the instance
+    :return: hexadecimal digest
+    """
+    configuration = json.dumps({"base_image_id": base_image_id, "elk_version": elk_version}, sort_keys=True)
+    return hashlib.sha256(configuration.encode("utf-8")).hexdigest()[:16]
+
+
+def fetch_image_id(
+        ec2_client,
+        vpc_name: str,
+        image_name: str,
+        base_image_id: str,
+        elk_version: str,
+) -> str:
+    """
+    Fetch ID of image to launch instances from: the latest image baked by `bake_image` with current fingerprint, or
+    base_image_id if there is no such image. Result is cached for the lifetime of the client only, since image IDs are
+    not saved into state file(see `aws.state.save_state`).
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where instances are launched
+    :param image_name: name tag value of baked images
+    :param base_image_id: AMI ID that baked instance was launched from
+    :param elk_version: version of ELK stack installed on baked image
+    :return: AMI ID
+    """
+    fingerprint = image_fingerprint(base_image_id, elk_version)
+
+    def describe_image_id() -> str:
+        images = ec2_client.describe_images(
+            Owners=["self"],
+            Filters=[
+                {"Name": "tag:Name", "Values": [image_name]},
+                {"Name": "tag:Fingerprint", "Values": [fingerprint]},
+                {"Name": "state", "Values": ["available"]},
+            ],
+        )["Images"]
+        if len(images) == 0:
+            return base_image_id
+        return max(images, key=lambda image: image["CreationDate"])["ImageId"]
+
+    return get_cache(ec2_client).fetch((vpc_name, "image", fingerprint), describe_image_id)
+
+
+def bake_image(
+        ec2_client,
+        vpc_name: str,
+        subnet_names: List[str],
+        fleet_name: str,
+        node_index: int,
+        image_name: str,
+        base_image_id: str,
+        elk_version: str,
+        reboot: bool = True,
+) -> str:
+    """
+    Create image(AMI) of a node of the fleet on which ELK stack has been installed, and wait until it becomes
+    available. Image is tagged with image_name and fingerprint of base_image_id and elk_version, so that
+    `fetch_image_id` picks it up. Images of the same name baked before are deregistered along with their snapshots.
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where the subnets belong to
+    :param subnet_names: names of subnets where nodes are created
+    :param fleet_name: name tag value of every node
+    :param node_index: node index of the instance to create image of
+    :param image_name: name tag value of baked images
+    :param base_image_id: AMI ID that ELK stack was installed on(ex. config.INSTANCE_AMI)
+    :param elk_version: version of ELK stack installed on the node
+    :param reboot: whether to reboot the node while creating image, which keeps its file system consistent
+    :return: ID of the baked image
+    """
+    instances = fetch_fleet_instances(ec2_client, vpc_name, subnet_names, fleet_name)
+    node_tag = {"Key": "NodeIndex", "Value": str(node_index)}
+    instance_info = next((i for i in instances if node_tag in i.get("Tags", [])), None)
+    if instance_info is None:
+        raise ResourceNotFoundError(f"Node {node_index} of fleet '{fleet_name}' does not exists")
+    fingerprint = image_fingerprint(base_image_id, elk_version)
+    image_id = ec2_client.create_image(
+        InstanceId=instance_info["InstanceId"],
+        Name=f"{image_name}-{elk_version}-{fingerprint}-{int(time.time())}",  # AMI name has to be unique
+        Description=f"ELK {elk_version} installed on {base_image_id}",
+        NoReboot=not reboot,
+        TagSpecifications=[
+            {
+                "ResourceType": "image",
+                "Tags": [
+                    {"Key": "Name", "Value": image_name},
+                    {"Key": "ElkVersion", "Value": elk_version},
+                    {"Key": "Fingerprint", "Value": fingerprint},
+                ]
+            }
+        ]
+    )["ImageId"]
+    wait_for_image_available(ec2_client, image_id)
+    if reboot and instance_info["State"]["Name"] == "running":
+        wait_for_instance_state(ec2_client, [instance_info["InstanceId"]], "running")
+    get_cache(ec2_client).store((vpc_name, "image", fingerprint), image_id)
+    deregister_images(ec2_client, image_name, keep_image_id=image_id)
+    return image_id
+
+
+def deregister_images(ec2_client, image_name: str, keep_image_id: Optional[str] = None) -> List[str]:
+    """
+    Deregister images with name tag value image_name and delete their snapshots, which are charged as long as they exist
+    :param ec2_client: EC2 client created by boto3 session
+    :param image_name: name tag value of baked images
+    :param keep_image_id: ID of image not to deregister(ex. image that has just been baked)
+    :return: list of deregistered image IDs
+    """
+    images = ec2_client.describe_images(
+        Owners=["self"],
+        Filters=[{"Name": "tag:Name", "Values": [image_name]}],
+    )["Images"]
+    deregistered = []
+    for image in images:
+        if image["ImageId"] == keep_image_id:
+            continue
+        ec2_client.deregister_image(ImageId=image["ImageId"])
+        for block_device in image.get("BlockDeviceMappings", []):
+            if "SnapshotId" in block_device.get("Ebs", {}):
+                ec2_client.delete_snapshot(SnapshotId=block_device["Ebs"]["SnapshotId"])
+        deregistered.append(image["ImageId"])
+    return deregistered
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from aws.cache import get_cache
+
+ALIVE_INSTANCE_STATES = ["pending", "running", "stopping", "stopped"]
+
+
+def load_inventory(ec2_client, vpc_name: str) -> Dict[str, Dict[str, List[dict]]]:
+    """
+    Fetch every resource defined in VPC by one paginated describe call per resource type, and index it by type and
+    name tag(GroupName for security groups). Unambiguous IDs are stored in resource ID cache of the client, so that
+    subsequent `fetch_*` functions in `aws.vpc` and `aws.ec2` resolve IDs without any describe call.
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC to take inventory of
+    :return: resource descriptions indexed by type and name(empty if VPC does not exist)
+    """
+    inventory = {"vpc": {}, "subnet": {}, "route_table": {}, "security_group": {}, "internet_gateway": {}, "instance": {}}
+    vpcs = _describe_all(ec2_client, "describe_vpcs", "Vpcs", [{"Name": "tag:Name", "Values": [vpc_name]}])
+    inventory["vpc"][vpc_name] = vpcs
+    if len(vpcs) != 1:
+        return inventory
+    vpc_id = vpcs[0]["VpcId"]
+    vpc_filter = [{"Name": "vpc-id", "Values": [vpc_id]}]
+    requests = {
+        "subnet": ("describe_subnets", "Subnets", vpc_filter),
+        "route_table": ("describe_route_tables", "RouteTables", vpc_filter),
+        "security_group": ("describe_security_groups", "SecurityGroups", vpc_filter),
+        "internet_gateway": (
+            "describe_internet_gateways", "InternetGateways", [{"Name": "attachment.vpc-id", "Values": [vpc_id]}]
+        ),
+        "instance": (
+            "describe_instances", "Reservations",
+            vpc_filter + [{"Name": "instance-state-name", "Values": ALIVE_INSTANCE_STATES}]
+        ),
+    }
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        futures = {
+            kind: executor.submit(_describe_all, ec2_client, operation, result_key, filters)
+            for kind, (operation, result_key, filters) in requests.items()
+        }
+        results = {kind: future.result() for kind, future in futures.items()}
+    results["instance"] = [instance for reservation in results["instance"] for instance in reservation["Instances"]]
+    for kind, resources in results.items():
+        for resource in resources:
+            name = resource["GroupName"] if kind == "security_group" else _name_tag(resource)
+            inventory[kind].setdefault(name, []).append(resource)
+    _prime_cache(ec2_client, vpc_name, inventory)
+    return inventory
+
+
+def _describe_all(ec2_client, operation: str, result_key: str, filters: List[dict]) -> List[dict]:
+    """
+    Collect every page of describe call
+    :param ec2_client: EC2 client created by boto3 session
+    :param operation: name of describe operation(ex. 'describe_subnets')
+    :param result_key: key of resource list in response(ex. 'Subnets')
+    :param filters: filters of describe call
+    :return: list of resource descriptions
+    """
+    paginator = ec2_client.get_paginator(operation)
+    return [resource for page in paginator.paginate(Filters=filters) for resource in page[result_key]]
+
+
+def _name_tag(resource: dict) -> str:
+    """
+    :param resource: resource description
+    :return: value of 'Name' tag, or empty string if resource has no name
+    """
+    return next((tag["Value"] for tag in resource.get("Tags", []) if tag["Key"] == "Name"), "")
+
+
+def _prime_cache(ec2_client, vpc_name: str, inventory: Dict[str, Dict[str, List[dict]]]):
+    """
+    Store IDs into resource ID cache with the same keys that `fetch_*` functions use. Ambiguous names are skipped, so
+    that corresponding `fetch_*` function raises its own error.
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC that inventory is taken
+    :param inventory: result of `load_inventory`
+    :return: None
+    """
+    cache = get_cache(ec2_client)
+    cache.store((vpc_name, "vpc"), inventory["vpc"][vpc_name][0]["VpcId"])
+    subnet_names = {}
+    for subnet_name, subnets in inventory["subnet"].items():
+        for subnet in subnets:
+            subnet_names[subnet["SubnetId"]] = subnet_name
+        if len(subnets) == 1:
+            cache.store((vpc_name, "subnet", subnet_name), subnets[0]["SubnetId"])
+    sg_groups = inventory["security_group"].get(f"{vpc_name.replace('_', '-')}-sg", [])
+    if len(sg_groups) == 1:
+        cache.store((vpc_name, "security_group"), sg_groups[0]["GroupId"])
+    igws = [igw for igws in inventory["internet_gateway"].values() for igw in igws]
+    if len(igws) > 0:
+        cache.store((vpc_name, "internet_gateway"), igws[0]["InternetGatewayId"])
+    for rt_name, route_tables in inventory["route_table"].items():
+        if len(route_tables) != 1 or rt_name == "":
+            continue
+        cache.store((vpc_name, "route_table", rt_name), route_tables[0]["RouteTableId"])
+        for association in route_tables[0].get("Associations", []):
+            if association.get("SubnetId") in subnet_names:
+                cache.store(
+                    (vpc_name, "route_table_association", rt_name, subnet_names[association["SubnetId"]]),
+                    association["RouteTableAssociationId"],
+                )
+    for instance_name, instances in inventory["instance"].items():
+        cache.store((vpc_name, "fleet", instance_name), [instance["InstanceId"] for instance in instances])
@@ -0,0 +1,55 @@
+import json
+import pathlib
+from aws.cache import get_cache
+
+# types of cached IDs that are not saved, since resources of them outlive the VPC and are removed by other commands(ex.
+# images deregistered by `image clean`), which would leave saved IDs pointing at resources that no longer exist
+_UNSAVED_TYPES = ("image",)
+
+
+def load_state(ec2_client, state_path: pathlib.Path, region_name: str) -> int:
+    """
+    Prime resource ID cache of the client with IDs saved by `save_state`, so that `fetch_*` functions in `aws.vpc` and
+    `aws.ec2` skip tag filtered describe calls. Saved IDs are not validated here; functions that use them fall back to
+    describe calls when an ID turns out to be stale. IDs of types that are no longer saved(see _UNSAVED_TYPES) are
+    ignored if state file was saved before.
+    :param ec2_client: EC2 client created by boto3 session
+    :param state_path: path to state file
+    :param region_name: name of region where resources are created
+    :return: number of loaded IDs(0 if state file does not exist or was saved for another region)
+    """
+    if not state_path.exists():
+        return 0
+    with open(state_path) as file:
+        state = json.load(file)
+    if state.get("region") != region_name:
+        return 0
+    cache = get_cache(ec2_client)
+    entries = [entry for entry in state["ids"] if entry["key"][1] not in _UNSAVED_TYPES]
+    for entry in entries:
+        cache.store(tuple(entry["key"]), entry["id"])
+    return len(entries)
+
+
+def save_state(ec2_client, state_path: pathlib.Path, region_name: str):
+    """
+    Save every ID in resource ID cache of the client into state file, except IDs of images which are looked up again
+    by each command. State file is removed if there is no ID to save(ex. after every resource is deleted).
+    :param ec2_client: EC2 client created by boto3 session
+    :param state_path: path to state file
+    :param region_name: name of region where resources are created
+    :return: None
+    """
+    entries = {
+        key: resource_id for key, resource_id in get_cache(ec2_client).entries().items() if key[1] not in _UNSAVED_TYPES
+    }
+    if not entries:
+        if state_path.exists():
+            state_path.unlink()
+        return
+    state = {
+        "region": region_name,
+        "ids": [{"key": list(key), "id": resource_id} for key, resource_id in sorted(entries.items())],
+    }
+    with open(state_path, "w") as file:
+        json.dump(state, file, indent=2)
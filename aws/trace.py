@@ -0,0 +1,201 @@
+import json
+import pathlib
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from aws.executor import Step
+
+THROTTLING_ERRORS = ("Throttling", "ThrottlingException", "RequestLimitExceeded", "TooManyRequestsException")
+_TRACED_MODULES = ("aws.vpc", "aws.ec2", "aws.waiter", "aws.inventory")
+
+
+class ApiTracer:
+    """
+    Records every API call made by EC2 clients attached to it through boto3 event system: operation name, function of
+    `aws.vpc`, `aws.ec2`, `aws.waiter` or `aws.inventory` that made the call, latency, retries and throttling errors.
+    Calls are grouped by step if steps are wrapped by `wrap_step`. Calls made from threads started by a step(ex. nodes
+    launched in parallel by `aws.ec2.run_fleet`) are attributed to the step only if no other step is running at the
+    same time.
+    """
+
+    def __init__(self):
+        self.calls: List[dict] = []
+        self.steps: List[dict] = []
+        self._started_at = time.perf_counter()
+        self._local = threading.local()
+        self._running_steps: Dict[int, str] = {}
+        self._clients = []
+        self._lock = threading.Lock()
+
+    def attach(self, ec2_client):
+        """
+        Register event handlers on EC2 client
+        :param ec2_client: EC2 client created by boto3 session
+        :return: None
+        """
+        ec2_client.meta.events.register("before-call.ec2.*", self._before_call)
+        ec2_client.meta.events.register("needs-retry.ec2.*", self._needs_retry)
+        ec2_client.meta.events.register("after-call.ec2.*", self._after_call)
+        ec2_client.meta.events.register("after-call-error.ec2.*", self._after_call_error)
+        self._clients.append(ec2_client)
+
+    def detach(self):
+        """
+        Unregister event handlers from every client that the tracer is attached to(ex. client reused by next command)
+        :return: None
+        """
+        for ec2_client in self._clients:
+            ec2_client.meta.events.unregister("before-call.ec2.*", self._before_call)
+            ec2_client.meta.events.unregister("needs-retry.ec2.*", self._needs_retry)
+            ec2_client.meta.events.unregister("after-call.ec2.*", self._after_call)
+            ec2_client.meta.events.unregister("after-call-error.ec2.*", self._after_call_error)
+        self._clients = []
+
+    def wrap_step(self, step: Step) -> Step:
+        """
+        Wrap function of step so that API calls made while it runs are attributed to the step
+        :param step: step to be run by `aws.executor.run_steps`
+        :return: step whose function is wrapped
+        """
+        def traced():
+            self._local.step = step.name
+            with self._lock:
+                self._running_steps[threading.get_ident()] = step.name
+            start = self._elapsed()
+            try:
+                step.func()
+            finally:
+                self._local.step = None
+                with self._lock:
+                    del self._running_steps[threading.get_ident()]
+                    self.steps.append({
+                        "step": step.name, "start": start, "end": self._elapsed(), "thread": threading.get_ident(),
+                    })
+
+        return step._replace(func=traced)
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    def _current_step(self) -> Optional[str]:
+        step = getattr(self._local, "step", None)
+        if step is None:
+            with self._lock:
+                running_steps = set(self._running_steps.values())
+            if len(running_steps) == 1:
+                step = running_steps.pop()
+        return step
+
+    def _before_call(self, model, context, **kwargs):
+        context["trace"] = {
+            "operation": model.name,
+            "caller": _find_caller(),
+            "step": self._current_step(),
+            "thread": threading.get_ident(),
+            "start": self._elapsed(),
+            "retries": 0,
+            "throttled": 0,
+            "error": None,
+        }
+
+    def _needs_retry(self, response, attempts, caught_exception, request_dict, **kwargs):
+        call = request_dict.get("context", {}).get("trace")
+        if call is None or response is None:
+            return
+        error_code = response[1].get("Error", {}).get("Code")
+        if error_code in THROTTLING_ERRORS:
+            call["throttled"] += 1
+
+    def _after_call(self, parsed, context, **kwargs):
+        call = context.get("trace")
+        if call is None:
+            return
+        call["end"] = self._elapsed()
+        call["retries"] = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        call["error"] = parsed.get("Error", {}).get("Code")
+        if call["error"] in THROTTLING_ERRORS and call["throttled"] == 0:
+            call["throttled"] = 1
+        with self._lock:
+            self.calls.append(call)
+
+    def _after_call_error(self, exception, context, **kwargs):
+        call = context.get("trace")
+        if call is None:
+            return
+        call["end"] = self._elapsed()
+        call["error"] = type(exception).__name__
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self) -> str:
+        """
+        Summarize API calls per operation and per step
+        :return: multi-line tables
+        """
+        lines = [
+            f"{'operation':<32} {'calls':>5} {'total':>8} {'mean':>8} {'max':>8} {'retries':>7} {'throttled':>9}",
+        ]
+        for operation, calls in sorted(_group(self.calls, "operation").items()):
+            latencies = [call["end"] - call["start"] for call in calls]
+            lines.append(
+                f"{operation:<32} {len(calls):>5} {sum(latencies):>7.2f}s {sum(latencies) / len(calls):>7.3f}s "
+                f"{max(latencies):>7.3f}s {sum(call['retries'] for call in calls):>7} "
+                f"{sum(call['throttled'] for call in calls):>9}"
+            )
+        lines.append("")
+        lines.append(f"{'step':<32} {'calls':>5} {'api':>8} {'elapsed':>8}  callers")
+        step_elapsed = {step["step"]: step["end"] - step["start"] for step in self.steps}
+        for step_name, calls in sorted(_group(self.calls, "step").items(), key=lambda item: item[0] or ""):
+            api_seconds = sum(call["end"] - call["start"] for call in calls)
+            elapsed = "" if step_name not in step_elapsed else f"{step_elapsed[step_name]:.2f}s"
+            callers = ", ".join(sorted({call["caller"] for call in calls}))
+            lines.append(f"{step_name or '-':<32} {len(calls):>5} {api_seconds:>7.2f}s {elapsed:>8}  {callers}")
+        return "\n".join(lines)
+
+    def dump_chrome_trace(self, trace_path: pathlib.Path):
+        """
+        Save API calls and steps in Chrome trace event format, which can be opened by chrome://tracing or Perfetto
+        :param trace_path: path to JSON file
+        :return: None
+        """
+        threads = {}
+        for record in self.steps + self.calls:
+            threads.setdefault(record["thread"], len(threads))
+        events = [
+            {
+                "name": step["step"], "cat": "step", "ph": "X", "pid": 1, "tid": threads[step["thread"]],
+                "ts": step["start"] * 1e6, "dur": (step["end"] - step["start"]) * 1e6,
+            }
+            for step in self.steps
+        ]
+        events.extend(
+            {
+                "name": call["operation"], "cat": "api", "ph": "X", "pid": 1, "tid": threads[call["thread"]],
+                "ts": call["start"] * 1e6, "dur": (call["end"] - call["start"]) * 1e6,
+                "args": {key: call[key] for key in ("caller", "step", "retries", "throttled", "error")},
+            }
+            for call in self.calls
+        )
+        with open(trace_path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+def _find_caller() -> str:
+    """
+    :return: innermost function of traced modules in current call stack(ex. 'vpc.create_subnet')
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        if module in _TRACED_MODULES:
+            return f"{module[len('aws.'):]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "-"
+
+
+def _group(calls: List[dict], key: str) -> Dict[Optional[str], List[dict]]:
+    groups = {}
+    for call in calls:
+        groups.setdefault(call[key], []).append(call)
+    return groups
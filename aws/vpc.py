@@ -1,4 +1,6 @@
+import ipaddress
 from typing import List
+from aws.cache import ResourceNotFoundError, get_cache
 
 
 def create_vpc(ec2_client, vpc_name: str, vpc_cidr: str):
@@ -24,6 +26,8 @@ def create_vpc(ec2_client, vpc_name: str, vpc_cidr: str):
         EnableDnsHostnames={"Value": True},
         VpcId=vpc_id
     )
+    get_cache(ec2_client).invalidate(vpc_name)
+    get_cache(ec2_client).store((vpc_name, "vpc"), vpc_id)
 
 
 def create_vpc_security_group(
@@ -45,6 +49,7 @@ def create_vpc_security_group(
         VpcId=vpc_id,
     )
     sg_id = response["GroupId"]
+    get_cache(ec2_client).store((vpc_name, "security_group"), sg_id)
     ec2_client.authorize_security_group_ingress(
         GroupId=sg_id,
         IpPermissions=_parse_ip_permissions(ingress_ports)
@@ -70,13 +75,14 @@ def create_vpc_internet_gateway(ec2_client, vpc_name: str):
     ec2_client.attach_internet_gateway(
         InternetGatewayId=igw_id, VpcId=vpc_id
     )
+    get_cache(ec2_client).store((vpc_name, "internet_gateway"), igw_id)
 
 
 def create_subnet(
         ec2_client,
         vpc_name: str,
         subnet_name: str,
-        cidr_substitute: str,
+        cidr_block: str,
         region_name: str,
         az_postfix: str,
         is_public: bool,
@@ -87,21 +93,15 @@ def create_subnet(
     :param ec2_client: EC2 client created by boto3 session
     :param vpc_name: name of VPC to create subnet
     :param subnet_name: name of subnet to be created
-    :param cidr_substitute: integer between 5 and 254 to be used as substitute for 0 of CIDR block
+    :param cidr_block: CIDR notation of IP range within the VPC(ex. result of `allocate_subnet_cidrs`)
     :param region_name: name of region
     :param az_postfix: one of ('a', 'b', 'c', 'd') used to specify availability zone within current region
     :param is_public: whether subnet has to be connected to internet
     :return: None
     """
     vpc_id = fetch_vpc_id(ec2_client, vpc_name)
-    vpc_info = ec2_client.describe_vpcs(
-        Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
-    )["Vpcs"][0]
-    subnet_cidr = vpc_info["CidrBlock"].split(".")[:-1]  # ex. '172.50.0.0/16' -> ['172', '50', '0']
-    subnet_cidr[2] = cidr_substitute  # ex. ['172', '50', '0'] -> ['172', '50', '100']
-    subnet_cidr = f"{'.'.join(subnet_cidr)}.0/24"  # ex. ['172', '50', '100'] -> '172.50.100.0/24'
     response = ec2_client.create_subnet(
-        CidrBlock=subnet_cidr,
+        CidrBlock=cidr_block,
         VpcId=vpc_id,
         AvailabilityZone=f"{region_name}{az_postfix}",
         TagSpecifications=[
@@ -112,6 +112,7 @@ def create_subnet(
         ]
     )
     subnet_id = response["Subnet"]["SubnetId"]
+    get_cache(ec2_client).store((vpc_name, "subnet", subnet_name), subnet_id)
     if is_public:
         ec2_client.modify_subnet_attribute(
             SubnetId=subnet_id,
@@ -124,6 +125,21 @@ def create_subnet(
         )
 
 
+def allocate_subnet_cidrs(vpc_cidr: str, subnet_count: int, first_index: int) -> List[str]:
+    """
+    Split IP range of VPC into non-overlapping /24 blocks, starting from first_index-th block. For example, 2 subnets
+    starting from 11th block of '172.40.0.0/16' are ['172.40.11.0/24', '172.40.12.0/24'].
+    :param vpc_cidr: CIDR notation of IP range of VPC
+    :param subnet_count: number of subnets
+    :param first_index: index of /24 block to be allocated to the first subnet
+    :return: list of CIDR blocks
+    """
+    blocks = list(ipaddress.ip_network(vpc_cidr).subnets(new_prefix=24))
+    if first_index + subnet_count > len(blocks):
+        raise ValueError(f"VPC CIDR '{vpc_cidr}' can not hold {subnet_count} /24 subnets from block {first_index}")
+    return [str(block) for block in blocks[first_index:first_index + subnet_count]]
+
+
 def create_route_table(
         ec2_client,
         vpc_name: str,
@@ -148,14 +164,11 @@ def create_route_table(
             }
         ]
     )
+    get_cache(ec2_client).store((vpc_name, "route_table", rt_name), response["RouteTable"]["RouteTableId"])
     if is_public:
-        igw_info = ec2_client.describe_internet_gateways(
-            Filters=[{"Name": "attachment.vpc-id", "Values": [vpc_id]}]
-        )["InternetGateways"]
-        assert len(igw_info) > 0, f"Internet gateway attached to VPC '{vpc_name}' is not generated"
         ec2_client.create_route(
             DestinationCidrBlock="0.0.0.0/0",
-            GatewayId=igw_info[0]["InternetGatewayId"],
+            GatewayId=fetch_internet_gateway_id(ec2_client, vpc_name),
             RouteTableId=response["RouteTable"]["RouteTableId"],
         )
 
@@ -175,33 +188,113 @@ def create_route_table_subnet_association(
     :return:
     """
     subnet_id = fetch_subnet_id(ec2_client, vpc_name, subnet_name)
-    rt_id = ec2_client.describe_route_tables(
-        Filters=[
-            {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
-            {"Name": "tag:Name", "Values": [rt_name]}
-        ]
-    )["RouteTables"][0]["RouteTableId"]
+    rt_id = fetch_route_table_id(ec2_client, vpc_name, rt_name)
     ec2_client.associate_route_table(RouteTableId=rt_id, SubnetId=subnet_id)
+    get_cache(ec2_client).invalidate(vpc_name, "route_table_association", rt_name, subnet_name)
+
+
+def converge_vpc_security_group(ec2_client, security_group: dict, ingress_ports: List[str]):
+    """
+    Authorize connections to ingress ports that existing security group does not allow yet(ex. creation was interrupted
+    before ingress rules were authorized)
+    :param ec2_client: EC2 client created by boto3 session
+    :param security_group: description of existing security group(ex. from `aws.inventory.load_inventory`)
+    :param ingress_ports: list of port(ex. '22') or range of ports(ex. '8888-8890')
+    :return: None
+    """
+    allowed = {
+        (permission.get("IpProtocol"), permission.get("FromPort"), permission.get("ToPort"))
+        for permission in security_group.get("IpPermissions", [])
+        if any(ip_range["CidrIp"] == "0.0.0.0/0" for ip_range in permission.get("IpRanges", []))
+    }
+    missing = [
+        permission for permission in _parse_ip_permissions(ingress_ports)
+        if (permission["IpProtocol"], permission["FromPort"], permission["ToPort"]) not in allowed
+    ]
+    if missing:
+        ec2_client.authorize_security_group_ingress(GroupId=security_group["GroupId"], IpPermissions=missing)
+
+
+def converge_vpc_internet_gateway(ec2_client, vpc_name: str):
+    """
+    Attach internet gateway of VPC which was left detached(ex. creation was interrupted before attachment), or create
+    one if there is no such gateway. Detached gateway is found by its name tag, since it has no attachment to filter by.
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC to attach internet gateway
+    :return: None
+    """
+    igw_info = ec2_client.describe_internet_gateways(
+        Filters=[{"Name": "tag:Name", "Values": [f"{vpc_name.replace('_', '-')}-igw"]}]
+    )["InternetGateways"]
+    detached = [igw for igw in igw_info if not igw.get("Attachments")]
+    if not detached:
+        create_vpc_internet_gateway(ec2_client, vpc_name)
+        return
+    igw_id = detached[0]["InternetGatewayId"]
+    ec2_client.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=fetch_vpc_id(ec2_client, vpc_name))
+    get_cache(ec2_client).store((vpc_name, "internet_gateway"), igw_id)
+
+
+def converge_subnet(ec2_client, subnet: dict, is_public: bool):
+    """
+    Modify subnet attribute 'MapPublicIpOnLaunch' of existing subnet if it does not match is_public
+    :param ec2_client: EC2 client created by boto3 session
+    :param subnet: description of existing subnet(ex. from `aws.inventory.load_inventory`)
+    :param is_public: whether subnet has to be connected to internet
+    :return: None
+    """
+    if subnet.get("MapPublicIpOnLaunch", False) != is_public:
+        ec2_client.modify_subnet_attribute(
+            SubnetId=subnet["SubnetId"],
+            MapPublicIpOnLaunch={"Value": is_public},
+        )
+
+
+def converge_route_table(ec2_client, vpc_name: str, route_table: dict, is_public: bool):
+    """
+    Add route to internet gateway of VPC into existing route table if it is missing, or point the route to the gateway
+    if it leads elsewhere(ex. gateway which was deleted)
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where route table is defined
+    :param route_table: description of existing route table(ex. from `aws.inventory.load_inventory`)
+    :param is_public: whether route to VPC internet gateway has to be in the table
+    :return: None
+    """
+    if not is_public:
+        return
+    igw_id = fetch_internet_gateway_id(ec2_client, vpc_name)
+    routes = [route for route in route_table.get("Routes", []) if route.get("DestinationCidrBlock") == "0.0.0.0/0"]
+    if not routes:
+        ec2_client.create_route(
+            DestinationCidrBlock="0.0.0.0/0", GatewayId=igw_id, RouteTableId=route_table["RouteTableId"]
+        )
+    elif routes[0].get("GatewayId") != igw_id or routes[0].get("State") == "blackhole":
+        ec2_client.replace_route(
+            DestinationCidrBlock="0.0.0.0/0", GatewayId=igw_id, RouteTableId=route_table["RouteTableId"]
+        )
 
 
 def fetch_vpc_id(ec2_client, vpc_name: str) -> str:
     """
     This project assigns unique name to unique VPC, so normal response should contain only one set of VPC information.
     If list is empty, it means that VPC is not created. If there are multiple VPCs with given name, it must be that
-    one of VPCs is created from outside of this project.
+    one of VPCs is created from outside of this project. Fetched ID is cached until VPC is created or deleted again.
     :param ec2_client: EC2 client created by boto3 session
     :param vpc_name: name of VPC to fetch corresponding ID
     :return: VpcId
     """
-    vpc_info = ec2_client.describe_vpcs(
-        Filters=[{"Name": "tag:Name", "Values": [vpc_name]}]
-    )["Vpcs"]
-    if len(vpc_info) == 1:
-        return vpc_info[0]["VpcId"]
-    elif len(vpc_info) == 0:
-        raise ValueError(f"VPC with name '{vpc_name}' does not exists")
-    else:
-        raise ValueError(f"VPC whose name tag value is '{vpc_name}' is ambiguous")
+    def describe_vpc_id() -> str:
+        vpc_info = ec2_client.describe_vpcs(
+            Filters=[{"Name": "tag:Name", "Values": [vpc_name]}]
+        )["Vpcs"]
+        if len(vpc_info) == 1:
+            return vpc_info[0]["VpcId"]
+        elif len(vpc_info) == 0:
+            raise ResourceNotFoundError(f"VPC with name '{vpc_name}' does not exists")
+        else:
+            raise ValueError(f"VPC whose name tag value is '{vpc_name}' is ambiguous")
+
+    return get_cache(ec2_client).fetch((vpc_name, "vpc"), describe_vpc_id)
 
 
 def fetch_vpc_security_group_id(ec2_client, vpc_name: str) -> str:
@@ -211,19 +304,22 @@ def fetch_vpc_security_group_id(ec2_client, vpc_name: str) -> str:
     :param vpc_name: name of VPC for the security group
     :return: GroupId
     """
-    sg_name = f"{vpc_name.replace('_', '-')}-sg"
-    sg_info = ec2_client.describe_security_groups(
-        Filters=[
-            {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
-            {"Name": "group-name", "Values": [sg_name]},
-        ]
-    )["SecurityGroups"]
-    if len(sg_info) == 1:
-        return sg_info[0]["GroupId"]
-    elif len(sg_info) == 0:
-        raise ValueError(f"Security group with GroupName '{sg_name}' does not exists")
-    else:
-        raise ValueError(f"Security group with GroupName '{sg_name}' is ambiguous")
+    def describe_security_group_id() -> str:
+        sg_name = f"{vpc_name.replace('_', '-')}-sg"
+        sg_info = ec2_client.describe_security_groups(
+            Filters=[
+                {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
+                {"Name": "group-name", "Values": [sg_name]},
+            ]
+        )["SecurityGroups"]
+        if len(sg_info) == 1:
+            return sg_info[0]["GroupId"]
+        elif len(sg_info) == 0:
+            raise ResourceNotFoundError(f"Security group with GroupName '{sg_name}' does not exists")
+        else:
+            raise ValueError(f"Security group with GroupName '{sg_name}' is ambiguous")
+
+    return get_cache(ec2_client).fetch((vpc_name, "security_group"), describe_security_group_id)
 
 
 def fetch_subnet_id(ec2_client, vpc_name: str, subnet_name: str) -> str:
@@ -234,18 +330,91 @@ def fetch_subnet_id(ec2_client, vpc_name: str, subnet_name: str) -> str:
     :param subnet_name: name of subnet to fetch ID
     :return: SubnetId
     """
-    subnet_info = ec2_client.describe_subnets(
-        Filters=[
-            {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
-            {"Name": "tag:Name", "Values": [subnet_name]}
-        ]
-    )["Subnets"]
-    if len(subnet_info) == 1:
-        return subnet_info[0]["SubnetId"]
-    elif len(subnet_info) == 0:
-        raise ValueError(f"Subnet with name '{subnet_name}' does not exists")
-    else:
-        raise ValueError(f"Subnet whose name tag value is '{subnet_name}' is ambiguous")
+    def describe_subnet_id() -> str:
+        subnet_info = ec2_client.describe_subnets(
+            Filters=[
+                {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
+                {"Name": "tag:Name", "Values": [subnet_name]}
+            ]
+        )["Subnets"]
+        if len(subnet_info) == 1:
+            return subnet_info[0]["SubnetId"]
+        elif len(subnet_info) == 0:
+            raise ResourceNotFoundError(f"Subnet with name '{subnet_name}' does not exists")
+        else:
+            raise ValueError(f"Subnet whose name tag value is '{subnet_name}' is ambiguous")
+
+    return get_cache(ec2_client).fetch((vpc_name, "subnet", subnet_name), describe_subnet_id)
+
+
+def fetch_route_table_id(ec2_client, vpc_name: str, rt_name: str) -> str:
+    """
+    Fetch ID of route table whose name tag value is rt_name. Fetched ID is cached until the route table is deleted.
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where route table is defined
+    :param rt_name: name of route table
+    :return: RouteTableId
+    """
+    def describe_route_table_id() -> str:
+        rt_info = ec2_client.describe_route_tables(
+            Filters=[
+                {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
+                {"Name": "tag:Name", "Values": [rt_name]}
+            ]
+        )["RouteTables"]
+        if len(rt_info) == 0:
+            raise ResourceNotFoundError(f"Route table with name '{rt_name}' does not exists")
+        return rt_info[0]["RouteTableId"]
+
+    return get_cache(ec2_client).fetch((vpc_name, "route_table", rt_name), describe_route_table_id)
+
+
+def fetch_route_table_association_id(ec2_client, vpc_name: str, subnet_name: str, rt_name: str) -> str:
+    """
+    Fetch ID of association between route table and subnet
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where route table and subnet are defined
+    :param subnet_name: name of subnet
+    :param rt_name: name of route table
+    :return: RouteTableAssociationId
+    """
+    def describe_association_id() -> str:
+        subnet_id = fetch_subnet_id(ec2_client, vpc_name, subnet_name)
+        rt_info = ec2_client.describe_route_tables(
+            Filters=[
+                {"Name": "vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]},
+                {"Name": "association.subnet-id", "Values": [subnet_id]},
+                {"Name": "tag:Name", "Values": [rt_name]},
+            ]
+        )["RouteTables"]
+        if len(rt_info) == 0:
+            raise ResourceNotFoundError(f"Route table '{rt_name}' is not associated with subnet '{subnet_name}'")
+        return next(
+            association["RouteTableAssociationId"] for association in rt_info[0]["Associations"]
+            if association.get("SubnetId") == subnet_id
+        )
+
+    return get_cache(ec2_client).fetch(
+        (vpc_name, "route_table_association", rt_name, subnet_name), describe_association_id
+    )
+
+
+def fetch_internet_gateway_id(ec2_client, vpc_name: str) -> str:
+    """
+    Fetch ID of internet gateway attached to VPC
+    :param ec2_client: EC2 client created by boto3 session
+    :param vpc_name: name of VPC where internet gateway is attached
+    :return: InternetGatewayId
+    """
+    def describe_internet_gateway_id() -> str:
+        igw_info = ec2_client.describe_internet_gateways(
+            Filters=[{"Name": "attachment.vpc-id", "Values": [fetch_vpc_id(ec2_client, vpc_name)]}]
+        )["InternetGateways"]
+        if len(igw_info) == 0:
+            raise ResourceNotFoundError(f"Internet gateway attached to VPC '{vpc_name}' is not generated")
+        return igw_info[0]["InternetGatewayId"]
+
+    return get_cache(ec2_client).fetch((vpc_name, "internet_gateway"), describe_internet_gateway_id)
 
 
 def delete_route_table_subnet_association(
@@ -262,18 +431,10 @@ def delete_route_table_subnet_association(
     :param rt_name: name of route table
     :return: None
     """
-    vpc_id = fetch_vpc_id(ec2_client, vpc_name)
-    associated_subnet_id = fetch_subnet_id(ec2_client, vpc_name, subnet_name)
-    rt_info = ec2_client.describe_route_tables(
-        Filters=[
-            {"Name": "vpc-id", "Values": [vpc_id]},
-            {"Name": "association.subnet-id", "Values": [associated_subnet_id]},
-            {"Name": "tag:Name", "Values": [rt_name]},
-        ]
-    )["RouteTables"][0]
     ec2_client.disassociate_route_table(
-        AssociationId=rt_info["Associations"][0]["RouteTableAssociationId"]
+        AssociationId=fetch_route_table_association_id(ec2_client, vpc_name, subnet_name, rt_name)
     )
+    get_cache(ec2_client).invalidate(vpc_name, "route_table_association", rt_name, subnet_name)
 
 
 def delete_route_table(ec2_client, vpc_name: str, rt_name: str):
@@ -284,14 +445,9 @@ def delete_route_table(ec2_client, vpc_name: str, rt_name: str):
     :param rt_name: name of route table to delete
     :return: None
     """
-    vpc_id = fetch_vpc_id(ec2_client, vpc_name)
-    rt_info = ec2_client.describe_route_tables(
-        Filters=[
-            {"Name": "vpc-id", "Values": [vpc_id]},
-            {"Name": "tag:Name", "Values": [rt_name]},
-        ]
-    )["RouteTables"][0]
-    ec2_client.delete_route_table(RouteTableId=rt_info["RouteTableId"])
+    ec2_client.delete_route_table(RouteTableId=fetch_route_table_id(ec2_client, vpc_name, rt_name))
+    get_cache(ec2_client).invalidate(vpc_name, "route_table", rt_name)
+    get_cache(ec2_client).invalidate(vpc_name, "route_table_association", rt_name)
 
 
 def delete_subnet(ec2_client, vpc_name: str, subnet_name: str):
@@ -304,6 +460,7 @@ def delete_subnet(ec2_client, vpc_name: str, subnet_name: str):
     """
     subnet_id = fetch_subnet_id(ec2_client, vpc_name, subnet_name)
     ec2_client.delete_subnet(SubnetId=subnet_id)
+    get_cache(ec2_client).invalidate(vpc_name, "subnet", subnet_name)
 
 
 def delete_vpc_security_group(ec2_client, vpc_name: str):
@@ -315,6 +472,7 @@ def delete_vpc_security_group(ec2_client, vpc_name: str):
     """
     security_group_id = fetch_vpc_security_group_id(ec2_client, vpc_name)
     ec2_client.delete_security_group(GroupId=security_group_id)
+    get_cache(ec2_client).invalidate(vpc_name, "security_group")
 
 
 def delete_vpc_internet_gateway(ec2_client, vpc_name: str):
@@ -325,12 +483,10 @@ def delete_vpc_internet_gateway(ec2_client, vpc_name: str):
     :return: None
     """
     vpc_id = fetch_vpc_id(ec2_client, vpc_name)
-    igw_info = ec2_client.describe_internet_gateways(
-        Filters=[{"Name": "attachment.vpc-id", "Values": [vpc_id]}]
-    )["InternetGateways"]
-    igw_id = igw_info[0]["InternetGatewayId"]
+    igw_id = fetch_internet_gateway_id(ec2_client, vpc_name)
     ec2_client.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
     ec2_client.delete_internet_gateway(InternetGatewayId=igw_id)
+    get_cache(ec2_client).invalidate(vpc_name, "internet_gateway")
 
 
 def delete_vpc(ec2_client, vpc_name: str):
@@ -342,6 +498,7 @@ def delete_vpc(ec2_client, vpc_name: str):
     """
     vpc_id = fetch_vpc_id(ec2_client, vpc_name)
     ec2_client.delete_vpc(VpcId=vpc_id)
+    get_cache(ec2_client).invalidate(vpc_name)
 
 
 def _parse_ip_permissions(ingress_ports: List[str]):
@@ -0,0 +1,148 @@
+import random
+import time
+from botocore.exceptions import ClientError
+from typing import Callable, Dict, List
+
+# states from which instance can never reach the target state
+UNREACHABLE_STATES = {
+    "running": {"shutting-down", "terminated"},
+    "stopped": {"shutting-down", "terminated"},
+    "terminated": set(),
+}
+
+
+def wait_for_instance_state(
+        ec2_client,
+        instance_ids: List[str],
+        target_state: str,
+        timeout: float = 600.0,
+        first_delay: float = 0.5,
+        base_delay: float = 1.0,
+        max_delay: float = 15.0,
+) -> Dict[str, dict]:
+    """
+    Wait until every instance reaches target state. Instances that have not reached the state yet are probed together
+    by a single describe call, first after first_delay seconds and then with exponential backoff(base_delay doubled on
+    every probe up to max_delay seconds) where delay is randomly jittered to spread probes of concurrent waiters.
+    :param ec2_client: EC2 client created by boto3 session
+    :param instance_ids: list of instance IDs to wait for
+    :param target_state: one of ('running', 'stopped', 'terminated')
+    :param timeout: seconds to wait until giving up
+    :param first_delay: seconds to wait before the first probe
+    :param base_delay: seconds to wait after the first probe, doubled on each probe
+    :param max_delay: upper bound of seconds to wait between probes
+    :return: description of each instance in target state keyed by instance ID
+    """
+    if target_state not in UNREACHABLE_STATES:
+        raise ValueError(f"target_state must be one of {tuple(UNREACHABLE_STATES)}; got: '{target_state}'")
+    remaining = list(instance_ids)
+    reached: Dict[str, dict] = {}
+
+    def probe() -> bool:
+        for instance_info in _describe_instances(ec2_client, remaining):
+            state = instance_info["State"]["Name"]
+            if state == target_state:
+                reached[instance_info["InstanceId"]] = instance_info
+            elif state in UNREACHABLE_STATES[target_state]:
+                raise ValueError(
+                    f"Instance '{instance_info['InstanceId']}' can not become {target_state}; current state: {state}"
+                )
+        remaining[:] = [instance_id for instance_id in remaining if instance_id not in reached]
+        return not remaining
+
+    if not _poll(probe, timeout, first_delay, base_delay, max_delay):
+        raise TimeoutError(f"Instances {remaining} did not become {target_state} within {timeout} seconds")
+    return reached
+
+
+def wait_for_image_available(
+        ec2_client,
+        image_id: str,
+        timeout: float = 3600.0,
+        first_delay: float = 5.0,
+        base_delay: float = 5.0,
+        max_delay: float = 60.0,
+) -> dict:
+    """
+    Wait until image(AMI) becomes available, probing it with the same backoff as `wait_for_instance_state`. Creating
+    an image takes minutes, so probes are spaced wider by default.
+    :param ec2_client: EC2 client created by boto3 session
+    :param image_id: AMI ID
+    :param timeout: seconds to wait until giving up
+    :param first_delay: seconds to wait before the first probe
+    :param base_delay: seconds to wait after the first probe, doubled on each probe
+    :param max_delay: upper bound of seconds to wait between probes
+    :return: description of the available image
+    """
+    images = []
+
+    def probe() -> bool:
+        images[:] = _describe_images(ec2_client, image_id)
+        state = images[0]["State"] if images else "pending"
+        if state in ("invalid", "deregistered", "failed", "error"):
+            reason = images[0].get("StateReason", {}).get("Message", "unknown reason")
+            raise ValueError(f"Image '{image_id}' can not become available; current state: {state}({reason})")
+        return state == "available"
+
+    if not _poll(probe, timeout, first_delay, base_delay, max_delay):
+        raise TimeoutError(f"Image '{image_id}' did not become available within {timeout} seconds")
+    return images[0]
+
+
+def _poll(probe: Callable[[], bool], timeout: float, first_delay: float, base_delay: float, max_delay: float) -> bool:
+    """
+    Call probe until it returns True, first after first_delay seconds and then with exponential backoff(base_delay
+    doubled on every probe up to max_delay seconds) where delay is randomly jittered to spread probes of concurrent
+    waiters
+    :param probe: function that returns whether waiting is over
+    :param timeout: seconds to wait until giving up
+    :param first_delay: seconds to wait before the first probe
+    :param base_delay: seconds to wait after the first probe, doubled on each probe
+    :param max_delay: upper bound of seconds to wait between probes
+    :return: True if probe returned True, False if timed out
+    """
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    attempt = 0
+    while True:
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        if probe():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        delay = min(max_delay, base_delay * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        attempt += 1
+
+
+def _describe_instances(ec2_client, instance_ids: List[str]) -> List[dict]:
+    """
+    Describe instances in one call. Instance that has just been launched may not be visible to describe call yet, in
+    which case empty list is returned so that caller probes again later.
+    :param ec2_client: EC2 client created by boto3 session
+    :param instance_ids: list of instance IDs
+    :return: list of instance descriptions
+    """
+    try:
+        reservations = ec2_client.describe_instances(InstanceIds=instance_ids)["Reservations"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "InvalidInstanceID.NotFound":
+            return []
+        raise
+    return [instance_info for reservation in reservations for instance_info in reservation["Instances"]]
+
+
+def _describe_images(ec2_client, image_id: str) -> List[dict]:
+    """
+    Describe image. Image that has just been created may not be visible to describe call yet, in which case empty list
+    is returned so that caller probes again later.
+    :param ec2_client: EC2 client created by boto3 session
+    :param image_id: AMI ID
+    :return: list of image descriptions
+    """
+    try:
+        return ec2_client.describe_images(ImageIds=[image_id])["Images"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "InvalidAMIID.NotFound":
+            return []
+        raise
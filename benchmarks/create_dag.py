@@ -0,0 +1,45 @@
+"""
+Compare wall-clock time of `main.py create` steps run one after another against the same steps run as a dependency
+graph, using FakeEC2Client that injects latency into every API call. Run from repository root:
+
+    python -m benchmarks.create_dag --latency 0.2
+"""
+import pathlib
+import tempfile
+import time
+import typer
+import main
+from aws.executor import format_timing_report, run_steps
+from benchmarks.fake_ec2 import FakeEC2Client
+
+
+def run_create(latency: float, max_workers: int) -> float:
+    """
+    Run create steps against a fresh FakeEC2Client
+    :param latency: seconds each fake API call takes
+    :param max_workers: maximum number of steps to run at the same time(1 runs steps one after another)
+    :return: elapsed seconds
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        main.local_dir = pathlib.Path(tmp_dir)
+        ec2_client = FakeEC2Client(latency=latency)
+        steps = main.create_steps(ec2_client)
+        started_at = time.perf_counter()
+        timings = run_steps(steps, max_workers=max_workers)
+        elapsed = time.perf_counter() - started_at
+    print(f"max_workers={max_workers} : {elapsed:.2f}s, {sum(ec2_client.calls.values())} API calls")
+    print(format_timing_report(steps, timings))
+    return elapsed
+
+
+def benchmark(
+        latency: float = typer.Option(0.2, help="seconds each fake API call takes"),
+        max_workers: int = typer.Option(8, help="maximum number of steps to run at the same time"),
+):
+    sequential = run_create(latency, 1)
+    parallel = run_create(latency, max_workers)
+    print(f"speedup : {sequential / parallel:.2f}x")
+
+
+if __name__ == "__main__":
+    typer.run(benchmark)
@@ -0,0 +1,275 @@
+"""
+Measure throughput and memory usage of `preprocess.preprocess_data` on synthetic iris data files, for every engine,
+number of workers and compression level, and save results as JSON to compare runs across commits. Run from repository
+root:
+
+    python -m benchmarks.preprocess_throughput --rows 10000,1000000 --workers 1,4 --output preprocess.json
+
+Every measurement runs in a fresh process, so that peak RSS of one case does not leak into the next one.
+"""
+import datetime
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+import typer
+import config
+from queue import Empty
+from typing import List, Optional
+
+VARIANTS = ("clean", "long-label", "malformed")
+CLASSES = ("Iris-setosa", "Iris-versicolor", "Iris-virginica")
+LONG_LABEL_LENGTH = 256
+MALFORMED_EVERY = 1000  # malformed variant has a blank line before every n-th row
+
+
+def generate_data(file_path: pathlib.Path, num_rows: int, variant: str, seed: int = 0, block_rows: int = 1 << 16):
+    """
+    Write synthetic iris data file whose rows look like rows of iris.data(ex. '5.1,3.5,1.4,0.2,Iris-setosa')
+    :param file_path: path to data file
+    :param num_rows: number of rows
+    :param variant: 'clean', 'long-label'(class label of LONG_LABEL_LENGTH characters) or 'malformed'(blank line
+        before every MALFORMED_EVERY-th row, and the last row lacks a measurement so that preprocessing fails only after
+        reading the whole file)
+    :param seed: seed of random measurements
+    :param block_rows: number of rows written at once
+    :return: None
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"variant must be one of {VARIANTS}; got: '{variant}'")
+    rng = random.Random(seed)
+    labels = CLASSES
+    if variant == "long-label":
+        labels = [label + label.split("-")[1][0] * (LONG_LABEL_LENGTH - len(label)) for label in CLASSES]
+    pool = [
+        f"{rng.randint(43, 79) / 10},{rng.randint(20, 44) / 10},{rng.randint(10, 69) / 10},"
+        f"{rng.randint(1, 25) / 10},{labels[idx % len(labels)]}"
+        for idx in range(4096)
+    ]
+    with open(file_path, "w") as file:
+        for block_start in range(0, num_rows, block_rows):
+            block = rng.choices(pool, k=min(block_rows, num_rows - block_start))
+            if variant == "malformed":
+                for idx in range(-block_start % MALFORMED_EVERY, len(block), MALFORMED_EVERY):
+                    block[idx] = "\n" + block[idx]
+                if block_start + len(block) == num_rows:
+                    block[-1] = block[-1].split(",", 1)[1]
+            file.write("\n".join(block) + "\n")
+
+
+def measure(
+        data_dir: pathlib.Path,
+        engine: str,
+        workers: int,
+        compress_level: Optional[int],
+        max_docs: Optional[int],
+        timeout: float = 3600.0,
+        poll_seconds: float = 1.0,
+) -> dict:
+    """
+    Run `preprocess.preprocess_data` once on data file in data_dir, in a fresh process. Process which exits without
+    result(ex. killed by OOM killer) or runs longer than timeout is recorded as error instead of blocking the benchmark.
+    :param data_dir: directory with data file named config.DATA_FILE
+    :param engine: name of engine(see `preprocess.ENGINES`)
+    :param workers: number of processes used for transformation
+    :param compress_level: gzip compression level(1~9) of output files; not compressed if None
+    :param max_docs: maximum number of documents in each output file; single output file if None
+    :param timeout: seconds to wait for result before the process is killed
+    :param poll_seconds: seconds to wait for result between checks of the process
+    :return: elapsed seconds, output size, peak RSS and error(None if preprocessing succeeded)
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_measure_in_process, args=(queue, data_dir, engine, workers, compress_level, max_docs)
+    )
+    started_at = time.perf_counter()
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=poll_seconds)
+        except Empty:
+            seconds = time.perf_counter() - started_at
+            if process.exitcode is not None:
+                try:
+                    result = queue.get(timeout=poll_seconds)  # result may have been sent right before the exit
+                except Empty:
+                    result = _failed_result(seconds, f"process exited with code {process.exitcode} without result")
+            elif seconds > timeout:
+                process.kill()
+                result = _failed_result(seconds, f"process was killed after {timeout:.0f} seconds")
+    process.join()
+    return result
+
+
+def _failed_result(seconds: float, error: str) -> dict:
+    """
+    :return: result of `measure` whose process did not report its result
+    """
+    return {
+        "seconds": seconds, "output_bytes": 0, "output_files": 0, "error": error,
+        "peak_rss_bytes": None, "peak_worker_rss_bytes": None,
+    }
+
+
+def _measure_in_process(
+        queue,
+        data_dir: pathlib.Path,
+        engine: str,
+        workers: int,
+        compress_level: Optional[int],
+        max_docs: Optional[int],
+):
+    """
+    Body of `measure` run in child process. Peak RSS of worker processes is read after they exit.
+    """
+    import preprocess
+
+    preprocess.data_dir = data_dir
+    result = {"seconds": None, "output_bytes": 0, "output_files": 0, "error": None}
+    started_at = time.perf_counter()
+    try:
+        output_paths = preprocess.preprocess_data(
+            max_docs=max_docs, workers=workers, engine=engine, compress_level=compress_level
+        )
+        result["seconds"] = time.perf_counter() - started_at
+        result["output_bytes"] = sum(output_path.stat().st_size for output_path in output_paths)
+        result["output_files"] = len(output_paths)
+        for output_path in output_paths:
+            output_path.unlink()
+    except Exception as e:
+        result["seconds"] = time.perf_counter() - started_at
+        result["error"] = f"{type(e).__name__}: {e}"
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if platform.system() == "Darwin" else 1024
+    result["peak_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    result["peak_worker_rss_bytes"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    queue.put(result)
+
+
+def run_benchmark(
+        rows: List[int],
+        variants: List[str],
+        engines: List[str],
+        workers: List[int],
+        compress_levels: List[Optional[int]],
+        max_docs: Optional[int] = None,
+        work_dir: Optional[pathlib.Path] = None,
+        timeout: float = 3600.0,
+) -> List[dict]:
+    """
+    Measure every combination of input(number of rows and variant) and mode(engine, workers and compression level)
+    :param rows: numbers of rows of generated data files
+    :param variants: variants of generated data files(see `generate_data`)
+    :param engines: names of engines(see `preprocess.ENGINES`)
+    :param workers: numbers of processes used for transformation
+    :param compress_levels: gzip compression levels, where None stands for no compression
+    :param max_docs: maximum number of documents in each output file; single output file if None
+    :param work_dir: directory to write data files and outputs(temporary directory if not given)
+    :param timeout: seconds to wait for each measurement before its process is killed
+    :return: result of each measurement
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        data_dir = pathlib.Path(tmp_dir)
+        source_path = data_dir.joinpath(config.DATA_FILE)
+        for num_rows in rows:
+            for variant in variants:
+                generate_data(source_path, num_rows, variant)
+                input_bytes = source_path.stat().st_size
+                for engine in engines:
+                    for num_workers in workers:
+                        for compress_level in compress_levels:
+                            result = measure(data_dir, engine, num_workers, compress_level, max_docs, timeout)
+                            seconds = result.pop("seconds")
+                            results.append({
+                                "rows": num_rows,
+                                "variant": variant,
+                                "engine": engine,
+                                "workers": num_workers,
+                                "compress_level": compress_level,
+                                "max_docs": max_docs,
+                                "input_bytes": input_bytes,
+                                "seconds": seconds,
+                                "rows_per_second": None if result["error"] else num_rows / seconds,
+                                "mb_per_second": None if result["error"] else input_bytes / seconds / 1e6,
+                                **result,
+                            })
+                            print(format_result(results[-1]), flush=True)
+        source_path.unlink()
+    return results
+
+
+def format_result(result: dict) -> str:
+    """
+    :param result: one of results of `run_benchmark`
+    :return: one line summary of the result
+    """
+    mode = f"{result['engine']:<6} workers={result['workers']:<2} gzip={result['compress_level'] or '-':<2}"
+    if result["peak_rss_bytes"] is None:
+        rss = "rss       -"
+    else:
+        rss = f"rss {result['peak_rss_bytes'] / 1e6:7.1f}MB(workers {result['peak_worker_rss_bytes'] / 1e6:.1f}MB)"
+    if result["error"]:
+        return f"{result['rows']:>11,} {result['variant']:<10} {mode} {result['seconds']:8.2f}s {rss} {result['error']}"
+    return (
+        f"{result['rows']:>11,} {result['variant']:<10} {mode} {result['seconds']:8.2f}s "
+        f"{result['rows_per_second']:>12,.0f} rows/s {result['mb_per_second']:7.1f} MB/s {rss} "
+        f"output {result['output_bytes'] / 1e6:.1f}MB"
+    )
+
+
+def _environment() -> dict:
+    """
+    :return: commit and machine that results were measured on
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "measured_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def benchmark(
+        rows: str = typer.Option("10000,100000,1000000", help="comma separated numbers of rows(up to 100000000)"),
+        variants: str = typer.Option(",".join(VARIANTS), help="comma separated variants of data files"),
+        engines: str = typer.Option("python,numpy", help="comma separated engines"),
+        workers: str = typer.Option("1", help="comma separated numbers of processes"),
+        compress_levels: str = typer.Option("none", help="comma separated gzip compression levels('none' for plain)"),
+        max_docs: Optional[int] = typer.Option(None, help="maximum number of documents in each output file"),
+        work_dir: Optional[str] = typer.Option(None, help="directory to write data files(temporary directory if not given)"),
+        output: str = typer.Option("preprocess_benchmark.json", help="path to JSON file to save results"),
+        timeout: float = typer.Option(3600.0, help="seconds to wait for each measurement to finish"),
+):
+    results = run_benchmark(
+        rows=[int(float(value)) for value in rows.split(",")],
+        variants=variants.split(","),
+        engines=engines.split(","),
+        workers=[int(value) for value in workers.split(",")],
+        compress_levels=[None if value == "none" else int(value) for value in compress_levels.split(",")],
+        max_docs=max_docs,
+        work_dir=None if work_dir is None else pathlib.Path(work_dir),
+        timeout=timeout,
+    )
+    with open(output, "w") as file:
+        json.dump({"environment": _environment(), "results": results}, file, indent=2)
+    print(f"results saved to '{output}'")
+
+
+if __name__ == "__main__":
+    typer.run(benchmark)
@@ -0,0 +1,238 @@
+"""
+Measure wall time, API calls per operation and sleep time of `main.py create`, `instance` and `delete` commands, and of
+every other function in `aws.vpc` and `aws.ec2`, against FakeEC2Client that injects latency, state transition delay
+and throttling. Run from repository root:
+
+    python -m benchmarks.provisioning --latency 0.05 --transition-delay 1 --throttle-rate 0.05
+"""
+import contextlib
+import io
+import logging
+import pathlib
+import tempfile
+import threading
+import time
+import typer
+import config
+import main
+import aws.ec2 as ec2_commands
+import aws.image as image_commands
+import aws.waiter as waiter
+from aws.cache import get_cache
+from aws.executor import run_steps
+from aws.inventory import load_inventory
+from aws.state import load_state, save_state
+from benchmarks.fake_ec2 import FakeEC2Client
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class ScenarioResult(NamedTuple):
+    """
+    Measurement of a scenario. Calls include throttled attempts, and sleep seconds are summed over threads so they may
+    exceed wall seconds.
+    """
+    name: str
+    wall_seconds: float
+    calls: Dict[str, int]
+    throttled: Dict[str, int]
+    latency_seconds: float
+    retry_sleep_seconds: float
+    waiter_sleep_seconds: float
+
+
+class _SleepMeter:
+    """
+    Stand-in of `time` module for `aws.waiter` that adds up seconds slept between probes
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def sleep(self, seconds: float):
+        with self._lock:
+            self.seconds += seconds
+        time.sleep(seconds)
+
+    def __getattr__(self, name: str):
+        return getattr(time, name)
+
+
+def scenarios(node_count: int) -> List[tuple]:
+    """
+    Commands to run one after another against the same fake account, each of which starts with empty resource ID cache
+    like a new process does
+    :param node_count: number of nodes of the fleet
+    :return: list of (scenario name, function that takes EC2 client)
+    """
+    subnet_names = main._subnet_names()
+    single_node = {
+        "vpc_name": config.VPC_NAME, "subnet_names": subnet_names[:1], "fleet_name": f"{config.INSTANCE_NAME}-single",
+    }
+
+    def create(ec2_client):
+        run_steps(main.create_steps(ec2_client, node_count=node_count))
+        save_state(ec2_client, main.state_path, config.REGION_NAME)
+
+    def converge(ec2_client):
+        run_steps(main.converge_steps(ec2_client, main.create_steps(ec2_client, node_count=node_count), node_count))
+        save_state(ec2_client, main.state_path, config.REGION_NAME)
+
+    def instance(action_type: str) -> Callable:
+        def run(ec2_client):
+            load_state(ec2_client, main.state_path, config.REGION_NAME)
+            if action_type == "describe":
+                ec2_commands.describe_fleet(ec2_client, config.VPC_NAME, subnet_names, config.INSTANCE_NAME)
+            else:
+                ec2_commands.change_fleet_state(
+                    ec2_client, config.VPC_NAME, subnet_names, config.INSTANCE_NAME, action_type
+                )
+        return run
+
+    def single(ec2_client):
+        ec2_commands.run_fleet(
+            ec2_client, main._launch_image_id(ec2_client), config.INSTANCE_TYPE, config.KEY_NAME, node_count=1,
+            **single_node,
+        )
+        ec2_commands.describe_fleet(ec2_client, **single_node)
+        for action_type in ("stop", "start", "reboot", "terminate"):
+            ec2_commands.change_fleet_state(ec2_client, action_type=action_type, **single_node)
+
+    def bake(ec2_client):
+        load_state(ec2_client, main.state_path, config.REGION_NAME)
+        image_commands.bake_image(
+            ec2_client, config.VPC_NAME, subnet_names, config.INSTANCE_NAME, 0, config.IMAGE_NAME,
+            config.INSTANCE_AMI, config.ELK_VERSION,
+        )
+
+    def delete(ec2_client):
+        load_inventory(ec2_client, config.VPC_NAME)
+        timings = run_steps(main.delete_steps(ec2_client), fail_fast=False)
+        failed = {name: timing.error for name, timing in timings.items() if timing.error is not None}
+        if failed:
+            raise ValueError(f"Failed to delete {failed}")
+        save_state(ec2_client, main.state_path, config.REGION_NAME)
+
+    return [
+        ("create", create),
+        ("create --converge", converge),
+        ("instance describe", instance("describe")),
+        ("instance stop", instance("stop")),
+        ("instance start", instance("start")),
+        ("instance reboot", instance("reboot")),
+        ("single node fleet", single),
+        ("image bake", bake),
+        ("delete", delete),
+        ("create from baked image", create),
+        ("delete", delete),
+    ]
+
+
+def run_benchmark(
+        latency: float,
+        transition_delay: float,
+        throttle_rate: float,
+        node_count: int,
+        seed: Optional[int] = None,
+        scenario_count: Optional[int] = None,
+) -> List[ScenarioResult]:
+    """
+    Run every scenario against a fresh FakeEC2Client
+    :param latency: seconds each fake API call takes
+    :param transition_delay: seconds instance stays in transitional state
+    :param throttle_rate: probability that each API call is throttled
+    :param node_count: number of nodes of the fleet
+    :param seed: seed of random throttling
+    :param scenario_count: number of leading scenarios to run(every scenario if not given)
+    :return: measurement of each scenario
+    """
+    ec2_client = FakeEC2Client(
+        latency=latency, transition_delay=transition_delay, throttle_rate=throttle_rate, seed=seed
+    )
+    local_dir, state_path = main.local_dir, main.state_path
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        main.local_dir = pathlib.Path(tmp_dir)
+        main.state_path = main.local_dir.joinpath(config.STATE_FILE)
+        try:
+            results = _run_scenarios(ec2_client, scenarios(node_count)[:scenario_count])
+        finally:
+            main.local_dir, main.state_path = local_dir, state_path
+    return results
+
+
+def _run_scenarios(ec2_client: FakeEC2Client, named_scenarios: List[tuple]) -> List[ScenarioResult]:
+    """
+    Run scenarios one after another, each with empty resource ID cache and fresh counters
+    :param ec2_client: FakeEC2Client shared by every scenario
+    :param named_scenarios: list of (scenario name, function that takes EC2 client)
+    :return: measurement of each scenario
+    """
+    results = []
+    for name, scenario in named_scenarios:
+        get_cache(ec2_client).invalidate()
+        ec2_client.reset_counters()
+        meter = _SleepMeter()
+        waiter.time = meter
+        started_at = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                scenario(ec2_client)
+        finally:
+            waiter.time = time
+        results.append(ScenarioResult(
+            name=name,
+            wall_seconds=time.perf_counter() - started_at,
+            calls=dict(ec2_client.calls),
+            throttled=dict(ec2_client.throttled),
+            latency_seconds=ec2_client.latency_seconds,
+            retry_sleep_seconds=ec2_client.retry_sleep_seconds,
+            waiter_sleep_seconds=meter.seconds,
+        ))
+    return results
+
+
+def format_report(results: List[ScenarioResult]) -> str:
+    """
+    Format summary of each scenario followed by API calls per operation and scenario
+    :param results: result of `run_benchmark`
+    :return: multi-line report
+    """
+    width = max(len(result.name) for result in results)
+    lines = [
+        f"{'scenario':<{width}} {'wall':>8} {'calls':>6} {'throttled':>9} {'latency':>8} {'retry':>8} {'waiter':>8}",
+    ]
+    for result in results:
+        lines.append(
+            f"{result.name:<{width}} {result.wall_seconds:>7.2f}s {sum(result.calls.values()):>6} "
+            f"{sum(result.throttled.values()):>9} {result.latency_seconds:>7.2f}s {result.retry_sleep_seconds:>7.2f}s "
+            f"{result.waiter_sleep_seconds:>7.2f}s"
+        )
+    operations = sorted({operation for result in results for operation in result.calls})
+    op_width = max(len(operation) for operation in operations)
+    columns = [max(len(result.name), 5) for result in results]
+    lines.append("")
+    lines.append(" ".join([f"{'operation':<{op_width}}"] + [
+        f"{result.name:>{column}}" for result, column in zip(results, columns)
+    ]))
+    for operation in operations:
+        lines.append(" ".join([f"{operation:<{op_width}}"] + [
+            f"{result.calls.get(operation, 0) or '':>{column}}" for result, column in zip(results, columns)
+        ]))
+    return "\n".join(lines)
+
+
+def benchmark(
+        latency: float = typer.Option(0.05, help="seconds each fake API call takes"),
+        transition_delay: float = typer.Option(1.0, help="seconds instance stays pending, stopping or shutting-down"),
+        throttle_rate: float = typer.Option(0.0, help="probability that each API call is throttled"),
+        nodes: int = typer.Option(3, help="number of nodes of the fleet"),
+        seed: Optional[int] = typer.Option(None, help="seed of random throttling"),
+):
+    main.logger.setLevel(logging.WARNING)
+    results = run_benchmark(latency, transition_delay, throttle_rate, nodes, seed)
+    print(format_report(results))
+    print(f"total : {sum(result.wall_seconds for result in results):.2f}s")
+
+
+if __name__ == "__main__":
+    typer.run(benchmark)
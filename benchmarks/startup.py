@@ -0,0 +1,77 @@
+"""
+Measure cold start latency of `main.py` commands, each run in a new interpreter as a user would run it, and list
+modules that take the longest to import along with `main`. Run from repository root:
+
+    python -m benchmarks.startup --repeat 10
+"""
+import statistics
+import subprocess
+import sys
+import time
+import typer
+from typing import List, Tuple
+
+# command line arguments of python interpreter; 'import main' is the cost every command pays before it runs
+COMMANDS = {
+    "import main": ["-c", "import main"],
+    "--help": ["main.py", "--help"],
+    "preprocess --help": ["main.py", "preprocess", "--help"],
+    "load --help": ["main.py", "load", "--help"],
+    "create --help": ["main.py", "create", "--help"],
+    "instance --help": ["main.py", "instance", "--help"],
+    "delete --help": ["main.py", "delete", "--help"],
+}
+
+
+def measure_command(args: List[str], repeat: int) -> List[float]:
+    """
+    Run python interpreter with args repeatedly
+    :param args: command line arguments of python interpreter(ex. ['main.py', '--help'])
+    :param repeat: number of runs
+    :return: elapsed seconds of each run
+    """
+    elapsed = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, *args], stdout=subprocess.DEVNULL, check=True)
+        elapsed.append(time.perf_counter() - started_at)
+    return elapsed
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[str, float]]:
+    """
+    Import module in a new interpreter with `-X importtime`
+    :param module: name of module to import
+    :param top: number of modules to return
+    :return: list of (module name, cumulative seconds) of modules that took the longest, excluding module itself
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=True
+    ).stderr
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        imports[name] = max(imports.get(name, 0.0), int(cumulative) / 1e6)
+    imports.pop(module, None)
+    top_level = {name: seconds for name, seconds in imports.items() if "." not in name}
+    return sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def benchmark(
+        repeat: int = typer.Option(10, help="number of runs of each command"),
+        top: int = typer.Option(10, help="number of slowest imports to list"),
+):
+    print(f"{'command':<24} {'min':>8} {'median':>8}")
+    for command, args in COMMANDS.items():
+        elapsed = measure_command(args, repeat)
+        print(f"{command:<24} {min(elapsed) * 1000:>6.0f}ms {statistics.median(elapsed) * 1000:>6.0f}ms")
+    print("\nslowest top-level imports of 'import main' :")
+    for name, seconds in slowest_imports("main", top):
+        print(f"{name:<24} {seconds * 1000:>6.1f}ms")
+
+
+if __name__ == "__main__":
+    typer.run(benchmark)
@@ -0,0 +1,488 @@
+import gzip
+import itertools
+import json
+import pathlib
+import random
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+REQUEST_TIMEOUT = (10, 120)  # seconds to connect and to wait between bytes of response, which grows with batch_bytes
+
+
+def load_data(
+        host: str,
+        file_paths: Iterable[pathlib.Path],
+        workers: int = 4,
+        batch_bytes: int = 5 << 20,
+        max_retries: int = 5,
+        backoff_seconds: float = 0.5,
+        dead_letter_path: Optional[pathlib.Path] = None,
+        compress_level: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    Send preprocessed bulk files to Elasticsearch. Files are read lazily and cut into batches of at most batch_bytes,
+    which are posted concurrently by worker threads sharing a pool of keep-alive connections. At most two batches per
+    worker are kept in memory at a time.
+    Items rejected with retryable status(ex. 429 by es_rejected_execution_exception) are re-sent with exponential
+    backoff, so retry traffic only contains failed documents. Documents rejected permanently, or still rejected after
+    max_retries, are appended to dead_letter_path as newline delimited JSON which can be loaded again later.
+    If compress_level is given, body of each request is compressed by gzip and sent with `Content-Encoding: gzip`.
+    :param host: URL of Elasticsearch node(ex. 'http://127.0.0.1:9200')
+    :param file_paths: paths to newline delimited JSON files written by `preprocess.preprocess_data`
+    :param workers: number of concurrent bulk requests
+    :param batch_bytes: maximum size of body of each bulk request in bytes
+    :param max_retries: maximum number of retries of each document
+    :param backoff_seconds: base of exponential backoff between retries
+    :param dead_letter_path: path to file where rejected documents are written; discarded if not given
+    :param compress_level: gzip compression level(1~9) of request body; not compressed if not given
+    :return: statistics of loading(documents, bytes, retried and failed documents, bytes sent over network, CPU
+        seconds spent on compression, elapsed seconds, docs/s, MB/s)
+    """
+    session = _create_session(workers)
+    url = f"{host.rstrip('/')}/_bulk"
+    if dead_letter_path is not None and dead_letter_path.exists():
+        dead_letter_path.unlink()  # documents rejected in previous run are not part of this run
+    with session:
+        stats = _post_batches(
+            session,
+            url,
+            iter_batches(file_paths, batch_bytes),
+            workers,
+            max_retries,
+            backoff_seconds,
+            dead_letter_path,
+            compress_level,
+        )
+    return stats
+
+
+def autotune_load_data(
+        host: str,
+        file_paths: Iterable[pathlib.Path],
+        tuning_path: pathlib.Path,
+        start_settings: Optional[Dict[str, int]] = None,
+        min_batch_bytes: int = 256 << 10,
+        max_batch_bytes: int = 64 << 20,
+        max_workers: int = 32,
+        batches_per_round: int = 4,
+        max_retries: int = 5,
+        backoff_seconds: float = 0.5,
+        dead_letter_path: Optional[pathlib.Path] = None,
+        compress_level: Optional[int] = None,
+) -> Tuple[Dict[str, int], Dict[str, float]]:
+    """
+    Load bulk files while searching for batch size and concurrency that maximize throughput. Starting from
+    start_settings(a single worker sending min_batch_bytes if not given), each round sends batches_per_round batches
+    per worker and measures throughput. Batch size is doubled while throughput keeps improving by more than 10%, then
+    the number of workers is doubled likewise, until throughput reaches a plateau.
+    Only 429 responses are taken as sign of pressure, since documents rejected for other reasons(ex. 400 by mapping
+    error) fail regardless of load. If a grown setting is throttled, previous settings are restored and tuning stops.
+    If the best settings so far are throttled, the number of workers is halved, or batch size once workers reach one,
+    until a round passes without throttling. Remaining documents are loaded with the chosen settings, which are saved
+    into tuning_path under host so that later runs can start from them(see `load_tuned_settings`).
+    :param host: URL of Elasticsearch node(ex. 'http://127.0.0.1:9200')
+    :param file_paths: paths to newline delimited JSON files written by `preprocess.preprocess_data`
+    :param tuning_path: path to JSON file where tuned settings are saved per host
+    :param start_settings: batch_bytes and workers of the first round(ex. settings tuned by previous run)
+    :param min_batch_bytes: lower bound of batch size in bytes, which is also batch size of the first round if
+        start_settings is not given
+    :param max_batch_bytes: upper bound of batch size in bytes
+    :param max_workers: upper bound of number of concurrent bulk requests
+    :param batches_per_round: number of batches sent by each worker per round
+    :param max_retries: maximum number of retries of each document
+    :param backoff_seconds: base of exponential backoff between retries
+    :param dead_letter_path: path to file where rejected documents are written; discarded if not given
+    :param compress_level: gzip compression level(1~9) of request body; not compressed if not given
+    :return: chosen settings(batch_bytes, workers) and statistics of loading
+    """
+    session = _create_session(max_workers)
+    url = f"{host.rstrip('/')}/_bulk"
+    if dead_letter_path is not None and dead_letter_path.exists():
+        dead_letter_path.unlink()
+    stats = _empty_stats()
+    settings = dict(start_settings or {"batch_bytes": min_batch_bytes, "workers": 1})
+    best_settings, best_throughput = dict(settings), 0.0
+    tuned_key = "batch_bytes"
+    documents = iter_documents(file_paths)
+    start_time = time.perf_counter()
+    with session:
+        while tuned_key is not None:
+            batches, documents = _take_batches(
+                documents, settings["batch_bytes"], settings["workers"] * batches_per_round
+            )
+            if not batches:
+                break
+            round_stats = _post_batches(
+                session,
+                url,
+                batches,
+                settings["workers"],
+                max_retries,
+                backoff_seconds,
+                dead_letter_path,
+                compress_level,
+            )
+            for key in stats:
+                stats[key] += round_stats[key]
+            throughput = round_stats["bytes"] / round_stats["elapsed"] if round_stats["elapsed"] > 0 else 0.0
+            if round_stats["throttled"] > 0:
+                if settings != best_settings:
+                    settings, tuned_key = dict(best_settings), None  # last step went past what the cluster can take
+                else:
+                    settings = _shrink_settings(settings, min_batch_bytes)
+                    tuned_key = "shrink" if settings != best_settings else None
+                    best_settings, best_throughput = dict(settings), 0.0
+                continue
+            if tuned_key == "shrink":
+                break  # shrunk settings are no longer throttled
+            if throughput > best_throughput * 1.1:
+                best_settings, best_throughput = dict(settings), throughput
+            elif tuned_key == "batch_bytes":
+                tuned_key = "workers"
+            else:
+                tuned_key = None
+            settings = dict(best_settings)
+            if tuned_key == "batch_bytes" and settings["batch_bytes"] * 2 <= max_batch_bytes:
+                settings["batch_bytes"] *= 2
+            elif tuned_key is not None and settings["workers"] * 2 <= max_workers:
+                tuned_key = "workers"
+                settings["workers"] *= 2
+            else:
+                tuned_key = None
+        remaining_stats = _post_batches(
+            session,
+            url,
+            _group_batches(documents, best_settings["batch_bytes"]),
+            best_settings["workers"],
+            max_retries,
+            backoff_seconds,
+            dead_letter_path,
+            compress_level,
+        )
+    for key in stats:
+        stats[key] += remaining_stats[key]
+    _summarize_stats(stats, time.perf_counter() - start_time)
+    _save_tuned_settings(tuning_path, host, best_settings)
+    return best_settings, stats
+
+
+def load_tuned_settings(tuning_path: pathlib.Path, host: str) -> Optional[Dict[str, int]]:
+    """
+    Read settings chosen by `autotune_load_data` for the host
+    :param tuning_path: path to JSON file where tuned settings are saved per host
+    :param host: URL of Elasticsearch node
+    :return: dictionary of batch_bytes and workers if host has been tuned, None otherwise
+    """
+    if not tuning_path.exists():
+        return None
+    with open(tuning_path, "r") as file:
+        return json.load(file).get(host.rstrip("/"))
+
+
+def iter_batches(file_paths: Iterable[pathlib.Path], batch_bytes: int) -> Iterator[List[bytes]]:
+    """
+    Group action/source line pairs of bulk files into batches. A document larger than batch_bytes forms a batch alone.
+    :param file_paths: paths to newline delimited JSON files
+    :param batch_bytes: maximum size of each batch in bytes
+    :return: generator of lists of action/source line pairs
+    """
+    return _group_batches(iter_documents(file_paths), batch_bytes)
+
+
+def iter_documents(file_paths: Iterable[pathlib.Path]) -> Iterator[bytes]:
+    """
+    Read bulk files and yield each action line joined with its source line. Files whose name ends with '.gz' are
+    decompressed while being read.
+    :param file_paths: paths to newline delimited JSON files
+    :return: generator of action/source line pairs
+    """
+    for file_path in file_paths:
+        with (gzip.open if file_path.suffix == ".gz" else open)(file_path, "rb") as file:
+            for action_line in file:
+                if not action_line.strip():
+                    continue
+                source_line = file.readline()
+                if not source_line.endswith(b"\n"):
+                    source_line += b"\n"  # bulk request must be terminated by a newline
+                yield action_line + source_line
+
+
+def find_bulk_files(data_dir: pathlib.Path, output_name: str = "iris_data") -> List[pathlib.Path]:
+    """
+    Find bulk files written by `preprocess.preprocess_data`, either single file or numbered files, compressed or not.
+    Outputs of previous runs are removed by each run, so every file found belongs to the latest run.
+    :param data_dir: directory where bulk files are written
+    :param output_name: name of output file without extension
+    :return: sorted list of paths to bulk files
+    """
+    file_paths = sorted(
+        file_path for file_path in data_dir.glob(f"{output_name}.*")
+        if file_path.name.endswith((".json", ".json.gz"))
+    )
+    if not file_paths:
+        raise ValueError(f"No bulk file named '{output_name}' in '{data_dir}'; run preprocess command first")
+    return file_paths
+
+
+def _create_session(workers: int) -> requests.Session:
+    """
+    Create session whose connection pool is large enough to keep a connection alive for every worker
+    :param workers: number of concurrent bulk requests
+    :return: session with resized connection pool
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _post_batches(
+        session: requests.Session,
+        url: str,
+        batches: Iterable[List[bytes]],
+        workers: int,
+        max_retries: int,
+        backoff_seconds: float,
+        dead_letter_path: Optional[pathlib.Path],
+        compress_level: Optional[int],
+) -> Dict[str, float]:
+    """
+    Post batches concurrently, keeping at most two batches per worker in memory
+    :param session: session to send requests with
+    :param url: URL of bulk API
+    :param batches: iterable of lists of action/source line pairs
+    :param workers: number of concurrent bulk requests
+    :param max_retries: maximum number of retries of each document
+    :param backoff_seconds: base of exponential backoff between retries
+    :param dead_letter_path: path to file where rejected documents are appended; discarded if None
+    :param compress_level: gzip compression level(1~9) of request body; not compressed if None
+    :return: statistics of posted batches
+    """
+    stats = _empty_stats()
+    stats_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def post_batch(batch: List[bytes]):
+        try:
+            batch_stats, rejected = _send_batch(session, url, batch, max_retries, backoff_seconds, compress_level)
+            with stats_lock:
+                for key, value in batch_stats.items():
+                    stats[key] += value
+                if rejected and dead_letter_path is not None:
+                    with open(dead_letter_path, "ab") as file:
+                        file.writelines(rejected)
+        finally:
+            in_flight.release()
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for batch in batches:
+            in_flight.acquire()
+            futures.append(executor.submit(post_batch, batch))
+            futures = [future for future in futures if not _raise_if_failed(future)]
+        for future in futures:
+            future.result()
+    _summarize_stats(stats, time.perf_counter() - start_time)
+    return stats
+
+
+def _group_batches(documents: Iterable[bytes], batch_bytes: int) -> Iterator[List[bytes]]:
+    """
+    Group action/source line pairs into batches of at most batch_bytes
+    :param documents: iterable of action/source line pairs
+    :param batch_bytes: maximum size of each batch in bytes
+    :return: generator of lists of action/source line pairs
+    """
+    batch, size = [], 0
+    for document in documents:
+        if batch and size + len(document) > batch_bytes:
+            yield batch
+            batch, size = [], 0
+        batch.append(document)
+        size += len(document)
+    if batch:
+        yield batch
+
+
+def _take_batches(
+        documents: Iterator[bytes],
+        batch_bytes: int,
+        num_batches: int,
+) -> Tuple[List[List[bytes]], Iterator[bytes]]:
+    """
+    Take limited number of batches from documents without losing the document that overflowed the last batch
+    :param documents: iterator of action/source line pairs
+    :param batch_bytes: maximum size of each batch in bytes
+    :param num_batches: number of batches to take
+    :return: list of batches and iterator of remaining documents
+    """
+    batches = []
+    batch, size = [], 0
+    for document in documents:
+        if batch and size + len(document) > batch_bytes:
+            batches.append(batch)
+            batch, size = [], 0
+            if len(batches) == num_batches:
+                return batches, itertools.chain([document], documents)
+        batch.append(document)
+        size += len(document)
+    if batch:
+        batches.append(batch)
+    return batches, documents
+
+
+def _shrink_settings(settings: Dict[str, int], min_batch_bytes: int) -> Dict[str, int]:
+    """
+    :param settings: dictionary of batch_bytes and workers throttled by Elasticsearch
+    :param min_batch_bytes: lower bound of batch size in bytes
+    :return: settings with half of workers, or half of batch size if there is single worker; same settings if neither
+        can be shrunk
+    """
+    settings = dict(settings)
+    if settings["workers"] > 1:
+        settings["workers"] //= 2
+    elif settings["batch_bytes"] // 2 >= min_batch_bytes:
+        settings["batch_bytes"] //= 2
+    return settings
+
+
+def _save_tuned_settings(tuning_path: pathlib.Path, host: str, settings: Dict[str, int]):
+    """
+    Save settings chosen by `autotune_load_data`, keeping settings of other hosts
+    :param tuning_path: path to JSON file where tuned settings are saved per host
+    :param host: URL of Elasticsearch node
+    :param settings: dictionary of batch_bytes and workers
+    :return: None
+    """
+    tuned_settings = {}
+    if tuning_path.exists():
+        with open(tuning_path, "r") as file:
+            tuned_settings = json.load(file)
+    tuned_settings[host.rstrip("/")] = settings
+    with open(tuning_path, "w") as file:
+        json.dump(tuned_settings, file, indent=2)
+
+
+def _empty_stats() -> Dict[str, float]:
+    """
+    Create statistics of loading before any document is sent
+    :return: dictionary of zero counters
+    """
+    return {
+        "docs": 0,
+        "bytes": 0,
+        "retried": 0,
+        "retry_bytes": 0,
+        "throttled": 0,
+        "failed": 0,
+        "sent_bytes": 0,
+        "compress_seconds": 0.0,
+    }
+
+
+def _summarize_stats(stats: Dict[str, float], elapsed: float):
+    """
+    Add elapsed time and throughput to statistics of loading
+    :param stats: statistics containing number of documents and bytes loaded
+    :param elapsed: elapsed seconds
+    :return: None
+    """
+    stats["elapsed"] = elapsed
+    stats["docs_per_sec"] = stats["docs"] / elapsed if elapsed > 0 else 0.0
+    stats["mb_per_sec"] = stats["bytes"] / (1 << 20) / elapsed if elapsed > 0 else 0.0
+
+
+def _send_batch(
+        session: requests.Session,
+        url: str,
+        batch: List[bytes],
+        max_retries: int,
+        backoff_seconds: float,
+        compress_level: Optional[int],
+) -> Tuple[Dict[str, float], List[bytes]]:
+    """
+    Post a batch to bulk API, re-sending only the documents whose items failed with retryable status
+    :param session: session to send requests with
+    :param url: URL of bulk API
+    :param batch: list of action/source line pairs
+    :param max_retries: maximum number of retries
+    :param backoff_seconds: base of exponential backoff between retries
+    :param compress_level: gzip compression level(1~9) of request body; not compressed if None
+    :return: statistics of the batch and list of documents rejected permanently
+    """
+    stats = _empty_stats()
+    headers = {"Content-Type": "application/x-ndjson"}
+    if compress_level is not None:
+        headers["Content-Encoding"] = "gzip"
+    rejected = []
+    pending = batch
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            time.sleep(random.uniform(0, backoff_seconds * 2 ** (attempt - 1)))  # exponential backoff with full jitter
+            stats["retried"] += len(pending)
+            stats["retry_bytes"] += sum(len(document) for document in pending)
+        body = b"".join(pending)
+        if compress_level is not None:
+            start_time = time.thread_time()
+            body = gzip.compress(body, compresslevel=compress_level)
+            stats["compress_seconds"] += time.thread_time() - start_time
+        stats["sent_bytes"] += len(body)
+        try:
+            response = session.post(url, data=body, headers=headers, timeout=REQUEST_TIMEOUT)
+        except (requests.Timeout, requests.ConnectionError):
+            continue  # stalled or dropped request may have indexed part of the batch, so the whole of it is re-sent
+        if response.status_code in RETRYABLE_STATUSES:
+            if response.status_code == 429:
+                stats["throttled"] += len(pending)
+            continue  # whole request was rejected(ex. by circuit breaker), so every document is re-sent
+        response.raise_for_status()
+        retryable = []
+        for document, status in zip(pending, _parse_item_statuses(response.json(), len(pending))):
+            if status < 300:
+                stats["docs"] += 1
+                stats["bytes"] += len(document)
+            elif status in RETRYABLE_STATUSES:
+                retryable.append(document)
+                if status == 429:
+                    stats["throttled"] += 1
+            else:
+                rejected.append(document)
+        pending = retryable
+        if not pending:
+            break
+    rejected.extend(pending)
+    stats["failed"] = len(rejected)
+    return stats, rejected
+
+
+def _parse_item_statuses(bulk_response: dict, num_items: int) -> List[int]:
+    """
+    Parse status of each item of bulk response. Bulk API responds with 200 even if some of items failed, so status of
+    each item, which is given in the same order as the request, has to be inspected.
+    :param bulk_response: parsed body of bulk API response
+    :param num_items: number of documents in the request
+    :return: list of status of each document
+    """
+    if not bulk_response.get("errors", False):
+        return [200] * num_items
+    return [next(iter(item.values())).get("status", 500) for item in bulk_response["items"]]
+
+
+def _raise_if_failed(future) -> bool:
+    """
+    Check whether submitted request is finished, re-raising its exception so that loading stops at the first failure
+    :param future: future of submitted bulk request
+    :return: whether the request is finished
+    """
+    if future.done():
+        future.result()
+        return True
+    return False
@@ -4,14 +4,19 @@ VPC_NAME = "elkvpc"
 VPC_CIDR = "172.40.0.0/16"
 INGRESS_PORTS = "22,80,443,5601"  # 443: HTTPS, 5601: Kibana
 
-SUBNET_NAME = "pub-a"
-CIDR_SUBSTITUTE = "11"
+SUBNET_NAMES = "pub-a"  # comma separated(ex. "pub-a,pub-c"); postfix of each name is availability zone of the subnet
+CIDR_SUBSTITUTE = "11"  # subnets take /24 blocks of VPC CIDR from this block on(ex. 172.40.11.0/24, 172.40.12.0/24)
 ROUTE_TABLE_NAME = "rt-pub"
 
 KEY_NAME = "awselk"
+STATE_FILE = "awselk.state.json"  # IDs of created resources, saved next to key pair file
 INSTANCE_NAME = "elk-server"
+NODE_COUNT = 1  # number of Elasticsearch nodes launched under INSTANCE_NAME(ex. 3~9 for a cluster)
 INSTANCE_TYPE = "t2.medium"
 INSTANCE_AMI = "ami-04341a215040f91bb"  # ami of x86 Ubuntu 20.04 image
+ELK_VERSION = "7.2.0"  # version of ELK packages installed on instance(see README)
+IMAGE_NAME = "elk-server-image"  # name tag value of AMIs baked by `image bake` command
 
 DATA_URL = "https://archive.ics.uci.edu/static/public/53/iris.zip"
-ARCHIVE_NAME = DATA_URL.split("/")[-1]
\ No newline at end of file
+ARCHIVE_NAME = DATA_URL.split("/")[-1]
+DATA_FILE = "iris.data"  # member of the archive to be preprocessed
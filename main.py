@@ -1,11 +1,20 @@
-import boto3
+import contextlib
+import io
 import pathlib
 import config
-import preprocess
 import logging
-import aws.ec2 as ec2_commands
-import aws.vpc as vpc_commands
+import os
+import shlex
+import threading
+import traceback
+from aws.cache import ResourceNotFoundError, get_cache
+from aws.executor import Step, format_timing_report, run_steps
+from aws.inventory import load_inventory
+from aws.state import load_state, save_state
+from aws.trace import ApiTracer
 import typer
+from functools import partial
+from typing import Callable, Dict, List, Optional
 
 app = typer.Typer()
 formatter = logging.Formatter(
@@ -18,181 +27,688 @@ logger = logging.getLogger(__name__)
 logger.addHandler(stream_handler)
 logger.setLevel(logging.INFO)
 local_dir = pathlib.Path(pathlib.os.getcwd())
+state_path = local_dir.joinpath(config.STATE_FILE)
+_clients = {}  # EC2 clients keyed by profile and region, reused by commands run within `shell` command
+_clients_lock = threading.Lock()
+_MUTATING_COMMANDS = ("create", "delete", "image")  # commands after which `shell` command clears resource ID caches
 
 
-@app.command("create")
-def create_workspace_environment(profile_name: str = typer.Argument(...)):
-    session = boto3.Session(
-        profile_name=profile_name, 
-        region_name=config.REGION_NAME,
-    )
-    ec2_client = session.client("ec2")
+def _ec2_client(profile_name: str):
+    """
+    Create EC2 client of the profile, or return the one created by previous command of the same process(see `shell`
+    command), which has already resolved credentials and keeps connections to the endpoint open. boto3 is imported here
+    instead of at the top of the module, since importing it takes hundreds of milliseconds that commands not calling
+    AWS API(ex. preprocess, load, --help) should not pay for.
+    :param profile_name: name of AWS profile
+    :return: EC2 client
+    """
+    key = (profile_name, config.REGION_NAME)
+    with _clients_lock:
+        if key not in _clients:
+            import boto3
 
-    logger.info("Create VPC")
-    vpc_commands.create_vpc(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
+            session = boto3.Session(
+                profile_name=profile_name, 
+                region_name=config.REGION_NAME,
+            )
+            _clients[key] = session.client("ec2")
+        return _clients[key]
+
+
+def _subnet_names() -> List[str]:
+    """
+    :return: names of subnets listed in config.SUBNET_NAMES, or config.SUBNET_NAME of config written before subnets
+        could be spread over availability zones
+    """
+    if not hasattr(config, "SUBNET_NAMES") and hasattr(config, "SUBNET_NAME"):
+        logger.warning("SUBNET_NAME in config.py is deprecated; rename it to SUBNET_NAMES(comma separated names)")
+        return [config.SUBNET_NAME]
+    return config.SUBNET_NAMES.split(",")
+
+
+def create_steps(ec2_client, node_count: int = config.NODE_COUNT) -> List[Step]:
+    """
+    Steps to create workspace environment, with dependencies between them. Subnets and their route table associations
+    are created by separate steps per availability zone.
+    :param ec2_client: EC2 client created by boto3 session
+    :param node_count: number of instances to launch
+    :return: list of steps to be run by `aws.executor.run_steps`
+    """
+    import aws.ec2 as ec2_commands
+    import aws.vpc as vpc_commands
+
+    subnet_names = _subnet_names()
+    subnet_cidrs = vpc_commands.allocate_subnet_cidrs(
         vpc_cidr=config.VPC_CIDR,
+        subnet_count=len(subnet_names),
+        first_index=int(config.CIDR_SUBSTITUTE),
     )
-    vpc_commands.create_vpc_security_group(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        ingress_ports=config.INGRESS_PORTS.split(","),
-    )
-    vpc_commands.create_vpc_internet_gateway(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-    )
+    subnet_steps = [
+        Step(f"subnet:{subnet_name}", partial(
+            vpc_commands.create_subnet,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_name=subnet_name,
+            cidr_block=cidr_block,
+            region_name=config.REGION_NAME,
+            az_postfix=subnet_name.split("-")[1],
+            is_public=True,
+        ), ("vpc",))
+        for subnet_name, cidr_block in zip(subnet_names, subnet_cidrs)
+    ]
+    association_steps = [
+        Step(f"route_table_association:{subnet_name}", partial(
+            vpc_commands.create_route_table_subnet_association,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_name=subnet_name,
+            rt_name=config.ROUTE_TABLE_NAME,
+        ), (f"subnet:{subnet_name}", "route_table"))
+        for subnet_name in subnet_names
+    ]
+    return [
+        Step("vpc", partial(
+            vpc_commands.create_vpc,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            vpc_cidr=config.VPC_CIDR,
+        )),
+        Step("security_group", partial(
+            vpc_commands.create_vpc_security_group,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            ingress_ports=config.INGRESS_PORTS.split(","),
+        ), ("vpc",)),
+        Step("internet_gateway", partial(
+            vpc_commands.create_vpc_internet_gateway,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+        ), ("vpc",)),
+        *subnet_steps,
+        Step("route_table", partial(
+            vpc_commands.create_route_table,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            rt_name=config.ROUTE_TABLE_NAME,
+            is_public=True,
+        ), ("internet_gateway",)),
+        *association_steps,
+        Step("key_pair", partial(
+            ec2_commands.create_key_pair,
+            ec2_client=ec2_client,
+            key_name=config.KEY_NAME,
+            local_dir=local_dir,
+        )),
+        Step("image", partial(_launch_image_id, ec2_client), ("vpc",)),  # create_vpc clears cache of the VPC
+        Step("instance", lambda: ec2_commands.run_fleet(
+            ec2_client=ec2_client,
+            image_id=_launch_image_id(ec2_client),
+            instance_type=config.INSTANCE_TYPE,
+            key_name=config.KEY_NAME,
+            vpc_name=config.VPC_NAME,
+            subnet_names=subnet_names,
+            fleet_name=config.INSTANCE_NAME,
+            node_count=node_count,
+        ), ("image", "key_pair", "security_group", *(step.name for step in subnet_steps))),
+        Step("describe", partial(
+            ec2_commands.describe_fleet,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_names=subnet_names,
+            fleet_name=config.INSTANCE_NAME,
+        ), ("instance", *(step.name for step in association_steps))),
+    ]
 
-    logger.info("Define subnet within created VPC")
-    vpc_commands.create_subnet(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        cidr_substitute=config.CIDR_SUBSTITUTE,
-        region_name=config.REGION_NAME,
-        az_postfix=config.SUBNET_NAME.split("-")[1],
-        is_public=True,
-    )
-    vpc_commands.create_route_table(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        rt_name=config.ROUTE_TABLE_NAME,
-        is_public=True,
-    )
-    vpc_commands.create_route_table_subnet_association(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        rt_name=config.ROUTE_TABLE_NAME,
-    )
 
-    logger.info("Create EC2 instance within defined subnet")
-    ec2_commands.create_key_pair(
-        ec2_client=ec2_client,
-        key_name=config.KEY_NAME,
-        local_dir=local_dir,
-    )
-    ec2_commands.run_instance(
-        ec2_client=ec2_client,
-        image_id=config.INSTANCE_AMI,
-        instance_type=config.INSTANCE_TYPE,
-        key_name=config.KEY_NAME,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        instance_name=config.INSTANCE_NAME,
-    )
-    ec2_commands.describe_instance(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        instance_name=config.INSTANCE_NAME,
+def _launch_image_id(ec2_client) -> str:
+    """
+    :param ec2_client: EC2 client created by boto3 session
+    :return: ID of image baked by `image bake` command for current ELK version and base image, or config.INSTANCE_AMI
+        if there is no such image
+    """
+    import aws.image as image_commands
+
+    return image_commands.fetch_image_id(
+        ec2_client, config.VPC_NAME, config.IMAGE_NAME, config.INSTANCE_AMI, config.ELK_VERSION
     )
 
 
-@app.command("instance")
-def manage_instance(action_type: str = typer.Argument(...), profile_name: str = typer.Argument(...)):
-    session = boto3.Session(
-        profile_name=profile_name, 
-        region_name=config.REGION_NAME,
-    )
-    ec2_client = session.client("ec2")
+def converge_steps(ec2_client, steps: List[Step], node_count: int = config.NODE_COUNT) -> List[Step]:
+    """
+    Compare steps of `create_steps` against resources that already exist, based on inventory of VPC. Steps whose
+    resources exist are replaced by steps that only finish configuration the resources are missing(ex. ingress rules
+    of security group whose creation was interrupted), and instance step only launches missing nodes of the fleet.
+    :param ec2_client: EC2 client created by boto3 session
+    :param steps: result of `create_steps`
+    :param node_count: number of instances of the fleet
+    :return: list of steps to be run by `aws.executor.run_steps`
+    """
+    import aws.ec2 as ec2_commands
+    import aws.vpc as vpc_commands
 
-    if action_type.lower() == "start":
-        ec2_commands.start_instance(
+    existing = _existing_steps(ec2_client, load_inventory(ec2_client, config.VPC_NAME))
+    converged = []
+    for step in steps:
+        if step.name == "instance":
+            step = step._replace(func=lambda: ec2_commands.converge_fleet(
+                ec2_client=ec2_client,
+                image_id=_launch_image_id(ec2_client),
+                instance_type=config.INSTANCE_TYPE,
+                key_name=config.KEY_NAME,
+                vpc_name=config.VPC_NAME,
+                subnet_names=_subnet_names(),
+                fleet_name=config.INSTANCE_NAME,
+                node_count=node_count,
+            ))
+        elif step.name in existing:
+            logger.info(f"Skip creating resource of step '{step.name}' since it already exists")
+            step = step._replace(func=existing[step.name])
+        elif step.name == "internet_gateway" and "vpc" in existing:
+            step = step._replace(func=partial(
+                vpc_commands.converge_vpc_internet_gateway, ec2_client=ec2_client, vpc_name=config.VPC_NAME
+            ))
+        converged.append(step)
+    return converged
+
+
+def _existing_steps(ec2_client, inventory: Dict[str, Dict[str, List[dict]]]) -> Dict[str, Callable[[], None]]:
+    """
+    :param ec2_client: EC2 client created by boto3 session
+    :param inventory: result of `aws.inventory.load_inventory`
+    :return: names of steps of `create_steps` whose resources already exist, mapped to functions that finish
+        configuration of the resources
+    """
+    import aws.vpc as vpc_commands
+
+    existing = {}
+    key_pairs = ec2_client.describe_key_pairs(
+        Filters=[{"Name": "key-name", "Values": [config.KEY_NAME]}]
+    )["KeyPairs"]
+    if key_pairs:
+        if not local_dir.joinpath(f"{config.KEY_NAME}.pem").exists():
+            raise ValueError(
+                f"Key pair '{config.KEY_NAME}' exists but its file is missing from '{local_dir}'; delete the key pair"
+            )
+        existing["key_pair"] = lambda: None
+    vpcs = inventory["vpc"][config.VPC_NAME]
+    if len(vpcs) > 1:
+        raise ValueError(f"VPC whose name tag value is '{config.VPC_NAME}' is ambiguous; delete duplicated VPCs")
+    elif len(vpcs) == 0:
+        return existing
+    existing["vpc"] = lambda: None
+    security_groups = inventory["security_group"].get(f"{config.VPC_NAME.replace('_', '-')}-sg")
+    if security_groups:
+        existing["security_group"] = partial(
+            vpc_commands.converge_vpc_security_group,
             ec2_client=ec2_client,
-            vpc_name=config.VPC_NAME,
-            subnet_name=config.SUBNET_NAME,
-            instance_name=config.INSTANCE_NAME,
+            security_group=security_groups[0],
+            ingress_ports=config.INGRESS_PORTS.split(","),
         )
-    elif action_type.lower() == "stop":
-        ec2_commands.stop_instance(
+    if inventory["internet_gateway"]:
+        existing["internet_gateway"] = lambda: None
+    subnet_names = {}
+    for subnet_name, subnets in inventory["subnet"].items():
+        existing[f"subnet:{subnet_name}"] = partial(
+            vpc_commands.converge_subnet, ec2_client=ec2_client, subnet=subnets[0], is_public=True
+        )
+        subnet_names.update({subnet["SubnetId"]: subnet_name for subnet in subnets})
+    for route_table in inventory["route_table"].get(config.ROUTE_TABLE_NAME, [])[:1]:
+        existing["route_table"] = partial(
+            vpc_commands.converge_route_table,
             ec2_client=ec2_client,
             vpc_name=config.VPC_NAME,
-            subnet_name=config.SUBNET_NAME,
-            instance_name=config.INSTANCE_NAME,
+            route_table=route_table,
+            is_public=True,
         )
-    elif action_type.lower() == "reboot":
-        ec2_commands.reboot_instance(
+        for association in route_table["Associations"]:
+            if association.get("SubnetId") in subnet_names:
+                existing[f"route_table_association:{subnet_names[association['SubnetId']]}"] = lambda: None
+    return existing
+
+
+@app.command("create")
+def create_workspace_environment(
+        profile_name: str = typer.Argument(...),
+        max_workers: int = typer.Option(8, help="maximum number of provisioning steps to run at the same time"),
+        nodes: int = typer.Option(config.NODE_COUNT, help="number of Elasticsearch nodes to launch"),
+        converge: bool = typer.Option(False, help="skip resources that already exist and create only missing ones"),
+        trace: bool = typer.Option(False, help="record every API call and print summary per operation and step"),
+        trace_file: Optional[str] = typer.Option(None, help="save recorded API calls as Chrome trace JSON file"),
+):
+    ec2_client = _ec2_client(profile_name)
+    tracer = _start_trace(ec2_client, trace or trace_file is not None)
+
+    logger.info("Create VPC, subnet and EC2 instance within the subnet")
+    steps = create_steps(ec2_client, node_count=nodes)
+    if converge:
+        steps = converge_steps(ec2_client, steps, node_count=nodes)
+    if tracer is not None:
+        steps = [tracer.wrap_step(step) for step in steps]
+    try:
+        timings = run_steps(steps, max_workers=max_workers)
+    finally:
+        save_state(ec2_client, state_path, config.REGION_NAME)
+        _report_trace(tracer, trace_file)
+    logger.info(f"Timing of each step('*' marks critical path) :\n{format_timing_report(steps, timings)}")
+    image_id = _launch_image_id(ec2_client)
+    logger.info(f"Nodes are launched from {'base' if image_id == config.INSTANCE_AMI else 'baked'} image '{image_id}'")
+    logger.info(f"Resource ID lookups : {get_cache(ec2_client).summary()}")
+
+
+@app.command("instance")
+def manage_instance(
+        action_type: str = typer.Argument(...),
+        profile_name: str = typer.Argument(...),
+        trace: bool = typer.Option(False, help="record every API call and print summary per operation and step"),
+        trace_file: Optional[str] = typer.Option(None, help="save recorded API calls as Chrome trace JSON file"),
+):
+    import aws.ec2 as ec2_commands
+    from botocore.exceptions import ClientError
+
+    ec2_client = _ec2_client(profile_name)
+    if action_type.lower() in ("start", "stop", "reboot"):
+        action = partial(
+            ec2_commands.change_fleet_state,
             ec2_client=ec2_client,
             vpc_name=config.VPC_NAME,
-            subnet_name=config.SUBNET_NAME,
-            instance_name=config.INSTANCE_NAME,
+            subnet_names=_subnet_names(),
+            fleet_name=config.INSTANCE_NAME,
+            action_type=action_type.lower(),
         )
     elif action_type.lower() == "describe":
-        ec2_commands.describe_instance(
+        action = partial(
+            ec2_commands.describe_fleet,
             ec2_client=ec2_client,
             vpc_name=config.VPC_NAME,
-            subnet_name=config.SUBNET_NAME,
-            instance_name=config.INSTANCE_NAME,
+            subnet_names=_subnet_names(),
+            fleet_name=config.INSTANCE_NAME,
         )
     else:
         raise ValueError(
             f"action_type must be one of ('start', 'stop', 'reboot', 'describe'); got: '{action_type}'"
         )
+    tracer = _start_trace(ec2_client, trace or trace_file is not None)
+    try:
+        if load_state(ec2_client, state_path, config.REGION_NAME) == 0:
+            action()
+        else:
+            try:
+                action()
+            except (ResourceNotFoundError, ClientError) as e:
+                if isinstance(e, ClientError) and not e.response["Error"]["Code"].endswith(".NotFound"):
+                    raise
+                logger.info(f"Saved resource IDs are stale({e}); look them up again")
+                get_cache(ec2_client).invalidate(config.VPC_NAME)
+                action()
+        save_state(ec2_client, state_path, config.REGION_NAME)
+    except ResourceNotFoundError:
+        if action_type.lower() != "describe":
+            raise
+        print("Instance has not been created yet")
+    finally:
+        _report_trace(tracer, trace_file)
+
+
+def delete_steps(ec2_client) -> List[Step]:
+    """
+    Steps to delete workspace environment. Each step depends on steps that delete resources blocking its deletion, which
+    is the reverse of `create_steps` except that key pair and route table association do not wait for the instance.
+    Resources that no longer exist are skipped, so that partially failed deletion can be run again.
+    :param ec2_client: EC2 client created by boto3 session
+    :return: list of steps to be run by `aws.executor.run_steps`
+    """
+    import aws.ec2 as ec2_commands
+    import aws.vpc as vpc_commands
+
+    subnet_names = _subnet_names()
+    association_steps = [
+        Step(f"route_table_association:{subnet_name}", _skip_missing(partial(
+            vpc_commands.delete_route_table_subnet_association,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_name=subnet_name,
+            rt_name=config.ROUTE_TABLE_NAME,
+        )))
+        for subnet_name in subnet_names
+    ]
+    subnet_steps = [
+        Step(f"subnet:{subnet_name}", _skip_missing(partial(
+            vpc_commands.delete_subnet,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_name=subnet_name,
+        )), ("instance", f"route_table_association:{subnet_name}"))
+        for subnet_name in subnet_names
+    ]
+    return [
+        Step("instance", _skip_missing(partial(
+            ec2_commands.change_fleet_state,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            subnet_names=subnet_names,
+            fleet_name=config.INSTANCE_NAME,
+            action_type="terminate",
+        ))),
+        Step("key_pair", _skip_missing(partial(
+            ec2_commands.delete_key_pair,
+            ec2_client=ec2_client,
+            key_name=config.KEY_NAME,
+            local_dir=local_dir,
+        ))),
+        *association_steps,
+        Step("route_table", _skip_missing(partial(
+            vpc_commands.delete_route_table,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+            rt_name=config.ROUTE_TABLE_NAME,
+        )), tuple(step.name for step in association_steps)),
+        *subnet_steps,
+        Step("security_group", _skip_missing(partial(
+            vpc_commands.delete_vpc_security_group,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+        )), ("instance",)),
+        Step("internet_gateway", _skip_missing(partial(
+            vpc_commands.delete_vpc_internet_gateway,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+        )), ("instance",)),
+        Step("vpc", _skip_missing(partial(
+            vpc_commands.delete_vpc,
+            ec2_client=ec2_client,
+            vpc_name=config.VPC_NAME,
+        )), ("route_table", "security_group", "internet_gateway", *(step.name for step in subnet_steps))),
+    ]
+
+
+def _skip_missing(func: Callable[[], None]) -> Callable[[], None]:
+    """
+    Wrap deletion so that resource which does not exist(already deleted or never created) is logged and skipped
+    :param func: function that deletes a resource
+    :return: function that ignores missing resource
+    """
+    from botocore.exceptions import ClientError
+
+    def delete_if_exists():
+        try:
+            func()
+        except ResourceNotFoundError as e:
+            logger.info(f"Skip deletion : {e}")
+        except ClientError as e:
+            if not e.response["Error"]["Code"].endswith(".NotFound"):
+                raise
+            logger.info(f"Skip deletion : {e.response['Error']['Message']}")
+
+    return delete_if_exists
 
 
 @app.command("delete")
-def delete_workspace_environment(profile_name: str = typer.Argument(...)):
-    session = boto3.Session(
-        profile_name=profile_name, 
-        region_name=config.REGION_NAME,
-    )
-    ec2_client = session.client("ec2")
+def delete_workspace_environment(
+        profile_name: str = typer.Argument(...),
+        max_workers: int = typer.Option(8, help="maximum number of deletion steps to run at the same time"),
+        trace: bool = typer.Option(False, help="record every API call and print summary per operation and step"),
+        trace_file: Optional[str] = typer.Option(None, help="save recorded API calls as Chrome trace JSON file"),
+):
+    ec2_client = _ec2_client(profile_name)
+    tracer = _start_trace(ec2_client, trace or trace_file is not None)
+    try:
+        load_inventory(ec2_client, config.VPC_NAME)
 
-    logger.info("Terminate EC2 instance and delete corresponding key pair")
-    ec2_commands.terminate_instance(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        instance_name=config.INSTANCE_NAME,
-    )
-    ec2_commands.delete_key_pair(
-        ec2_client=ec2_client,
-        key_name=config.KEY_NAME,
-        local_dir=local_dir,
-    )
+        logger.info("Delete EC2 instance, subnet and VPC where the subnet was created")
+        steps = delete_steps(ec2_client)
+        if tracer is not None:
+            steps = [tracer.wrap_step(step) for step in steps]
+        timings = run_steps(steps, max_workers=max_workers, fail_fast=False)
+    finally:
+        _report_trace(tracer, trace_file)
+    logger.info(f"Timing of each step('*' marks critical path) :\n{format_timing_report(steps, timings)}")
+    logger.info(f"Resource ID lookups : {get_cache(ec2_client).summary()}")
+    save_state(ec2_client, state_path, config.REGION_NAME)
+    failed = [name for name, timing in timings.items() if timing.error is not None]
+    if failed:
+        logger.error(f"Failed to delete {failed}; run delete command again after fixing the cause")
+        raise typer.Exit(code=1)
 
-    logger.info("Delete resources of subnet where terminated instance was created")
-    vpc_commands.delete_route_table_subnet_association(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-        rt_name=config.ROUTE_TABLE_NAME,
-    )
-    vpc_commands.delete_route_table(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        rt_name=config.ROUTE_TABLE_NAME,
-    )
-    vpc_commands.delete_subnet(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-        subnet_name=config.SUBNET_NAME,
-    )
 
-    logger.info("Delete resources of VPC where deleted subnet was created")
-    vpc_commands.delete_vpc_security_group(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-    )
-    vpc_commands.delete_vpc_internet_gateway(
-        ec2_client=ec2_client,
-        vpc_name=config.VPC_NAME,
-    )
-    vpc_commands.delete_vpc(
+image_app = typer.Typer(help="Bake ELK stack installed on a node into an image to launch nodes from")
+app.add_typer(image_app, name="image")
+
+
+@image_app.command("bake")
+def bake_image(
+        profile_name: str = typer.Argument(...),
+        node: int = typer.Option(0, help="node index of the instance on which ELK stack has been installed"),
+        reboot: bool = typer.Option(True, help="reboot the node while creating image to keep file system consistent"),
+):
+    import aws.image as image_commands
+
+    ec2_client = _ec2_client(profile_name)
+    load_state(ec2_client, state_path, config.REGION_NAME)
+    logger.info(f"Bake ELK {config.ELK_VERSION} installed on node {node} into image; this takes several minutes")
+    image_id = image_commands.bake_image(
         ec2_client=ec2_client,
         vpc_name=config.VPC_NAME,
+        subnet_names=_subnet_names(),
+        fleet_name=config.INSTANCE_NAME,
+        node_index=node,
+        image_name=config.IMAGE_NAME,
+        base_image_id=config.INSTANCE_AMI,
+        elk_version=config.ELK_VERSION,
+        reboot=reboot,
     )
+    save_state(ec2_client, state_path, config.REGION_NAME)
+    logger.info(f"Image '{image_id}' is available; create command launches nodes from it from now on")
+
+
+@image_app.command("clean")
+def clean_images(profile_name: str = typer.Argument(...)):
+    import aws.image as image_commands
+
+    ec2_client = _ec2_client(profile_name)
+    image_ids = image_commands.deregister_images(ec2_client, config.IMAGE_NAME)
+    logger.info(f"Deregistered {len(image_ids)} image(s) along with their snapshots : {image_ids}")
+
+
+def _start_trace(ec2_client, enabled: bool) -> Optional[ApiTracer]:
+    """
+    :param ec2_client: EC2 client created by boto3 session
+    :param enabled: whether to trace API calls
+    :return: tracer attached to the client, or None if tracing is not enabled
+    """
+    if not enabled:
+        return None
+    tracer = ApiTracer()
+    tracer.attach(ec2_client)
+    return tracer
+
+
+def _report_trace(tracer: Optional[ApiTracer], trace_file: Optional[str]):
+    """
+    Detach tracer from the client, log summary of traced API calls and save them as Chrome trace JSON file if
+    trace_file is given
+    :param tracer: result of `_start_trace`
+    :param trace_file: path to Chrome trace JSON file
+    :return: None
+    """
+    if tracer is None:
+        return
+    tracer.detach()
+    logger.info(f"Traced {len(tracer.calls)} API calls :\n{tracer.summary()}")
+    if trace_file is not None:
+        tracer.dump_chrome_trace(pathlib.Path(trace_file))
+        logger.info(f"Chrome trace saved to '{trace_file}'(open it with chrome://tracing or https://ui.perfetto.dev)")
 
 
 @app.command("preprocess")
-def prepare_example_data():
+def prepare_example_data(
+        max_bytes: Optional[int] = typer.Option(None, help="roll over to numbered bulk file after this many bytes"),
+        max_docs: Optional[int] = typer.Option(None, help="roll over to numbered bulk file after this many documents"),
+        workers: int = typer.Option(1, help="number of processes used for transformation"),
+        engine: str = typer.Option("python", help="'python' or 'numpy'(requires numpy to be installed)"),
+        compress_level: Optional[int] = typer.Option(None, help="write bulk files compressed by gzip at this level"),
+        refresh: bool = typer.Option(False, help="check whether cached copy of source data is outdated"),
+        extract: bool = typer.Option(False, help="unpack every file of source archive into data directory"),
+):
+    import preprocess
+
     logger.info("Download iris data from source")
-    preprocess.download_data()
+    if not preprocess.download_data(refresh=refresh, extract=extract):
+        logger.info("Cached copy of source data is up to date")
 
     logger.info("Transform data into Elasticsearch compatible format")
-    preprocess.preprocess_data()
+    output_paths = preprocess.preprocess_data(
+        max_bytes=max_bytes,
+        max_docs=max_docs,
+        workers=workers,
+        engine=engine,
+        compress_level=compress_level,
+    )
+    logger.info(f"{len(output_paths)} bulk file(s) written to {preprocess.data_dir}")
+
+
+@app.command("load")
+def load_example_data(
+        host: str = typer.Option("http://127.0.0.1:9200", help="URL of Elasticsearch node"),
+        workers: Optional[int] = typer.Option(None, help="number of concurrent bulk requests"),
+        batch_bytes: Optional[int] = typer.Option(None, help="maximum size of each bulk request in bytes"),
+        max_retries: int = typer.Option(5, help="maximum number of retries of rejected documents"),
+        autotune: bool = typer.Option(False, help="search for batch size and concurrency while loading"),
+        compress_level: Optional[int] = typer.Option(None, help="send bulk requests compressed by gzip at this level"),
+):
+    import bulk
+    import preprocess
+
+    file_paths = bulk.find_bulk_files(preprocess.data_dir)
+    dead_letter_path = preprocess.data_dir.joinpath("dead_letter.json")
+    tuning_path = preprocess.data_dir.joinpath("bulk_tuning.json")
+    if autotune:
+        logger.info(f"Load {len(file_paths)} bulk file(s) into {host} while tuning bulk settings")
+        settings, stats = bulk.autotune_load_data(
+            host=host,
+            file_paths=file_paths,
+            tuning_path=tuning_path,
+            start_settings=bulk.load_tuned_settings(tuning_path, host),
+            max_retries=max_retries,
+            dead_letter_path=dead_letter_path,
+            compress_level=compress_level,
+        )
+        logger.info(f"Chosen settings saved to {tuning_path} : {settings}")
+    else:
+        settings = bulk.load_tuned_settings(tuning_path, host) or {"workers": 4, "batch_bytes": 5 << 20}
+        settings["workers"] = workers or settings["workers"]
+        settings["batch_bytes"] = batch_bytes or settings["batch_bytes"]
+        logger.info(f"Load {len(file_paths)} bulk file(s) into {host} : {settings}")
+        stats = bulk.load_data(
+            host=host,
+            file_paths=file_paths,
+            workers=settings["workers"],
+            batch_bytes=settings["batch_bytes"],
+            max_retries=max_retries,
+            dead_letter_path=dead_letter_path,
+            compress_level=compress_level,
+        )
+    logger.info(
+        f"{stats['docs']} documents loaded in {stats['elapsed']:.2f}s : "
+        f"{stats['docs_per_sec']:.0f} docs/s, {stats['mb_per_sec']:.2f} MB/s"
+    )
+    if compress_level is not None:
+        logger.info(
+            f"{stats['sent_bytes']} bytes sent for {stats['bytes'] + stats['retry_bytes']} bytes of requests "
+            f"using {stats['compress_seconds']:.2f} CPU seconds for compression"
+        )
+    if stats["retried"] > 0:
+        logger.info(f"{stats['retried']} documents({stats['retry_bytes']} bytes) were retried")
+    if stats["failed"] > 0:
+        logger.info(f"{stats['failed']} documents were rejected; see {dead_letter_path}")
+
+
+@app.command("shell")
+def run_shell(
+        socket_path: Optional[str] = typer.Option(None, "--socket", help="serve commands over this unix socket"),
+):
+    """
+    Run commands of this CLI(ex. 'instance describe admin.kim') within a single process, so that boto3 is imported,
+    and credentials and connections are set up, only once per profile. Commands are read from prompt, or from clients
+    connected to unix socket if --socket is given(ex. `echo 'instance describe admin.kim' | nc -U awselk.sock`).
+    """
+    if socket_path is None:
+        while True:
+            try:
+                line = input("awselk> ")
+            except EOFError:
+                break
+            if line.strip() in ("exit", "quit"):
+                break
+            _run_shell_command(line)
+        return
+
+    import socketserver
+
+    class CommandHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline().decode("utf-8")
+            output = io.TextIOWrapper(self.wfile, encoding="utf-8", line_buffering=True, write_through=True)
+            original_stream = stream_handler.setStream(output)
+            try:
+                with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                    exit_code = _run_shell_command(line)
+                output.write(f"exit status: {exit_code}\n")
+            finally:
+                stream_handler.setStream(original_stream)
+                output.detach()  # connection is closed by the server, not by the wrapper
+
+    socket_file = pathlib.Path(socket_path)
+    if socket_file.is_socket():
+        socket_file.unlink()  # left behind by server that was killed
+    # socket is created accessible only by the user who started the server, since commands run with their credentials
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_path, CommandHandler)
+    finally:
+        os.umask(umask)
+    with server:
+        logger.info(f"Serving commands on '{socket_path}'; press Ctrl+C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            socket_file.unlink()
+
+
+def _run_shell_command(line: str) -> int:
+    """
+    Run a command line of this CLI in the current process. Clients created by previous commands are reused along with
+    their resource ID caches, which are cleared only after commands that create or delete resources. Counters of the
+    caches are reset for each command, so that its summary counts its own lookups only. Commands are run one at a
+    time, since their output is captured by redirecting stdout of the process.
+    :param line: command line without program name(ex. 'instance describe admin.kim')
+    :return: exit code of the command
+    """
+    args = shlex.split(line)
+    if not args:
+        return 0
+    if args[0] == "shell":
+        logger.error("shell command can not be run within shell")
+        return 1
+    with _clients_lock:
+        clients = list(_clients.values())
+    for ec2_client in clients:
+        get_cache(ec2_client).reset_counters()
+    try:
+        app(args=args, prog_name="main.py")
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        if args[0] in _MUTATING_COMMANDS:
+            with _clients_lock:
+                clients = list(_clients.values())
+            for ec2_client in clients:
+                get_cache(ec2_client).invalidate()
+    return 0
 
 
 if __name__ == "__main__":
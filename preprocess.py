@@ -1,37 +1,604 @@
-import requests
 import config
+import contextlib
 import pathlib
 import shutil
+import gzip
+import hashlib
+import io
+import itertools
 import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 local_dir = pathlib.Path(pathlib.os.getcwd())
-data_dir = local_dir.joinpath("data")
-data_dir.mkdir(exist_ok=True, parents=True)
+data_dir = local_dir.joinpath("data")  # created when something is written into it
 
+# Note from Elasticsearch error message : The bulk request must be terminated by a newline [\\n]
+ACTION_LINE = '{"index": {"_index": "iris", "_id": "%s"}}\n'
+SOURCE_LINE = '{"sepal_length": %f, "sepal_width": %f, "petal_length": %f, "petal_width": %f, "class": "%s"}\n'
 
-def download_data():
+
+def download_data(refresh: bool = False, extract: bool = False, chunk_size: int = 1 << 20) -> bool:
+    """
+    Download archive of iris data into data directory. Response is streamed to disk in chunks, so the archive is never
+    fully buffered in memory. Since `preprocess_data` reads data file straight out of the archive, archive is unpacked
+    only if extract is set to True. Checksum and validators(ETag, Last-Modified) of downloaded archive are
+    recorded, so that
+        * archive is not downloaded again while cached copy matches recorded checksum, without any network I/O
+        * if refresh is set to True, cached copy is revalidated by conditional request and downloaded only if changed
+        * interrupted download is resumed from where it stopped, using Range request
+    :param refresh: whether to revalidate cached copy against the source
+    :param extract: whether to unpack every member of the archive into data directory
+    :param chunk_size: size of each chunk written to disk in bytes
+    :return: whether archive was downloaded
+    """
+    archive_path = data_dir.joinpath(config.ARCHIVE_NAME)
+    partial_path = data_dir.joinpath(f"{config.ARCHIVE_NAME}.part")
+    metadata_path = data_dir.joinpath(f"{config.ARCHIVE_NAME}.meta.json")
+    metadata = {}
+    if metadata_path.exists():
+        with open(metadata_path, "r") as file:
+            metadata = json.load(file)
+    if metadata.get("url") != config.DATA_URL:
+        metadata = {}  # recorded metadata belongs to other source
+    is_cached = archive_path.exists() and metadata.get("sha256") == _compute_checksum(archive_path, chunk_size)
+
+    if is_cached and not refresh:
+        is_downloaded = False
+    else:
+        headers = {}
+        if is_cached:
+            headers.update(_conditional_headers(metadata, "If-None-Match", "If-Modified-Since"))
+        elif partial_path.exists():
+            headers.update(_conditional_headers(metadata.get("partial", {}), "If-Range", "If-Range"))
+            if headers:  # partial file can't be resumed safely without validator
+                headers["Range"] = f"bytes={partial_path.stat().st_size}-"
+        is_downloaded = _stream_download(archive_path, partial_path, metadata_path, headers, chunk_size)
+
+    if extract and (is_downloaded or not data_dir.joinpath(config.DATA_FILE).exists()):
+        shutil.unpack_archive(archive_path, data_dir)
+    return is_downloaded
+
+
+def preprocess_data(
+        max_bytes: Optional[int] = None,
+        max_docs: Optional[int] = None,
+        workers: int = 1,
+        engine: str = "python",
+        compress_level: Optional[int] = None,
+        buffer_size: int = 1 << 20,
+) -> List[pathlib.Path]:
+    """
+    Transform iris data into newline delimited JSON accepted by Elasticsearch bulk API. Rows are read, transformed and
+    written one at a time, so memory usage does not grow with the size of the input file.
+    If neither max_bytes nor max_docs is given, every document is written into single 'iris_data.json' file. Otherwise,
+    output rolls over to numbered files(ex. 'iris_data.00001.json') each of which can be sent as independent request.
+    Data file is streamed straight out of the downloaded archive, or read from data directory if there is no archive.
+    If workers is larger than 1, input file is split into shards processed in separate processes. Output is identical
+    to the one of single process, including `_id` of each document. Since shards require random access to the data
+    file, data file is extracted from the archive unless up-to-date copy is already extracted.
+    :param max_bytes: maximum size of each output file in bytes
+    :param max_docs: maximum number of documents in each output file
+    :param workers: number of processes used for transformation
+    :param engine: 'python' to transform row by row, 'numpy' to transform block of rows at once
+    :param compress_level: gzip compression level(1~9) of output files; not compressed if not given
+    :param buffer_size: size of write buffer in bytes
+    :return: list of paths to written files
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {tuple(ENGINES)}; got: '{engine}'")
     archive_path = data_dir.joinpath(config.ARCHIVE_NAME)
-    response = requests.get(config.DATA_URL)
-    with open(archive_path, "wb") as file:
-        file.write(response.content)
-    shutil.unpack_archive(archive_path, data_dir)
-
-
-def preprocess_data():
-    with open(data_dir.joinpath("iris.data"), "r") as iris_data:
-        iris_data = iris_data.read().strip()
-        iris_data = iris_data.split("\n")
-    
-    documents = []
-    for idx, iris in enumerate(iris_data):
-        # Note from Elasticsearch error message : The bulk request must be terminated by a newline [\\n]
-        document = '{"index": {"_index": "iris", "_id": "%s"}}\n' % idx
-        documents.append(document)
+    source_path = data_dir.joinpath(config.DATA_FILE)
+    is_split = max_bytes is not None or max_docs is not None
+    if workers <= 1:
+        if archive_path.exists():
+            documents = ENGINES[engine](_read_rows(archive_path, config.DATA_FILE))
+        else:
+            documents = ENGINES[engine](_read_rows(source_path))
+        if engine != "python" and is_split:
+            documents = _split_documents(documents)  # blocks have to be split on document boundaries
+        return write_documents(documents, "iris_data", max_bytes, max_docs, compress_level, buffer_size)
+
+    if archive_path.exists() and (
+            not source_path.exists() or source_path.stat().st_mtime < archive_path.stat().st_mtime
+    ):
+        with zipfile.ZipFile(archive_path) as archive:
+            archive.extract(config.DATA_FILE, data_dir)
+    with tempfile.TemporaryDirectory(dir=data_dir) as shard_dir:
+        part_paths = _convert_shards(source_path, pathlib.Path(shard_dir), workers, engine, buffer_size)
+        if is_split:
+            documents = _read_documents(part_paths)
+        else:
+            documents = _read_chunks(part_paths, buffer_size)  # single output file needs no document boundary
+        return write_documents(documents, "iris_data", max_bytes, max_docs, compress_level, buffer_size)
+
 
+def write_documents(
+        documents: Iterable[str],
+        output_name: str,
+        max_bytes: Optional[int] = None,
+        max_docs: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        buffer_size: int = 1 << 20,
+) -> List[pathlib.Path]:
+    """
+    Write action/source line pairs into data directory. Since a file is only rolled over between documents, every
+    output file ends with complete pair and trailing newline required by bulk API. Document larger than max_bytes is
+    written alone into its own file. If compress_level is given, files are compressed by gzip while being written and
+    max_bytes limits size of the decompressed content.
+    :param documents: generator of action/source line pairs
+    :param output_name: name of output file without extension
+    :param max_bytes: maximum size of each output file in bytes
+    :param max_docs: maximum number of documents in each output file
+    :param compress_level: gzip compression level(1~9); not compressed if not given
+    :param buffer_size: size of write buffer in bytes
+    :return: list of paths to written files
+    """
+    extension = "json" if compress_level is None else "json.gz"
+    data_dir.mkdir(exist_ok=True, parents=True)
+    for stale_path in [*data_dir.glob(f"{output_name}.*json"), *data_dir.glob(f"{output_name}.*json.gz")]:
+        stale_path.unlink()  # outputs of previous run would otherwise be mixed up with new ones
+    if max_bytes is None and max_docs is None:
+        output_path = data_dir.joinpath(f"{output_name}.{extension}")
+        with _open_output(output_path, compress_level, buffer_size) as file:
+            file.writelines(documents)
+        return [output_path]
+
+    output_paths = []
+    file = None
+    file_bytes, file_docs = 0, 0
+    try:
+        for document in documents:
+            document_bytes = len(document.encode("utf-8"))
+            is_full = (
+                (max_bytes is not None and file_bytes + document_bytes > max_bytes) or
+                (max_docs is not None and file_docs >= max_docs)
+            )
+            if file is None or (is_full and file_docs > 0):
+                if file is not None:
+                    file.close()
+                output_path = data_dir.joinpath(f"{output_name}.{len(output_paths) + 1:05d}.{extension}")
+                output_paths.append(output_path)
+                file = _open_output(output_path, compress_level, buffer_size)
+                file_bytes, file_docs = 0, 0
+            file.write(document)
+            file_bytes += document_bytes
+            file_docs += 1
+    finally:
+        if file is not None:
+            file.close()
+    return output_paths
+
+
+def generate_documents(rows: Iterable[str], start_idx: int = 0) -> Iterator[str]:
+    """
+    Convert each row of iris data into pair of action line and source line of bulk request
+    :param rows: comma separated rows of iris data(ex. '5.1,3.5,1.4,0.2,Iris-setosa')
+    :param start_idx: value of `_id` assigned to the first row
+    :return: generator of action/source line pairs, each terminated by newline
+    """
+    for idx, iris in enumerate(rows, start_idx):
         sl, sw, pl, pw, iris_type = iris.split(",")
-        document = '{"sepal_length": %f, "sepal_width": %f, "petal_length": %f, "petal_width": %f, "class": "%s"}\n' % \
-        (float(sl), float(sw), float(pl), float(pw), iris_type.split("-")[1])
-        documents.append(document)
+        yield ACTION_LINE % idx + SOURCE_LINE % \
+            (float(sl), float(sw), float(pl), float(pw), iris_type.split("-")[1])
+
+
+def _read_rows(file_path: pathlib.Path, member: Optional[str] = None) -> Iterator[str]:
+    """
+    Read rows of data file lazily. Blank lines(ex. trailing newlines at the end of iris.data) are skipped.
+    :param file_path: path to comma separated data file, or path to zip archive if member is given
+    :param member: name of data file within zip archive, which is decompressed while being read
+    :return: generator of rows without newline character
+    """
+    with contextlib.ExitStack() as stack:
+        if member is None:
+            file = stack.enter_context(open(file_path, "r"))
+        else:
+            archive = stack.enter_context(zipfile.ZipFile(file_path))
+            file = stack.enter_context(io.TextIOWrapper(archive.open(member)))
+        for line in file:
+            row = line.rstrip("\n")
+            if row.strip():
+                yield row
+
+
+def _stream_download(
+        archive_path: pathlib.Path,
+        partial_path: pathlib.Path,
+        metadata_path: pathlib.Path,
+        headers: dict,
+        chunk_size: int,
+) -> bool:
+    """
+    Stream response of the source into partial file, which replaces the archive when completed. Validators of the
+    response are recorded before the body is written, so that the download can be resumed if it is interrupted.
+    :param archive_path: path to archive file
+    :param partial_path: path to file where response body is written during download
+    :param metadata_path: path to JSON file where checksum and validators are recorded
+    :param headers: request headers for conditional or range request
+    :param chunk_size: size of each chunk written to disk in bytes
+    :return: False if cached copy is not modified, True otherwise
+    """
+    import requests  # imported only when download is needed, since it takes long to import
+
+    data_dir.mkdir(exist_ok=True, parents=True)
+    with requests.get(config.DATA_URL, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            return False
+        if response.status_code == 416 and _is_partial_complete(partial_path, response.headers.get("Content-Range")):
+            # every byte had been written before previous run was interrupted, so there is nothing left to resume
+            with open(metadata_path, "r") as file:
+                validators = json.load(file)["partial"]
+        else:
+            response.raise_for_status()
+            is_resumed = response.status_code == 206  # server ignores Range if the source has changed since
+            validators = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            with open(metadata_path, "w") as file:
+                json.dump({"url": config.DATA_URL, "partial": validators}, file, indent=2)
+            with open(partial_path, "ab" if is_resumed else "wb") as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+    partial_path.replace(archive_path)
+    with open(metadata_path, "w") as file:
+        json.dump(
+            {"url": config.DATA_URL, **validators, "sha256": _compute_checksum(archive_path, chunk_size)},
+            file,
+            indent=2,
+        )
+    return True
+
+
+def _is_partial_complete(partial_path: pathlib.Path, content_range: Optional[str]) -> bool:
+    """
+    Check whether range that could not be satisfied(416) starts right after the end of the source
+    :param partial_path: path to file where response body is written during download
+    :param content_range: Content-Range header of 416 response(ex. 'bytes */3738')
+    :return: whether size of partial file equals the size of the source
+    """
+    if not content_range or not partial_path.exists():
+        return False
+    return content_range.rsplit("/", 1)[-1].strip() == str(partial_path.stat().st_size)
+
+
+def _conditional_headers(validators: dict, etag_header: str, last_modified_header: str) -> dict:
+    """
+    Build headers of conditional request from recorded validators. ETag is preferred since it is strong validator.
+    :param validators: dictionary with 'etag' and 'last_modified' recorded from previous response
+    :param etag_header: name of header to send ETag with
+    :param last_modified_header: name of header to send Last-Modified with
+    :return: dictionary of headers; empty if no validator is recorded
+    """
+    if validators.get("etag"):
+        return {etag_header: validators["etag"]}
+    elif validators.get("last_modified"):
+        return {last_modified_header: validators["last_modified"]}
+    else:
+        return {}
+
+
+def _compute_checksum(file_path: pathlib.Path, chunk_size: int) -> Optional[str]:
+    """
+    Compute SHA-256 checksum of file by reading it in chunks
+    :param file_path: path to file
+    :param chunk_size: size of each chunk in bytes
+    :return: hexadecimal digest; None if file does not exist
+    """
+    if not file_path.exists():
+        return None
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _open_output(file_path: pathlib.Path, compress_level: Optional[int], buffer_size: int):
+    """
+    Open output file for writing text, compressing it by gzip if compress_level is given
+    :param file_path: path to output file
+    :param compress_level: gzip compression level(1~9); not compressed if None
+    :param buffer_size: size of write buffer in bytes
+    :return: file object
+    """
+    if compress_level is None:
+        return open(file_path, "w", buffering=buffer_size)
+    return gzip.open(file_path, "wt", compresslevel=compress_level)
+
+
+def _convert_shards(
+        source_path: pathlib.Path,
+        shard_dir: pathlib.Path,
+        workers: int,
+        engine: str,
+        buffer_size: int,
+) -> List[pathlib.Path]:
+    """
+    Split source file into byte ranges aligned to newlines and convert each of them in process pool. Rows of each
+    shard are counted first, so that every shard can assign globally unique `_id` starting from number of rows before.
+    :param source_path: path to comma separated data file
+    :param shard_dir: directory to write converted shards
+    :param workers: number of processes
+    :param engine: name of engine to transform rows(see `ENGINES`)
+    :param buffer_size: size of write buffer in bytes
+    :return: list of paths to converted shards in order of source file
+    """
+    shards = _split_shards(source_path, workers * 4)  # more shards than workers to even out the load
+    part_paths = [shard_dir.joinpath(f"part.{idx:05d}.json") for idx in range(len(shards))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        num_rows = list(executor.map(_count_shard_rows, [source_path] * len(shards), *zip(*shards)))
+        start_indices = [sum(num_rows[:idx]) for idx in range(len(shards))]
+        list(executor.map(
+            _convert_shard,
+            [source_path] * len(shards),
+            *zip(*shards),
+            start_indices,
+            part_paths,
+            [engine] * len(shards),
+            [buffer_size] * len(shards),
+        ))
+    return part_paths
+
+
+def _split_shards(file_path: pathlib.Path, num_shards: int) -> List[Tuple[int, int]]:
+    """
+    Split file into byte ranges of similar size whose boundaries are moved to the beginning of the next line
+    :param file_path: path to file to split
+    :param num_shards: number of shards to split into; may be less if file is small
+    :return: list of (start, end) byte offsets
+    """
+    file_size = os.path.getsize(file_path)
+    boundaries = [0]
+    with open(file_path, "rb") as file:
+        for idx in range(1, num_shards):
+            file.seek(max(file_size * idx // num_shards, boundaries[-1]))
+            file.readline()
+            boundaries.append(min(file.tell(), file_size))
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end]
+
+
+def _read_shard_rows(file_path: pathlib.Path, start: int, end: int) -> Iterator[str]:
+    """
+    Read rows within byte range of data file. Blank lines are skipped as in `_read_rows`.
+    :param file_path: path to comma separated data file
+    :param start: byte offset where the shard starts
+    :param end: byte offset where the shard ends
+    :return: generator of rows without newline character
+    """
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        position = start
+        while position < end:
+            line = file.readline()
+            position += len(line)
+            row = line.decode("utf-8").rstrip("\r\n")
+            if row.strip():
+                yield row
+
+
+def _count_shard_rows(file_path: pathlib.Path, start: int, end: int) -> int:
+    """
+    Count rows within byte range of data file
+    :param file_path: path to comma separated data file
+    :param start: byte offset where the shard starts
+    :param end: byte offset where the shard ends
+    :return: number of rows
+    """
+    return sum(1 for _ in _read_shard_rows(file_path, start, end))
+
+
+def _convert_shard(
+        file_path: pathlib.Path,
+        start: int,
+        end: int,
+        start_idx: int,
+        part_path: pathlib.Path,
+        engine: str,
+        buffer_size: int,
+):
+    """
+    Convert rows within byte range of data file into action/source line pairs
+    :param file_path: path to comma separated data file
+    :param start: byte offset where the shard starts
+    :param end: byte offset where the shard ends
+    :param start_idx: value of `_id` assigned to the first row of the shard
+    :param part_path: path to write converted shard
+    :param engine: name of engine to transform rows(see `ENGINES`)
+    :param buffer_size: size of write buffer in bytes
+    :return: None
+    """
+    documents = ENGINES[engine](_read_shard_rows(file_path, start, end), start_idx)
+    with open(part_path, "w", buffering=buffer_size) as file:
+        file.writelines(documents)
+
+
+def _read_chunks(file_paths: Iterable[pathlib.Path], chunk_size: int) -> Iterator[str]:
+    """
+    Read files as consecutive chunks regardless of line boundaries
+    :param file_paths: paths to files to read
+    :param chunk_size: size of each chunk in characters
+    :return: generator of chunks
+    """
+    for file_path in file_paths:
+        with open(file_path, "r") as file:
+            while chunk := file.read(chunk_size):
+                yield chunk
+
+
+def _split_documents(blocks: Iterable[str]) -> Iterator[str]:
+    """
+    Split blocks of action/source lines rendered by `generate_documents_vectorized` into action/source line pairs
+    :param blocks: blocks of action/source line pairs
+    :return: generator of action/source line pairs
+    """
+    for block in blocks:
+        lines = block.splitlines(keepends=True)
+        for idx in range(0, len(lines), 2):
+            yield lines[idx] + lines[idx + 1]
+
+
+def _read_documents(file_paths: Iterable[pathlib.Path]) -> Iterator[str]:
+    """
+    Read action/source line pairs from files written by `write_documents`
+    :param file_paths: paths to newline delimited JSON files
+    :return: generator of action/source line pairs
+    """
+    for file_path in file_paths:
+        with open(file_path, "r") as file:
+            for action_line in file:
+                yield action_line + file.readline()
+
+
+def generate_documents_vectorized(
+        rows: Iterable[str],
+        start_idx: int = 0,
+        block_rows: int = 1 << 16,
+) -> Iterator[str]:
+    """
+    Vectorized equivalent of `generate_documents`. Rows are parsed in blocks into columns of categorical codes(four
+    measurements and class label), and every block is rendered at once as a byte matrix assembled from constant
+    fragments of action/source lines, digits of `_id` and values formatted once per category. Output is identical to
+    `generate_documents`. Requires numpy, which is not installed by requirements.txt.
+    :param rows: comma separated rows of iris data(ex. '5.1,3.5,1.4,0.2,Iris-setosa')
+    :param start_idx: value of `_id` assigned to the first row
+    :param block_rows: number of rows rendered at once
+    :return: generator of blocks of action/source line pairs
+    """
+    import numpy as np
+
+    fragments = [fragment.encode("utf-8") for fragment in (ACTION_LINE + SOURCE_LINE).split("%")]
+    fragments = [fragments[0]] + [fragment[1:] for fragment in fragments[1:]]  # strip conversion types(s, f)
+    rows = iter(rows)
+    while block := list(itertools.islice(rows, block_rows)):
+        num_rows = len(block)
+        if set(map(str.count, block, itertools.repeat(","))) != {4}:
+            raise ValueError("every row of iris data must consist of 5 comma separated values")
+        fields = ",".join(block).split(",")
+
+        columns = [
+            _repeat_bytes(np, fragments[0], num_rows),
+            _render_integers(np, np.arange(start_idx, start_idx + num_rows, dtype=np.int64)),
+        ]
+        for column_idx in range(4):
+            columns.append(_repeat_bytes(np, fragments[column_idx + 1], num_rows))
+            columns.append(_render_measurements(np, fields[column_idx::5]))
+        columns.append(_repeat_bytes(np, fragments[5], num_rows))
+        categories, codes = _encode_categories(np, fields[4::5])
+        columns.append(_pad_bytes(np, [label.split("-")[1].encode("utf-8") for label in categories])[codes])
+        columns.append(_repeat_bytes(np, fragments[6], num_rows))
+
+        rendered = np.hstack(columns)
+        yield rendered[rendered != 0].tobytes().decode("utf-8")  # 0 is used as padding within each field
+        start_idx += num_rows
+
+
+def _repeat_bytes(np, fragment: bytes, num_rows: int):
+    """
+    Repeat constant fragment of a line for every row
+    :param np: numpy module
+    :param fragment: bytes to repeat
+    :param num_rows: number of rows
+    :return: uint8 matrix whose rows are fragment
+    """
+    return np.broadcast_to(np.frombuffer(fragment, dtype=np.uint8), (num_rows, len(fragment)))
+
+
+def _pad_bytes(np, values: List[bytes]):
+    """
+    Stack bytes of different length into a matrix, padded with 0 bytes at the end
+    :param np: numpy module
+    :param values: list of bytes
+    :return: uint8 matrix whose rows are values
+    """
+    padded = np.zeros((len(values), max(map(len, values), default=0)), dtype=np.uint8)
+    for idx, value in enumerate(values):
+        padded[idx, :len(value)] = np.frombuffer(value, dtype=np.uint8)
+    return padded
+
+
+def _render_integers(np, values, min_digits: int = 1):
+    """
+    Render non-negative integers as ASCII digits right-aligned within fixed width, padded with 0 bytes. Digits are
+    looked up three at a time from table of every number below 1000.
+    :param np: numpy module
+    :param values: array of non-negative integers
+    :param min_digits: minimum number of digits to render without padding(ex. 6 to render 42 as '000042')
+    :return: uint8 matrix of digits
+    """
+    num_digits = max(len(str(int(values.max()))) if len(values) > 0 else 1, min_digits)
+    num_groups = -(-num_digits // 3)
+    table = (np.arange(1000)[:, None] // np.array([100, 10, 1]) % 10 + ord("0")).astype(np.uint8)
+    digits = np.hstack([table[values // 1000 ** group % 1000] for group in range(num_groups - 1, -1, -1)])
+    for position in range(num_groups * 3 - min_digits):
+        digits[values < 10 ** (num_groups * 3 - 1 - position), position] = 0
+    return digits
+
+
+def _encode_categories(np, values: List[str]) -> Tuple[List[str], "np.ndarray"]:
+    """
+    Encode values into categorical codes
+    :param np: numpy module
+    :param values: list of values
+    :return: list of distinct values in order of appearance and array of code of each value
+    """
+    categories = {value: code for code, value in enumerate(dict.fromkeys(values))}
+    return list(categories), np.fromiter(map(categories.__getitem__, values), dtype=np.int64, count=len(values))
+
+
+def _render_measurements(np, values: List[str]):
+    """
+    Render column of measurements as '%f' does. Measurements are mostly recorded with a few significant digits, so
+    each distinct value is formatted only once and looked up by its categorical code. Columns with too many distinct
+    values are parsed and formatted by `_render_floats` instead.
+    :param np: numpy module
+    :param values: list of measurements as written in data file
+    :return: uint8 matrix of formatted values padded with 0 bytes
+    """
+    categories, codes = _encode_categories(np, values)
+    if len(categories) * 4 > len(values):
+        return _render_floats(np, np.fromiter(map(float, values), dtype=np.float64, count=len(values)))
+    return _pad_bytes(np, [("%f" % float(value)).encode("utf-8") for value in categories])[codes]
+
+
+def _render_floats(np, values):
+    """
+    Render floats as '%f' does, which rounds exact binary value to 6 decimal places. Value is scaled and rounded in
+    floating point, which is exact unless scaled value is too close to a tie or too large to be represented as integer.
+    Such values are formatted by '%f' instead.
+    :param np: numpy module
+    :param values: array of floats
+    :return: uint8 matrix of formatted values padded with 0 bytes
+    """
+    with np.errstate(over="ignore", invalid="ignore"):  # inf and nan are formatted by '%f'
+        scaled = np.abs(values) * 1e6
+        micros = np.rint(scaled)
+        is_exact = np.isfinite(scaled) & (scaled < 2 ** 52)
+        is_exact &= np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) > np.maximum(scaled, 1.0) * 2 ** -50
+        micros = np.where(is_exact, micros, 0).astype(np.int64)
+
+    rendered = np.hstack([
+        np.where(np.signbit(values), ord("-"), 0).astype(np.uint8)[:, None],
+        _render_integers(np, micros // 1000000),
+        np.full((len(values), 1), ord("."), dtype=np.uint8),
+        _render_integers(np, micros % 1000000, min_digits=6),
+    ])
+    inexact_indices = np.flatnonzero(~is_exact)
+    if len(inexact_indices) > 0:
+        formatted = _pad_bytes(np, [("%f" % values[idx]).encode("utf-8") for idx in inexact_indices])
+        width = max(rendered.shape[1], formatted.shape[1])
+        rendered = np.hstack([np.zeros((len(values), width - rendered.shape[1]), dtype=np.uint8), rendered])
+        rendered[inexact_indices] = 0
+        rendered[inexact_indices, :formatted.shape[1]] = formatted  # padding is removed regardless of position
+    return rendered
+
 
-    with open(data_dir.joinpath("iris_data.json"), "w") as file:
-        file.writelines("".join(documents))
+ENGINES = {
+    "python": generate_documents,
+    "numpy": generate_documents_vectorized,
+}
@@ -0,0 +1,85 @@
+import http.server
+import threading
+import time
+import pytest
+
+
+@pytest.fixture
+def stand_in_server():
+    """
+    Start local HTTP servers that stand in for Elasticsearch or data source, and shut them down after the test
+    :return: function that takes subclass of `http.server.BaseHTTPRequestHandler` and returns base URL of the server
+    """
+    servers = []
+
+    def start(handler_class) -> str:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class QuietHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Request handler that does not print access log of every request to stderr
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class InstantTime:
+    """
+    Stand-in of `time` module(ex. for `aws.waiter`) that does not sleep, so that only latency of API calls is spent
+    """
+
+    def sleep(self, seconds: float):
+        pass
+
+    def __getattr__(self, name: str):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def fake_ec2_client(monkeypatch, tmp_path):
+    """
+    FakeEC2Client without latency, used as EC2 client of profile 'admin.kim' by commands of `main.py`, which write key
+    pair and state files into temporary directory
+    :return: FakeEC2Client
+    """
+    import config
+    import main
+    from benchmarks.fake_ec2 import FakeEC2Client
+
+    ec2_client = FakeEC2Client(latency=0.0)
+    monkeypatch.setitem(main._clients, ("admin.kim", config.REGION_NAME), ec2_client)
+    monkeypatch.setattr(main, "local_dir", tmp_path)
+    monkeypatch.setattr(main, "state_path", tmp_path.joinpath(config.STATE_FILE))
+    return ec2_client
+
+
+def invoke(*args: str) -> str:
+    """
+    Run command of `main.py` in this process
+    :param args: command line arguments(ex. 'instance', 'describe', 'admin.kim')
+    :return: output of the command
+    """
+    import main
+    from typer.testing import CliRunner
+
+    result = CliRunner().invoke(main.app, list(args))
+    assert result.exit_code == 0, f"{args} failed : {result.output}{result.exception!r}"
+    return result.output
@@ -0,0 +1,168 @@
+import gzip
+import json
+import threading
+import time
+import bulk
+from tests.conftest import QuietHandler
+
+
+def _write_bulk_file(file_path, num_docs: int):
+    with open(file_path, "w") as file:
+        for idx in range(num_docs):
+            file.write(json.dumps({"index": {"_index": "iris", "_id": idx}}) + "\n")
+            file.write(json.dumps({"doc": idx}) + "\n")
+    return file_path
+
+
+def _bulk_handler(item_status):
+    """
+    :param item_status: function that takes document ID and number of times it has been received, and returns status
+        of its item in bulk response
+    :return: handler class of stand-in `_bulk` API that records decompressed body and headers of each request
+    """
+
+    class BulkHandler(QuietHandler):
+        requests = []
+        received = {}
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            lines = body.decode("utf-8").splitlines()
+            doc_ids = [json.loads(line)["index"]["_id"] for line in lines[::2]]
+            BulkHandler.requests.append({"path": self.path, "headers": dict(self.headers), "doc_ids": doc_ids})
+            items = []
+            for doc_id in doc_ids:
+                BulkHandler.received[doc_id] = BulkHandler.received.get(doc_id, 0) + 1
+                items.append({"index": {"_id": doc_id, "status": item_status(doc_id, BulkHandler.received[doc_id])}})
+            response = {"took": 1, "errors": any(item["index"]["status"] >= 300 for item in items), "items": items}
+            self.send_body(200, json.dumps(response).encode("utf-8"), {"Content-Type": "application/json"})
+
+    return BulkHandler
+
+
+def test_load_data_resends_only_failed_items(stand_in_server, tmp_path):
+    handler = _bulk_handler(lambda doc_id, count: 429 if doc_id in (1, 3) and count == 1 else 201)
+    host = stand_in_server(handler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 5)
+
+    stats = bulk.load_data(host, [file_path], workers=1, backoff_seconds=0)
+
+    assert [request["doc_ids"] for request in handler.requests] == [[0, 1, 2, 3, 4], [1, 3]]
+    assert handler.requests[0]["path"] == "/_bulk"
+    assert stats["docs"] == 5
+    assert stats["retried"] == 2
+    assert stats["failed"] == 0
+
+
+def test_load_data_writes_dead_letter_after_max_retries(stand_in_server, tmp_path):
+    # document 1 is always rejected by full queue, document 2 is rejected permanently by mapping error
+    handler = _bulk_handler(lambda doc_id, count: {1: 429, 2: 400}.get(doc_id, 201))
+    host = stand_in_server(handler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 3)
+    dead_letter_path = tmp_path.joinpath("rejected.json")
+
+    stats = bulk.load_data(
+        host, [file_path], workers=1, max_retries=2, backoff_seconds=0, dead_letter_path=dead_letter_path
+    )
+
+    assert handler.received == {0: 1, 1: 3, 2: 1}
+    assert stats["docs"] == 1
+    assert stats["failed"] == 2
+    rejected = dead_letter_path.read_text().splitlines()
+    assert sorted(json.loads(line)["index"]["_id"] for line in rejected[::2]) == [1, 2]
+    assert sorted(json.loads(line)["doc"] for line in rejected[1::2]) == [1, 2]
+
+
+def test_load_data_compresses_body(stand_in_server, tmp_path):
+    handler = _bulk_handler(lambda doc_id, count: 201)
+    host = stand_in_server(handler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 100)
+
+    stats = bulk.load_data(host, [file_path], workers=2, batch_bytes=2000, compress_level=6)
+
+    assert len(handler.requests) > 1
+    assert all(request["headers"]["Content-Encoding"] == "gzip" for request in handler.requests)
+    assert sorted(doc_id for request in handler.requests for doc_id in request["doc_ids"]) == list(range(100))
+    assert stats["docs"] == 100
+    assert stats["sent_bytes"] < stats["bytes"]
+
+
+def test_autotune_ignores_permanent_rejection(stand_in_server, tmp_path):
+    handler = _bulk_handler(lambda doc_id, count: 400 if doc_id == 0 else 201)
+    host = stand_in_server(handler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 5000)
+    tuning_path = tmp_path.joinpath("bulk_tuning.json")
+
+    settings, stats = bulk.autotune_load_data(
+        host, [file_path], tuning_path, min_batch_bytes=1000, max_batch_bytes=64000, max_workers=1, backoff_seconds=0,
+    )
+
+    assert settings["batch_bytes"] > 1000
+    assert stats["docs"] == 4999
+    assert stats["failed"] == 1
+    assert bulk.load_tuned_settings(tuning_path, host) == settings
+
+
+def test_autotune_shrinks_on_throttling(stand_in_server, tmp_path):
+    lock = threading.Lock()
+    in_flight = [0]
+
+    class ThrottlingHandler(_bulk_handler(lambda doc_id, count: 201)):
+        """
+        Reject whole request with 429 while another request is being processed
+        """
+
+        def do_POST(self):
+            with lock:
+                in_flight[0] += 1
+                throttled = in_flight[0] > 1
+            try:
+                if throttled:
+                    self.rfile.read(int(self.headers["Content-Length"]))
+                    self.send_body(429, b'{"error": "es_rejected_execution_exception"}')
+                else:
+                    time.sleep(0.01)
+                    super().do_POST()
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+    host = stand_in_server(ThrottlingHandler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 2000)
+    tuning_path = tmp_path.joinpath("bulk_tuning.json")
+
+    settings, stats = bulk.autotune_load_data(
+        host, [file_path], tuning_path, start_settings={"batch_bytes": 4000, "workers": 4}, min_batch_bytes=1000,
+        max_retries=20, backoff_seconds=0.001,
+    )
+
+    assert settings == {"batch_bytes": 4000, "workers": 1}
+    assert stats["throttled"] > 0
+    assert stats["docs"] == 2000
+    assert bulk.load_tuned_settings(tuning_path, host) == settings
+
+
+def test_load_data_resends_batch_after_timeout(stand_in_server, tmp_path, monkeypatch):
+    item_handler = _bulk_handler(lambda doc_id, count: 201)
+
+    class StallingHandler(item_handler):
+        stalled = 0
+
+        def do_POST(self):
+            if StallingHandler.stalled == 0:
+                StallingHandler.stalled += 1
+                self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(1.0)  # longer than read timeout, so the client gives up before this response
+            super().do_POST()
+
+    monkeypatch.setattr(bulk, "REQUEST_TIMEOUT", (1, 0.2))
+    host = stand_in_server(StallingHandler)
+    file_path = _write_bulk_file(tmp_path.joinpath("iris_data.json"), 3)
+
+    stats = bulk.load_data(host, [file_path], workers=1, backoff_seconds=0)
+
+    assert stats["docs"] == 3
+    assert stats["retried"] == 3
+    assert stats["failed"] == 0
@@ -0,0 +1,123 @@
+import config
+import main
+import aws.ec2 as ec2_commands
+import aws.vpc as vpc_commands
+from aws.cache import get_cache
+from tests.conftest import invoke
+
+
+def _launch_untagged_instance(ec2_client):
+    """
+    Launch node of the fleet without 'NodeIndex' tag, as if launch was interrupted before the tag was created
+    """
+    ec2_client.run_instances(
+        ImageId=config.INSTANCE_AMI,
+        InstanceType=config.INSTANCE_TYPE,
+        SubnetId=vpc_commands.fetch_subnet_id(ec2_client, config.VPC_NAME, main._subnet_names()[0]),
+        MinCount=1,
+        MaxCount=1,
+        TagSpecifications=[{"ResourceType": "instance", "Tags": [{"Key": "Name", "Value": config.INSTANCE_NAME}]}],
+    )
+
+
+def test_converge_fleet_assigns_missing_indexes_to_untagged_instances(fake_ec2_client):
+    invoke("create", "admin.kim", "--nodes", "1")
+    for _ in range(2):
+        _launch_untagged_instance(fake_ec2_client)
+    get_cache(fake_ec2_client).invalidate()
+    fake_ec2_client.reset_counters()
+
+    ec2_commands.converge_fleet(
+        ec2_client=fake_ec2_client,
+        image_id=config.INSTANCE_AMI,
+        instance_type=config.INSTANCE_TYPE,
+        key_name=config.KEY_NAME,
+        vpc_name=config.VPC_NAME,
+        subnet_names=main._subnet_names(),
+        fleet_name=config.INSTANCE_NAME,
+        node_count=3,
+    )
+
+    instances = ec2_commands.fetch_fleet_instances(
+        fake_ec2_client, config.VPC_NAME, main._subnet_names(), config.INSTANCE_NAME
+    )
+    assert len(instances) == 3
+    assert sorted(ec2_commands._node_index(instance_info) for instance_info in instances) == [0, 1, 2]
+    assert "RunInstances" not in fake_ec2_client.calls
+
+
+def _resources(ec2_client, kind: str) -> list:
+    return list(ec2_client._resources[kind].values())
+
+
+def _default_routes(ec2_client) -> list:
+    route_tables = [
+        route_table for route_table in _resources(ec2_client, "route_table")
+        if {"Key": "Name", "Value": config.ROUTE_TABLE_NAME} in route_table["Tags"]
+    ]
+    return [route for route in route_tables[0]["Routes"] if route["DestinationCidrBlock"] == "0.0.0.0/0"]
+
+
+def test_converge_finishes_configuration_of_existing_resources(fake_ec2_client):
+    invoke("create", "admin.kim")
+    # creation was interrupted right after each resource was created
+    for security_group in _resources(fake_ec2_client, "security_group"):
+        security_group["IpPermissions"] = []
+    for subnet in _resources(fake_ec2_client, "subnet"):
+        subnet["MapPublicIpOnLaunch"] = False
+    for route_table in _resources(fake_ec2_client, "route_table"):
+        route_table["Routes"] = []
+    get_cache(fake_ec2_client).invalidate()
+    fake_ec2_client.reset_counters()
+
+    invoke("create", "admin.kim", "--converge")
+
+    ports = sorted(
+        (permission["FromPort"], permission["ToPort"])
+        for security_group in _resources(fake_ec2_client, "security_group")
+        for permission in security_group["IpPermissions"]
+    )
+    assert ports == sorted((permission["FromPort"], permission["ToPort"]) for permission in
+                           vpc_commands._parse_ip_permissions(config.INGRESS_PORTS.split(",")))
+    assert all(subnet["MapPublicIpOnLaunch"] for subnet in _resources(fake_ec2_client, "subnet"))
+    igw_ids = [igw["InternetGatewayId"] for igw in _resources(fake_ec2_client, "internet_gateway")]
+    assert [route["GatewayId"] for route in _default_routes(fake_ec2_client)] == igw_ids
+    assert {operation for operation in fake_ec2_client.calls if not operation.startswith("Describe")} == {
+        "AuthorizeSecurityGroupIngress", "ModifySubnetAttribute", "CreateRoute"
+    }
+
+    get_cache(fake_ec2_client).invalidate()
+    fake_ec2_client.reset_counters()
+    invoke("create", "admin.kim", "--converge")  # nothing is left to configure
+
+    assert all(operation.startswith("Describe") for operation in fake_ec2_client.calls)
+
+
+def test_converge_attaches_detached_internet_gateway(fake_ec2_client):
+    invoke("create", "admin.kim")
+    vpc_id = vpc_commands.fetch_vpc_id(fake_ec2_client, config.VPC_NAME)
+    igw_id = vpc_commands.fetch_internet_gateway_id(fake_ec2_client, config.VPC_NAME)
+    fake_ec2_client.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+    get_cache(fake_ec2_client).invalidate()
+    fake_ec2_client.reset_counters()
+
+    invoke("create", "admin.kim", "--converge")
+
+    assert [igw["InternetGatewayId"] for igw in _resources(fake_ec2_client, "internet_gateway")] == [igw_id]
+    assert _resources(fake_ec2_client, "internet_gateway")[0]["Attachments"][0]["VpcId"] == vpc_id
+    assert "CreateInternetGateway" not in fake_ec2_client.calls
+
+
+def test_converge_points_default_route_to_new_internet_gateway(fake_ec2_client):
+    invoke("create", "admin.kim")
+    vpc_id = vpc_commands.fetch_vpc_id(fake_ec2_client, config.VPC_NAME)
+    old_igw_id = vpc_commands.fetch_internet_gateway_id(fake_ec2_client, config.VPC_NAME)
+    fake_ec2_client.detach_internet_gateway(InternetGatewayId=old_igw_id, VpcId=vpc_id)
+    fake_ec2_client.delete_internet_gateway(InternetGatewayId=old_igw_id)
+    get_cache(fake_ec2_client).invalidate()
+
+    invoke("create", "admin.kim", "--converge")
+
+    new_igw_id = vpc_commands.fetch_internet_gateway_id(fake_ec2_client, config.VPC_NAME)
+    assert new_igw_id != old_igw_id
+    assert [route["GatewayId"] for route in _default_routes(fake_ec2_client)] == [new_igw_id]
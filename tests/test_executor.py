@@ -0,0 +1,135 @@
+import re
+import threading
+import time
+import pytest
+from aws.executor import Step, StepTiming, critical_path, format_timing_report, run_steps
+from tests.conftest import InstantTime
+
+
+def _recording_step(name: str, log: list, depends_on=(), seconds: float = 0.0, error: Exception = None) -> Step:
+    def func():
+        log.append(("start", name))
+        time.sleep(seconds)
+        log.append(("end", name))
+        if error is not None:
+            raise error
+
+    return Step(name, func, tuple(depends_on))
+
+
+def test_run_steps_starts_step_after_its_dependencies():
+    log = []
+    steps = [
+        _recording_step("vpc", log, seconds=0.02),
+        _recording_step("key_pair", log),
+        _recording_step("subnet", log, ("vpc",)),
+        _recording_step("instance", log, ("key_pair", "subnet")),
+    ]
+
+    timings = run_steps(steps)
+
+    assert set(timings) == {"vpc", "key_pair", "subnet", "instance"}
+    assert all(timing.error is None for timing in timings.values())
+    assert log.index(("end", "vpc")) < log.index(("start", "subnet"))
+    assert log.index(("end", "subnet")) < log.index(("start", "instance"))
+    assert log.index(("end", "key_pair")) < log.index(("start", "instance"))
+
+
+def test_run_steps_runs_independent_steps_concurrently():
+    barrier = threading.Barrier(3, timeout=1)
+    steps = [Step(name, barrier.wait) for name in ("key_pair", "vpc", "security_group")]
+
+    timings = run_steps(steps, max_workers=3)  # barrier times out unless every step runs at the same time
+
+    assert all(timing.error is None for timing in timings.values())
+
+
+def test_run_steps_with_single_worker_runs_steps_one_by_one():
+    log = []
+    steps = [_recording_step(name, log, seconds=0.01) for name in ("a", "b", "c")]
+
+    run_steps(steps, max_workers=1)
+
+    assert [event for event, _ in log] == ["start", "end"] * 3
+
+
+@pytest.mark.parametrize("steps, message", [
+    ([Step("a", print), Step("a", print)], "unique"),
+    ([Step("a", print, ("b",))], "undefined steps: ['b']"),
+    ([Step("a", print, ("c",)), Step("b", print, ("a",)), Step("c", print, ("b",))], "cycle"),
+    ([Step("a", print, ("a",))], "cycle"),
+])
+def test_run_steps_rejects_invalid_graph(steps, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        run_steps(steps)
+
+
+def test_run_steps_fail_fast_raises_without_starting_dependents():
+    log = []
+    steps = [
+        _recording_step("vpc", log, error=RuntimeError("vpc limit exceeded")),
+        _recording_step("subnet", log, ("vpc",)),
+    ]
+
+    with pytest.raises(RuntimeError, match="vpc limit exceeded"):
+        run_steps(steps)
+    assert ("start", "subnet") not in log
+
+
+def test_run_steps_without_fail_fast_skips_dependents_only():
+    log = []
+    error = RuntimeError("vpc limit exceeded")
+    steps = [
+        _recording_step("vpc", log, error=error),
+        _recording_step("subnet", log, ("vpc",)),
+        _recording_step("instance", log, ("subnet", "key_pair")),
+        _recording_step("key_pair", log),
+    ]
+
+    timings = run_steps(steps, fail_fast=False)
+
+    assert timings["vpc"].error is error
+    assert "skipped" in str(timings["subnet"].error)
+    assert "skipped" in str(timings["instance"].error)
+    assert timings["key_pair"].error is None
+    assert sorted(name for event, name in log if event == "start") == ["key_pair", "vpc"]
+
+
+def test_critical_path_follows_dependency_that_finished_last():
+    steps = [
+        Step("vpc", print),
+        Step("key_pair", print),
+        Step("security_group", print, ("vpc",)),
+        Step("subnet", print, ("vpc",)),
+        Step("instance", print, ("key_pair", "security_group", "subnet")),
+    ]
+    timings = {
+        "vpc": StepTiming(0.0, 1.0),
+        "key_pair": StepTiming(0.0, 0.5),
+        "security_group": StepTiming(1.0, 1.5),
+        "subnet": StepTiming(1.0, 2.0),
+        "instance": StepTiming(2.0, 5.0),
+    }
+
+    assert critical_path(steps, timings) == ["vpc", "subnet", "instance"]
+    report = format_timing_report(steps, timings).splitlines()
+    assert report[-1] == "critical path : vpc -> subnet -> instance (5.00s)"
+    marked = sorted(line.split()[1] for line in report[:-1] if line.startswith("*"))
+    assert marked == ["instance", "subnet", "vpc"]
+
+
+def test_create_steps_overlap_against_fake_client(monkeypatch, tmp_path):
+    import main
+    import aws.waiter as waiter
+    from benchmarks.fake_ec2 import FakeEC2Client
+
+    monkeypatch.setattr(main, "local_dir", tmp_path)
+    monkeypatch.setattr(waiter, "time", InstantTime())  # fixed delay before first probe would dilute the overlap
+    elapsed = {}
+    for max_workers in (1, 8):
+        ec2_client = FakeEC2Client(latency=0.02)
+        started_at = time.perf_counter()
+        run_steps(main.create_steps(ec2_client), max_workers=max_workers)
+        elapsed[max_workers] = time.perf_counter() - started_at
+
+    assert elapsed[8] < elapsed[1] * 0.8
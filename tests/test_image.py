@@ -0,0 +1,73 @@
+import json
+import config
+import main
+import aws.waiter as waiter
+from aws.cache import get_cache
+from tests.conftest import InstantTime, invoke
+
+
+def _launched_image_ids(ec2_client) -> set:
+    reservations = ec2_client.describe_instances(
+        Filters=[
+            {"Name": "tag:Name", "Values": [config.INSTANCE_NAME]},
+            {"Name": "instance-state-name", "Values": ["running"]},
+        ]
+    )["Reservations"]
+    return {instance_info["ImageId"] for reservation in reservations for instance_info in reservation["Instances"]}
+
+
+def test_create_launches_nodes_from_baked_image(fake_ec2_client, monkeypatch):
+    monkeypatch.setattr(waiter, "time", InstantTime())
+    invoke("create", "admin.kim")
+    assert _launched_image_ids(fake_ec2_client) == {config.INSTANCE_AMI}
+
+    invoke("image", "bake", "admin.kim")
+    invoke("delete", "admin.kim")
+    get_cache(fake_ec2_client).invalidate()
+    invoke("create", "admin.kim")
+
+    image_ids = _launched_image_ids(fake_ec2_client)
+    assert len(image_ids) == 1 and image_ids != {config.INSTANCE_AMI}
+
+
+def test_baked_image_is_invalidated_by_elk_version(fake_ec2_client, monkeypatch):
+    monkeypatch.setattr(waiter, "time", InstantTime())
+    invoke("create", "admin.kim")
+    invoke("image", "bake", "admin.kim")
+    invoke("delete", "admin.kim")
+    get_cache(fake_ec2_client).invalidate()
+
+    monkeypatch.setattr(config, "ELK_VERSION", "7.3.0")
+    invoke("create", "admin.kim")
+
+    assert _launched_image_ids(fake_ec2_client) == {config.INSTANCE_AMI}
+
+
+def test_cleaned_image_is_not_restored_from_state(fake_ec2_client, monkeypatch):
+    monkeypatch.setattr(waiter, "time", InstantTime())
+    for line in ("create admin.kim", "image bake admin.kim", "image clean admin.kim", "instance describe admin.kim"):
+        assert main._run_shell_command(line) == 0
+    with open(main.state_path) as file:
+        assert all(entry["key"][1] != "image" for entry in json.load(file)["ids"])
+
+    # node 1 is launched with resource IDs loaded from state file by previous command still cached
+    assert main._run_shell_command("create admin.kim --converge --nodes 2") == 0
+
+    assert _launched_image_ids(fake_ec2_client) == {config.INSTANCE_AMI}
+
+
+def test_wait_for_image_probes_again_until_created_image_is_visible(fake_ec2_client, monkeypatch):
+    monkeypatch.setattr(waiter, "time", InstantTime())
+    image_id = fake_ec2_client.create_image(InstanceId="i-00000000000000001", Name=config.IMAGE_NAME)["ImageId"]
+    image = fake_ec2_client._resources["image"].pop(image_id)  # describe calls do not see the image yet
+    describe_images = fake_ec2_client.describe_images
+
+    def describe_eventually(**kwargs):
+        if fake_ec2_client.calls.get("DescribeImages") == 2:
+            fake_ec2_client._resources["image"][image_id] = image
+        return describe_images(**kwargs)
+
+    monkeypatch.setattr(fake_ec2_client, "describe_images", describe_eventually)
+
+    assert waiter.wait_for_image_available(fake_ec2_client, image_id)["State"] == "available"
+    assert fake_ec2_client.calls["DescribeImages"] == 3
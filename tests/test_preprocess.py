@@ -0,0 +1,255 @@
+import gzip
+import json
+import math
+import random
+import zipfile
+import pytest
+import config
+import preprocess
+from tests.conftest import QuietHandler
+
+PAYLOAD = bytes(range(256)) * 40
+
+
+def _source_handler(payload: bytes, etag: str):
+    """
+    :param payload: body of the source
+    :param etag: ETag of the source
+    :return: handler class of stand-in data source that honors If-None-Match, Range and If-Range like a static file
+        server, and records headers of each request
+    """
+
+    class SourceHandler(QuietHandler):
+        requests = []
+
+        def do_GET(self):
+            SourceHandler.requests.append(dict(self.headers))
+            if self.headers.get("If-None-Match") == etag:
+                self.send_body(304, b"", {"ETag": etag})
+                return
+            byte_range = self.headers.get("Range")
+            if byte_range and self.headers.get("If-Range", etag) == etag:
+                start = int(byte_range[len("bytes="):-1])
+                if start >= len(payload):
+                    self.send_body(416, b"", {"Content-Range": f"bytes */{len(payload)}"})
+                else:
+                    headers = {"ETag": etag, "Content-Range": f"bytes {start}-{len(payload) - 1}/{len(payload)}"}
+                    self.send_body(206, payload[start:], headers)
+                return
+            self.send_body(200, payload, {"ETag": etag})
+
+    return SourceHandler
+
+
+def _set_source(monkeypatch, tmp_path, url: str):
+    monkeypatch.setattr(config, "DATA_URL", f"{url}/{config.ARCHIVE_NAME}")
+    monkeypatch.setattr(preprocess, "data_dir", tmp_path)
+
+
+def _write_partial(tmp_path, body: bytes, etag: str):
+    tmp_path.joinpath(f"{config.ARCHIVE_NAME}.part").write_bytes(body)
+    with open(tmp_path.joinpath(f"{config.ARCHIVE_NAME}.meta.json"), "w") as file:
+        json.dump({"url": config.DATA_URL, "partial": {"etag": etag, "last_modified": None}}, file)
+
+
+def test_download_is_cached_by_checksum(stand_in_server, monkeypatch, tmp_path):
+    handler = _source_handler(PAYLOAD, '"v1"')
+    _set_source(monkeypatch, tmp_path, stand_in_server(handler))
+    archive_path = tmp_path.joinpath(config.ARCHIVE_NAME)
+
+    assert preprocess.download_data() is True
+    assert preprocess.download_data() is False
+    assert len(handler.requests) == 1  # cached copy is used without network I/O
+    assert preprocess.download_data(refresh=True) is False
+    assert handler.requests[-1]["If-None-Match"] == '"v1"'
+
+    archive_path.write_bytes(PAYLOAD[:100])  # cached copy no longer matches recorded checksum
+    assert preprocess.download_data() is True
+    assert archive_path.read_bytes() == PAYLOAD
+    assert not tmp_path.joinpath(f"{config.ARCHIVE_NAME}.part").exists()
+
+
+def test_download_resumes_partial_file(stand_in_server, monkeypatch, tmp_path):
+    handler = _source_handler(PAYLOAD, '"v1"')
+    _set_source(monkeypatch, tmp_path, stand_in_server(handler))
+    _write_partial(tmp_path, PAYLOAD[:1000], '"v1"')
+
+    assert preprocess.download_data() is True
+    assert handler.requests[0]["Range"] == "bytes=1000-"
+    assert handler.requests[0]["If-Range"] == '"v1"'
+    assert tmp_path.joinpath(config.ARCHIVE_NAME).read_bytes() == PAYLOAD
+
+
+def test_download_restarts_when_source_changed(stand_in_server, monkeypatch, tmp_path):
+    payload = PAYLOAD[::-1]
+    handler = _source_handler(payload, '"v2"')
+    _set_source(monkeypatch, tmp_path, stand_in_server(handler))
+    _write_partial(tmp_path, PAYLOAD[:1000], '"v1"')
+
+    assert preprocess.download_data() is True  # server responds with 200 and the whole new source
+    assert tmp_path.joinpath(config.ARCHIVE_NAME).read_bytes() == payload
+    with open(tmp_path.joinpath(f"{config.ARCHIVE_NAME}.meta.json"), "r") as file:
+        assert json.load(file)["etag"] == '"v2"'
+
+
+def test_download_completes_fully_written_partial_file(stand_in_server, monkeypatch, tmp_path):
+    handler = _source_handler(PAYLOAD, '"v1"')
+    _set_source(monkeypatch, tmp_path, stand_in_server(handler))
+    _write_partial(tmp_path, PAYLOAD, '"v1"')
+
+    assert preprocess.download_data() is True  # server responds with 416 since nothing is left to send
+    assert tmp_path.joinpath(config.ARCHIVE_NAME).read_bytes() == PAYLOAD
+    assert preprocess.download_data() is False
+    assert len(handler.requests) == 1
+
+
+def _baseline(data: str) -> str:
+    """
+    Output of `preprocess_data` before it was streamed, which every mode has to reproduce byte for byte
+    """
+    documents = []
+    for idx, iris in enumerate(data.strip().split("\n")):
+        documents.append('{"index": {"_index": "iris", "_id": "%s"}}\n' % idx)
+        sl, sw, pl, pw, iris_type = iris.split(",")
+        documents.append(
+            '{"sepal_length": %f, "sepal_width": %f, "petal_length": %f, "petal_width": %f, "class": "%s"}\n' %
+            (float(sl), float(sw), float(pl), float(pw), iris_type.split("-")[1])
+        )
+    return "".join(documents)
+
+
+@pytest.fixture
+def iris_data(monkeypatch, tmp_path) -> str:
+    """
+    Zip archive of synthetic iris data in temporary data directory, with trailing blank lines like iris.data
+    :return: content of the data file
+    """
+    rng = random.Random(0)
+    classes = ("Iris-setosa", "Iris-versicolor", "Iris-virginica")
+    rows = [
+        f"{rng.randint(43, 79) / 10},{rng.randint(20, 44) / 10},{rng.randint(10, 69) / 10},{rng.randint(1, 25) / 10},"
+        f"{rng.choice(classes)}"
+        for _ in range(1000)
+    ]
+    data = "\n".join(rows) + "\n\n"
+    with zipfile.ZipFile(tmp_path.joinpath(config.ARCHIVE_NAME), "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(config.DATA_FILE, data)
+    monkeypatch.setattr(preprocess, "data_dir", tmp_path)
+    return data
+
+
+def _read_outputs(output_paths) -> list:
+    return [
+        (gzip.open if output_path.suffix == ".gz" else open)(output_path, "rt").read() for output_path in output_paths
+    ]
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"workers": 3},
+    {"compress_level": 6},
+    {"workers": 3, "compress_level": 1},
+], ids=["single", "sharded", "gzip", "sharded-gzip"])
+def test_preprocess_single_file_matches_baseline(iris_data, tmp_path, options):
+    output_paths = preprocess.preprocess_data(**options)
+
+    extension = ".json.gz" if "compress_level" in options else ".json"
+    assert [output_path.name for output_path in output_paths] == [f"iris_data{extension}"]
+    assert _read_outputs(output_paths) == [_baseline(iris_data)]
+
+
+def test_preprocess_reads_extracted_file_without_archive(iris_data, tmp_path):
+    archive_path = tmp_path.joinpath(config.ARCHIVE_NAME)
+    tmp_path.joinpath(config.DATA_FILE).write_text(iris_data)
+    archive_path.unlink()
+
+    assert _read_outputs(preprocess.preprocess_data()) == [_baseline(iris_data)]
+
+
+def test_preprocess_streams_rows_out_of_archive(iris_data, tmp_path):
+    preprocess.preprocess_data()
+
+    assert not tmp_path.joinpath(config.DATA_FILE).exists()
+
+
+@pytest.mark.parametrize("options", [
+    {"max_docs": 128},
+    {"max_bytes": 10000},
+    {"max_bytes": 10000, "max_docs": 50, "workers": 3},
+    {"max_bytes": 10000, "compress_level": 6},
+], ids=["max-docs", "max-bytes", "sharded", "gzip"])
+def test_preprocess_rolls_over_on_document_boundaries(iris_data, tmp_path, options):
+    output_paths = preprocess.preprocess_data(**options)
+    outputs = _read_outputs(output_paths)
+
+    assert len(outputs) > 1
+    assert "".join(outputs) == _baseline(iris_data)
+    for output in outputs:
+        lines = output.splitlines()
+        assert output.endswith("\n") and len(lines) % 2 == 0
+        assert all(line.startswith('{"index"') for line in lines[::2])
+        assert len(lines) // 2 <= options.get("max_docs", len(lines))
+        assert len(output.encode("utf-8")) <= options.get("max_bytes", len(output) + 1)
+
+
+def test_preprocess_removes_outputs_of_previous_run(iris_data, tmp_path):
+    preprocess.preprocess_data(max_docs=100)
+    output_paths = preprocess.preprocess_data()
+
+    assert sorted(tmp_path.glob("iris_data*")) == output_paths
+
+
+def _edge_measurements() -> list:
+    """
+    :return: floats whose '%f' formatting is easy to get wrong: near ties at 6th decimal place, negative and signed
+        zeros, around 2 ** 52 after scaling by 1e6, and non-finite values
+    """
+    rng = random.Random(1)
+    values = [0.0, -0.0, 1e-7, -1e-7, 5e-7, -5e-7, 1e-300, float("inf"), float("-inf"), float("nan")]
+    for micros in [rng.randrange(10 ** 9) for _ in range(200)] + [0, 1, 999999, 1000000, 2 ** 52 // 10 ** 6]:
+        tie = (micros + 0.5) / 1e6
+        values += [tie, math.nextafter(tie, 0), math.nextafter(tie, math.inf), -tie, micros / 1e6 + 1e-7]
+    for exponent in (51, 52, 53, 60):
+        large = 2 ** exponent / 1e6
+        values += [large, math.nextafter(large, 0), math.nextafter(large, math.inf), -large, large + 0.5e-6]
+    values += [1e15, 1.5e20, 1e308, -1e308]
+    values += [rng.uniform(-1e4, 1e4) for _ in range(500)]
+    return values
+
+
+def _rows(measurements: list) -> list:
+    classes = ("Iris-setosa", "Iris-versicolor", "Iris-virginica")
+    return [
+        ",".join(repr(measurements[(idx * 7 + column) % len(measurements)]) for column in range(4)) +
+        f",{classes[idx % 3]}"
+        for idx in range(len(measurements))
+    ]
+
+
+@pytest.mark.parametrize("repeats", [1, 8], ids=["parsed-floats", "categorical"])
+@pytest.mark.parametrize("start_idx", [0, 999990])
+def test_numpy_engine_matches_python_engine(repeats, start_idx):
+    pytest.importorskip("numpy")
+    # with every row repeated, columns of each block have few distinct values and are formatted once per category
+    rows = [row for row in _rows(_edge_measurements()) for _ in range(repeats)]
+
+    expected = "".join(preprocess.generate_documents(rows, start_idx))
+    blocks = list(preprocess.generate_documents_vectorized(rows, start_idx, block_rows=997))
+
+    assert len(blocks) == -(-len(rows) // 997)
+    assert "".join(blocks) == expected
+
+
+def test_numpy_engine_renders_every_measurement_of_iris_range():
+    pytest.importorskip("numpy")
+    rows = [f"{idx / 100},{-idx / 10},{idx / 1000},{idx},Iris-setosa" for idx in range(10000)]
+
+    assert "".join(preprocess.generate_documents_vectorized(rows)) == "".join(preprocess.generate_documents(rows))
+
+
+@pytest.mark.parametrize("options", [{}, {"workers": 3, "max_docs": 300}], ids=["single", "sharded"])
+def test_preprocess_with_numpy_engine_matches_baseline(iris_data, options):
+    pytest.importorskip("numpy")
+    output_paths = preprocess.preprocess_data(engine="numpy", **options)
+
+    assert "".join(_read_outputs(output_paths)) == _baseline(iris_data)
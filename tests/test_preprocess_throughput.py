@@ -0,0 +1,23 @@
+import config
+from benchmarks.preprocess_throughput import format_result, generate_data, measure
+
+
+def test_measure_reports_result_of_process(tmp_path):
+    generate_data(tmp_path.joinpath(config.DATA_FILE), 1000, "clean")
+
+    result = measure(tmp_path, "python", 1, None, None, poll_seconds=0.1)
+
+    assert result["error"] is None
+    assert result["output_files"] == 1 and result["output_bytes"] > 0
+    assert result["peak_rss_bytes"] > 0
+
+
+def test_measure_records_error_of_process_that_does_not_finish(tmp_path):
+    generate_data(tmp_path.joinpath(config.DATA_FILE), 1000, "clean")
+
+    result = measure(tmp_path, "python", 1, None, None, timeout=0.0, poll_seconds=0.01)
+
+    assert result["error"].startswith("process was killed")
+    assert result["peak_rss_bytes"] is None
+    assert "killed" in format_result({"rows": 1000, "variant": "clean", "engine": "python", "workers": 1,
+                                      "compress_level": None, **result})
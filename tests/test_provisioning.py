@@ -0,0 +1,44 @@
+import pytest
+import config
+from benchmarks.provisioning import run_benchmark
+
+LATENCY = 0.05
+TRANSITION_DELAY = 0.3
+
+
+@pytest.fixture(scope="module", params=["pub-a", "pub-a,pub-c"], ids=["single-az", "multi-az"])
+def results(request):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(config, "SUBNET_NAMES", request.param)
+        # create, create --converge and instance describe
+        return {
+            result.name: result
+            for result in run_benchmark(LATENCY, TRANSITION_DELAY, throttle_rate=0.0, node_count=3, scenario_count=3)
+        }
+
+
+def test_create_calls_and_wall_time(results):
+    create = results["create"]
+
+    assert sum(create.calls.values()) <= 28
+    assert create.calls["RunInstances"] <= 2  # one request per subnet
+    # independent steps overlap, so time spent on API calls is far less than calls made one after another
+    assert create.wall_seconds - create.waiter_sleep_seconds < 12 * LATENCY
+    assert create.waiter_sleep_seconds < TRANSITION_DELAY + 1.0
+    assert create.wall_seconds < 2.0
+
+
+def test_converge_without_missing_resources_only_describes(results):
+    converge = results["create --converge"]
+
+    assert sum(converge.calls.values()) <= 11
+    assert all(operation.startswith("Describe") for operation in converge.calls)
+    assert converge.waiter_sleep_seconds == 0.0
+    assert converge.wall_seconds < 1.0
+
+
+def test_describe_with_saved_state_takes_single_call(results):
+    describe = results["instance describe"]
+
+    assert describe.calls == {"DescribeInstances": 1}
+    assert describe.wall_seconds < 3 * LATENCY
@@ -0,0 +1,56 @@
+import os
+import socketserver
+import stat
+import main
+from aws.cache import get_cache
+from tests.conftest import invoke
+
+
+def test_shell_keeps_cache_between_read_only_commands(fake_ec2_client, capsys):
+    cache = get_cache(fake_ec2_client)
+    assert main._run_shell_command("create admin.kim") == 0
+    assert cache.entries() == {}  # resources changed, so IDs are looked up again by next command
+    capsys.readouterr()
+
+    fake_ec2_client.reset_counters()
+    assert main._run_shell_command("instance describe admin.kim") == 0
+    entries, first_hits = cache.entries(), cache.hits
+    assert entries
+    assert fake_ec2_client.calls == {"DescribeInstances": 1}
+
+    fake_ec2_client.reset_counters()
+    assert main._run_shell_command("instance describe admin.kim") == 0
+    assert cache.entries() == entries
+    assert cache.hits == first_hits  # counters start from zero for each command
+    assert cache.api_calls == 0
+    assert fake_ec2_client.calls == {"DescribeInstances": 1}
+    assert capsys.readouterr().out.count("[node 0] CURRENT STATE  : running") == 2
+
+    assert main._run_shell_command("delete admin.kim") == 0
+    assert cache.entries() == {}
+
+
+def test_shell_reports_exit_code(fake_ec2_client):
+    assert main._run_shell_command("instance restart admin.kim") == 1
+    assert main._run_shell_command("shell") == 1
+    assert main._run_shell_command("") == 0
+
+
+def test_shell_socket_is_created_accessible_only_by_user(fake_ec2_client, monkeypatch, tmp_path):
+    socket_path = tmp_path.joinpath("awselk.sock")
+    modes = []
+    # mode right after bind, before any client could connect
+    monkeypatch.setattr(
+        socketserver.UnixStreamServer, "server_activate", lambda server: modes.append(socket_path.stat().st_mode)
+    )
+    monkeypatch.setattr(socketserver.UnixStreamServer, "serve_forever", lambda server: None)
+    umask = os.umask(0o022)
+    try:
+        invoke("shell", "--socket", str(socket_path))
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(umask)
+
+    assert [stat.S_IMODE(mode) for mode in modes] == [0o600]
+    assert stat.S_ISSOCK(modes[0])
+    assert not socket_path.exists()
@@ -0,0 +1,45 @@
+import config
+import main
+from aws.cache import get_cache
+from tests.conftest import invoke
+
+
+def test_describe_looks_up_fleet_again_when_state_is_stale(fake_ec2_client, monkeypatch, tmp_path):
+    stale_state_path = main.state_path
+    invoke("create", "admin.kim")
+    stale_state = stale_state_path.read_text()
+    invoke("delete", "admin.kim")
+    get_cache(fake_ec2_client).invalidate()  # every command starts with empty cache like a new process
+
+    # fleet is created again from another directory, and old state file is left behind
+    new_dir = tmp_path.joinpath("new")
+    new_dir.mkdir()
+    monkeypatch.setattr(main, "local_dir", new_dir)
+    monkeypatch.setattr(main, "state_path", new_dir.joinpath(config.STATE_FILE))
+    invoke("create", "admin.kim")
+    get_cache(fake_ec2_client).invalidate()
+    stale_state_path.write_text(stale_state)
+    monkeypatch.setattr(main, "state_path", stale_state_path)
+
+    output = invoke("instance", "describe", "admin.kim")
+
+    assert "[node 0] CURRENT STATE  : running" in output
+    assert "has not been created" not in output
+    assert stale_state_path.read_text() != stale_state  # IDs looked up again replace stale ones
+
+
+def test_describe_reports_missing_fleet(fake_ec2_client):
+    output = invoke("instance", "describe", "admin.kim")
+
+    assert "Instance has not been created yet" in output
+
+
+def test_describe_uses_single_call_with_saved_state(fake_ec2_client):
+    invoke("create", "admin.kim")
+    get_cache(fake_ec2_client).invalidate()
+    fake_ec2_client.reset_counters()
+
+    output = invoke("instance", "describe", "admin.kim")
+
+    assert "[node 0] CURRENT STATE  : running" in output
+    assert fake_ec2_client.calls == {"DescribeInstances": 1}
@@ -0,0 +1,138 @@
+import json
+import urllib.parse
+from functools import partial
+import boto3
+import botocore.endpoint
+import pytest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import aws.vpc as vpc_commands
+from aws.executor import Step, run_steps
+from aws.trace import ApiTracer
+from tests.conftest import InstantTime, QuietHandler
+
+VPC_ID = "vpc-0123456789abcdef0"
+SUBNET_ID = "subnet-0123456789abcdef0"
+RESPONSES = {
+    "CreateVpc": f"<vpc><vpcId>{VPC_ID}</vpcId></vpc>",
+    "ModifyVpcAttribute": "<return>true</return>",
+    "CreateSubnet": f"<subnet><subnetId>{SUBNET_ID}</subnetId></subnet>",
+    "ModifySubnetAttribute": "<return>true</return>",
+    "DescribeVpcs": f"<vpcSet><item><vpcId>{VPC_ID}</vpcId></item></vpcSet>",
+}
+
+
+def _ec2_handler(errors: dict):
+    """
+    :param errors: error code and HTTP status of responses to send before successful response of each action(ex.
+        {'DescribeVpcs': [('RequestLimitExceeded', 503)]})
+    :return: handler class of stand-in EC2 API that responds to actions of `RESPONSES`, and records each action
+    """
+
+    class EC2Handler(QuietHandler):
+        actions = []
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+            action = urllib.parse.parse_qs(body)["Action"][0]
+            EC2Handler.actions.append(action)
+            if errors.get(action):
+                code, status = errors[action].pop(0)
+                body = (
+                    f"<Response><Errors><Error><Code>{code}</Code><Message>{code}</Message></Error></Errors>"
+                    "<RequestID>1</RequestID></Response>"
+                )
+                self.send_body(status, body.encode("utf-8"), {"Content-Type": "text/xml"})
+                return
+            body = f"<{action}Response><requestId>1</requestId>{RESPONSES[action]}</{action}Response>"
+            self.send_body(200, body.encode("utf-8"), {"Content-Type": "text/xml"})
+
+    return EC2Handler
+
+
+@pytest.fixture
+def traced_client(stand_in_server, monkeypatch):
+    """
+    Real EC2 client whose endpoint is stand-in EC2 API, with ApiTracer attached
+    :return: function that takes errors of `_ec2_handler`, and returns EC2 client, its tracer and handler class
+    """
+    monkeypatch.setattr(botocore.endpoint, "time", InstantTime())
+
+    def create(errors: dict = None):
+        handler = _ec2_handler(errors or {})
+        ec2_client = boto3.client(
+            "ec2",
+            region_name="ap-northeast-2",
+            endpoint_url=stand_in_server(handler),
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+            config=Config(retries={"mode": "standard", "total_max_attempts": 3}),
+        )
+        tracer = ApiTracer()
+        tracer.attach(ec2_client)
+        return ec2_client, tracer, handler
+
+    return create
+
+
+def test_tracer_attributes_calls_to_caller_and_step(traced_client, tmp_path):
+    ec2_client, tracer, _ = traced_client()
+    steps = [
+        Step("vpc", partial(vpc_commands.create_vpc, ec2_client, "trace_vpc", "172.40.0.0/16")),
+        Step("subnet", partial(
+            vpc_commands.create_subnet, ec2_client, "trace_vpc", "pub-a", "172.40.11.0/24", "ap-northeast-2", "a", True
+        ), ("vpc",)),
+    ]
+
+    run_steps([tracer.wrap_step(step) for step in steps])
+
+    assert [(call["operation"], call["caller"], call["step"]) for call in tracer.calls] == [
+        ("CreateVpc", "vpc.create_vpc", "vpc"),
+        ("ModifyVpcAttribute", "vpc.create_vpc", "vpc"),
+        ("CreateSubnet", "vpc.create_subnet", "subnet"),
+        ("ModifySubnetAttribute", "vpc.create_subnet", "subnet"),
+    ]
+    assert all(call["end"] >= call["start"] and call["error"] is None for call in tracer.calls)
+    assert [step["step"] for step in tracer.steps] == ["vpc", "subnet"]
+    summary = tracer.summary().splitlines()
+    assert any(line.split()[:2] == ["CreateVpc", "1"] for line in summary)
+    assert any(line.split()[:2] == ["subnet", "2"] and line.endswith("vpc.create_subnet") for line in summary)
+
+    trace_path = tmp_path.joinpath("trace.json")
+    tracer.dump_chrome_trace(trace_path)
+    with open(trace_path) as file:
+        events = json.load(file)["traceEvents"]
+    assert sorted((event["cat"], event["name"]) for event in events) == [
+        ("api", "CreateSubnet"), ("api", "CreateVpc"), ("api", "ModifySubnetAttribute"), ("api", "ModifyVpcAttribute"),
+        ("step", "subnet"), ("step", "vpc"),
+    ]
+    assert all(event["ph"] == "X" and event["ts"] >= 0 and event["dur"] >= 0 for event in events)
+    create_vpc = next(event for event in events if event["name"] == "CreateVpc")
+    assert create_vpc["args"] == {
+        "caller": "vpc.create_vpc", "step": "vpc", "retries": 0, "throttled": 0, "error": None
+    }
+
+
+def test_tracer_counts_retries_of_throttled_call(traced_client):
+    ec2_client, tracer, handler = traced_client({"DescribeVpcs": [("RequestLimitExceeded", 503)] * 2})
+
+    assert vpc_commands.fetch_vpc_id(ec2_client, "trace_vpc") == VPC_ID
+
+    assert handler.actions == ["DescribeVpcs"] * 3
+    assert [(call["caller"], call["step"]) for call in tracer.calls] == [("vpc.describe_vpc_id", None)]
+    assert [(call["retries"], call["throttled"], call["error"]) for call in tracer.calls] == [(2, 2, None)]
+    assert tracer.summary().splitlines()[1].split()[-2:] == ["2", "2"]
+
+
+def test_tracer_records_failed_call_and_stops_after_detach(traced_client):
+    ec2_client, tracer, handler = traced_client({"DescribeVpcs": [("RequestLimitExceeded", 503)] * 3})
+
+    with pytest.raises(ClientError, match="RequestLimitExceeded"):
+        vpc_commands.fetch_vpc_id(ec2_client, "trace_vpc")
+    tracer.detach()
+    ec2_client.describe_vpcs()
+
+    assert handler.actions == ["DescribeVpcs"] * 4
+    assert [(call["retries"], call["throttled"], call["error"]) for call in tracer.calls] == [
+        (2, 3, "RequestLimitExceeded")
+    ]